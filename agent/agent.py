@@ -5,6 +5,7 @@ import socket
 import os
 import platform
 import logging
+import random
 from datetime import datetime
 
 # Setup Logging
@@ -22,14 +23,39 @@ if not os.path.exists(data_dir):
     except:
         data_dir = "." # Fallback
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(data_dir, "agent.log")),
-        logging.StreamHandler()
-    ]
-)
+# Logging goes through a queue so the event loop never waits on console/file I/O.
+# agent.log holds JSON lines (rotated at 5 MB); the console gets plain text.
+import logging.handlers
+import queue
+import sys
+import time
+
+# shared/ sits next to agent/ in the source tree; a frozen build bundles it
+if not getattr(sys, 'frozen', False):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.log_handlers import JsonFormatter, SamplingFilter, DroppingQueueHandler
+
+_log_queue = queue.Queue(10000)
+_console = logging.StreamHandler()
+_console.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+_file = logging.handlers.RotatingFileHandler(os.path.join(data_dir, "agent.log"), maxBytes=5 * 1024 * 1024,
+                                             backupCount=3, encoding="utf-8")
+_file.setFormatter(JsonFormatter())
+_queue_handler = DroppingQueueHandler(_log_queue)
+_queue_handler.addFilter(SamplingFilter())
+logging.getLogger().addHandler(_queue_handler)
+logging.getLogger().setLevel(logging.INFO)
+log_listener = logging.handlers.QueueListener(_log_queue, _console, _file)
+log_listener.start()
+
+def apply_log_levels(spec):
+    # "commands=WARNING,index=DEBUG" -> PermitFlowAgent.commands / PermitFlowAgent.index
+    for part in (spec or "").split(","):
+        name, _, level = part.partition("=")
+        name, level = name.strip(), level.strip().upper()
+        if name and isinstance(logging.getLevelName(level), int):
+            logging.getLogger("PermitFlowAgent" if name == "*" else f"PermitFlowAgent.{name}").setLevel(level)
+
 logger = logging.getLogger("PermitFlowAgent")
 
 import sys
@@ -45,19 +71,39 @@ try:
     import env
     SERVER_URL = env.SERVER_URL.rstrip('/') # Remove trailing slash
     AGENT_ID = env.AGENT_ID
+    INDEX_ROOTS = getattr(env, "INDEX_ROOTS", [])
+    INDEX_MODE = getattr(env, "INDEX_MODE", "auto")
+    LOG_LEVELS = getattr(env, "LOG_LEVELS", "")
 except ImportError:
     SERVER_URL = "http://localhost:8000"
     AGENT_ID = socket.gethostname()
+    INDEX_ROOTS = []
+    INDEX_MODE = "auto"
+    LOG_LEVELS = ""
+
+# Per-subsystem levels (commands, index, ...); the env var wins over env.py
+apply_log_levels(os.getenv("PERMITFLOW_LOG_LEVELS", LOG_LEVELS))
+command_logger = logging.getLogger("PermitFlowAgent.commands")
+
+# Path index (see path_index.py). Roots default to the machine's SMB shares;
+# PERMITFLOW_INDEX_ROOTS (os.pathsep-separated) overrides, e.g. for testing on Linux.
+# PERMITFLOW_INDEX=off|poll|watch|auto overrides INDEX_MODE.
+INDEX_ROOTS = [p for p in os.getenv("PERMITFLOW_INDEX_ROOTS", "").split(os.pathsep) if p] or INDEX_ROOTS
+INDEX_MODE = os.getenv("PERMITFLOW_INDEX", INDEX_MODE)
+
+from path_index import PathIndex
+import wire
+path_index = PathIndex(mode=INDEX_MODE)
 
 # Use normalize URL for WebSocket
 clean_server_url = SERVER_URL.replace('http://', '').replace('https://', '')
 ws_protocol = "ws" if SERVER_URL.startswith("http://") else "wss"
 WS_URL = f"{ws_protocol}://{clean_server_url}/api/agents/ws/{AGENT_ID}"
 
-async def send_heartbeat(websocket):
+async def send_heartbeat(websocket, session):
     while True:
         try:
-            await websocket.send(json.dumps({
+            await websocket.send(session["codec"].encode({
                 "type": "heartbeat",
                 "hostname": AGENT_ID,
                 "timestamp": datetime.utcnow().isoformat()
@@ -67,6 +113,26 @@ async def send_heartbeat(websocket):
             logger.error(f"Heartbeat failed: {e}")
             break
 
+def list_shares():
+    # Use powershell to get SMB shares
+    import subprocess
+    cmd = "Get-SmbShare | Where-Object { $_.Special -eq $false } | Select-Object Name, Path | ConvertTo-Json"
+    result = subprocess.run(["powershell", "-Command", cmd], capture_output=True, text=True)
+    if result.returncode == 0 and result.stdout.strip():
+        shares = json.loads(result.stdout)
+        # If there's only one share, ConvertTo-Json might return a single object, not a list
+        if isinstance(shares, dict):
+            shares = [shares]
+        return shares
+    return []
+
+def index_roots():
+    if INDEX_ROOTS:
+        return INDEX_ROOTS
+    if platform.system() != "Windows":
+        return []
+    return [share.get("Path") for share in list_shares()]
+
 async def handle_command(command):
     cmd_type = command.get('type')
     
@@ -75,13 +141,20 @@ async def handle_command(command):
         try:
             # Check if path is absolute or needs base
             # For security, you might want to restrict this to specific drives
-            if not os.path.exists(path):
+            if not path_index.exists(path):
                 os.makedirs(path)
-                logger.info(f"Created directory: {path}")
+                path_index.add(path)
+                command_logger.info("Created directory: %s", path, extra={"path": path, "sample_key": "fs.create"})
                 return {"status": "success", "message": f"Created {path}"}
             else:
-                logger.info(f"Directory exists: {path}")
+                command_logger.info("Directory exists: %s", path, extra={"path": path, "sample_key": "fs.exists"})
                 return {"status": "ignored", "message": "Already exists"}
+        except FileExistsError:
+            # Created outside PermitFlow since the index last caught up
+            if os.path.isdir(path):
+                path_index.add(path)
+            command_logger.info("Directory exists: %s", path, extra={"path": path, "sample_key": "fs.exists"})
+            return {"status": "ignored", "message": "Already exists"}
         except Exception as e:
             logger.error(f"Failed to create folder {path}: {e}")
             return {"status": "error", "error": str(e)}
@@ -89,67 +162,145 @@ async def handle_command(command):
     elif cmd_type == 'check_path':
         path = command.get('path')
         try:
-            exists = os.path.exists(path)
+            exists = path_index.exists(path)
             return {"status": "success", "exists": exists, "path": path}
         except Exception as e:
              return {"status": "error", "error": str(e)}
-            
+
+    elif cmd_type == 'ping':
+        return {"status": "success", "pong": True, "index": path_index.stats()}
+
+    elif cmd_type == 'delete_folders':
+        # Rollback: paths arrive deepest-first. rmdir only removes empty folders,
+        # so anything users put in a provisioned folder is never deleted.
+        results = {}
+        for path in command.get('paths', []):
+            try:
+                if not os.path.isdir(path):
+                    results[path] = {"status": "missing"}
+                    continue
+                os.rmdir(path)
+                path_index.discard(path)
+                command_logger.info("Removed directory: %s", path, extra={"path": path, "sample_key": "fs.delete"})
+                results[path] = {"status": "deleted"}
+            except Exception as e:
+                logger.error(f"Failed to remove folder {path}: {e}")
+                results[path] = {"status": "error", "error": str(e)}
+        return {"status": "success", "results": results}
+
     elif cmd_type == 'list_shares':
         try:
-            # Use powershell to get SMB shares
-            import subprocess
-            cmd = "Get-SmbShare | Where-Object { $_.Special -eq $false } | Select-Object Name, Path | ConvertTo-Json"
-            result = subprocess.run(["powershell", "-Command", cmd], capture_output=True, text=True)
-            if result.returncode == 0 and result.stdout.strip():
-                shares = json.loads(result.stdout)
-                # If there's only one share, ConvertTo-Json might return a single object, not a list
-                if isinstance(shares, dict):
-                    shares = [shares]
-                return {"status": "success", "shares": shares}
-            return {"status": "success", "shares": []}
+            return {"status": "success", "shares": list_shares()}
         except Exception as e:
             logger.error(f"Failed to list shares: {e}")
             return {"status": "error", "error": str(e)}
             
     return {"status": "unknown_command"}
 
+# Reconnect backoff with full jitter: wait a random time up to base * 2^attempt
+# (capped), so agents that lost the master at the same moment don't all come
+# back in one wave.
+RECONNECT_BASE = 1.0
+RECONNECT_MAX = 300.0
+# A connection that stayed up this long counts as healthy and resets the backoff
+STABLE_CONNECTION = 60.0
+
+def retry_after_hint(exc):
+    # The master closes with 1013 "retry-after=N" while it is throttling handshakes
+    close = getattr(exc, "rcvd", None)
+    if close is None or close.code != 1013:
+        return None
+    key, _, value = (close.reason or "").partition("=")
+    if key.strip() != "retry-after":
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+def reconnect_delay(attempt, hint=None):
+    if hint is not None:
+        # The master already gave each agent its own slot; a little jitter avoids ties
+        return min(hint, RECONNECT_MAX) + random.uniform(0, 1.0)
+    return random.uniform(0, min(RECONNECT_MAX, RECONNECT_BASE * 2 ** attempt))
+
+def socket_deflate(websocket):
+    # True when the handshake negotiated permessage-deflate (websockets offers it by default)
+    try:
+        return any(ext.name == "permessage-deflate" for ext in websocket.protocol.extensions)
+    except AttributeError:
+        return False
+
 async def run_agent():
     logger.info(f"Starting Agent {AGENT_ID} connecting to {WS_URL}")
+    path_index.start(index_roots)
     
+    attempt = 0
     while True:
+        hint = None
+        connected_at = None
         try:
             async with websockets.connect(WS_URL) as websocket:
+                connected_at = time.monotonic()
                 logger.info("Connected to Master Server")
                 
-                # Start Heartbeat Task
-                heartbeat_task = asyncio.create_task(send_heartbeat(websocket))
+                # Offer protocol 2 (see wire.py); until the master's welcome arrives,
+                # and for masters that never send one, everything stays JSON text
+                session = {"codec": wire.Codec()}
+                heartbeat_task = None
                 
+                # The hello is inside the try: a busy master can close (1013) before reading it
                 try:
+                    await websocket.send(json.dumps(wire.hello_message(socket_deflate(websocket))))
+                    
+                    # Start Heartbeat Task
+                    heartbeat_task = asyncio.create_task(send_heartbeat(websocket, session))
+                    
                     async for message in websocket:
-                        data = json.loads(message)
-                        logger.info(f"Received command: {data}")
+                        data = wire.decode(message)
+                        if data.get("type") == "welcome":
+                            session["codec"] = wire.from_welcome(data)
+                            logger.info(f"Master speaks protocol {data.get('protocol')}, using {session['codec'].encoding}")
+                            continue
+                        # Payloads can be large (bulk deletes, shares); full payload at DEBUG only
+                        command_logger.info("Received command %s", data.get("type"),
+                                            extra={"command": data.get("type"), "request_id": data.get("request_id"),
+                                                   "sample_key": f"cmd.{data.get('type')}"})
+                        if command_logger.isEnabledFor(logging.DEBUG):
+                            command_logger.debug("Command payload: %s", data)
                         
                         # Execute Command
                         result = await handle_command(data)
                         
                         # Send Response
-                        response = {
-                            "type": "response",
-                            "original_command": data,
-                            "result": result
-                        }
-                        await websocket.send(json.dumps(response))
+                        codec = session["codec"]
+                        await websocket.send(codec.encode(wire.response_message(codec, data, result)))
                         
-                except websockets.exceptions.ConnectionClosed:
-                    logger.warning("Connection closed by server")
+                except websockets.exceptions.ConnectionClosed as e:
+                    hint = retry_after_hint(e)
+                    if hint is None:
+                        logger.warning("Connection closed by server")
                 finally:
-                    heartbeat_task.cancel()
+                    if heartbeat_task is not None:
+                        heartbeat_task.cancel()
                     
+        except websockets.exceptions.ConnectionClosed as e:
+            # Closed outside the message loop (e.g. while the connection was being torn down)
+            hint = retry_after_hint(e)
+            if hint is None:
+                logger.warning("Connection closed by server")
         except Exception as e:
             logger.error(f"Connection error: {e}")
-            
-        logger.info("Reconnecting in 5 seconds...")
-        await asyncio.sleep(5)
+
+        if connected_at is not None and time.monotonic() - connected_at >= STABLE_CONNECTION:
+            attempt = 0
+        delay = reconnect_delay(attempt, hint)
+        attempt = min(attempt + 1, 16)
+        if hint is not None:
+            logger.info(f"Master is busy, reconnecting in {delay:.1f} seconds...")
+        else:
+            logger.info(f"Reconnecting in {delay:.1f} seconds...")
+        await asyncio.sleep(delay)
 
 if __name__ == "__main__":
     if platform.system() != "Windows":
@@ -159,3 +310,5 @@ if __name__ == "__main__":
         asyncio.run(run_agent())
     except KeyboardInterrupt:
         logger.info("Agent stopped by user")
+    finally:
+        log_listener.stop()
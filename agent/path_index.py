@@ -0,0 +1,333 @@
+"""In-memory index of the directories under the shares this agent manages.
+
+check_path / create_folder used to hit the disk for every call, which on big
+NTFS volumes behind SMB filter drivers costs milliseconds each. The index is
+built by a background scan and kept current by filesystem change notifications
+(watchdog, when installed) or, failing that, by polling directory mtimes.
+
+lookup() answers from memory only when it can vouch for the answer: the path is
+under an indexed root, the index is fresh (watcher running, or last poll sweep
+within max_age) and no unreadable directory sits above it. Otherwise it returns
+None and exists() falls back to os.path.exists.
+
+Only directories are tracked; a file with the same name as a folder reads as
+missing here, which create_folder already handles via FileExistsError.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("PermitFlowAgent.index")
+
+# Beyond this many directories per agent the index stops growing and the
+# affected root falls back to disk checks
+MAX_INDEXED_DIRS = 2_000_000
+
+def _key(path: str) -> str:
+    # NTFS is case-insensitive; normcase lower-cases on Windows only
+    return os.path.normcase(os.path.normpath(os.path.abspath(path)))
+
+class PathIndex:
+    def __init__(self, mode: str = "auto", max_age: float = 120.0, poll_interval: float = 30.0,
+                 rescan_interval: float = 3600.0):
+        self.mode = mode # auto (watch if watchdog is installed, else poll), watch, poll, off
+        self.max_age = max_age
+        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval # full rescan to heal missed notifications
+        self.roots = []
+        self._dirs = {} # key -> st_mtime_ns (mtimes only matter for polling)
+        self._children = {} # key -> set of child keys in _dirs, for removing a subtree
+        self._unreadable = set() # keys we could not list; answers below them go to disk
+        self._overflowed = set() # roots that hit MAX_INDEXED_DIRS
+        self._lock = threading.Lock()
+        self._pending = None # events seen while a full scan is running
+        self._observer = None
+        self._stop = threading.Event()
+        self.ready = False
+        self.synced_at = 0.0 # monotonic time the index was last confirmed against disk
+        self.hits = 0
+        self.fallbacks = 0
+
+    # --- lookups ---
+
+    def _root_for(self, key: str):
+        for root in self.roots:
+            if key == root or key.startswith(root.rstrip(os.sep) + os.sep):
+                return root
+        return None
+
+    def _fresh(self) -> bool:
+        if self._observer is not None and self._observer.is_alive():
+            return True
+        return time.monotonic() - self.synced_at <= self.max_age
+
+    def lookup(self, path: str):
+        """True/False from memory, or None when the index can't vouch for the answer."""
+        if not self.ready or not path:
+            return None
+        key = _key(path)
+        root = self._root_for(key)
+        if root is None or root in self._overflowed or not self._fresh():
+            return None
+        if key in self._dirs:
+            return True
+        parent = key
+        while parent != root:
+            parent = os.path.dirname(parent)
+            if parent in self._unreadable:
+                return None
+        return False
+
+    def exists(self, path: str) -> bool:
+        known = self.lookup(path)
+        if known is None:
+            self.fallbacks += 1
+            return os.path.exists(path)
+        self.hits += 1
+        return known
+
+    # --- updates (own writes and change notifications) ---
+
+    def add(self, path: str):
+        """Record a directory (and any missing parents up to its root)."""
+        key = _key(path)
+        root = self._root_for(key)
+        if root is None:
+            return
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("add", key))
+            while key not in self._dirs:
+                self._insert(key, 0)
+                if key == root:
+                    break
+                key = os.path.dirname(key)
+
+    def discard(self, path: str):
+        """Forget a directory and everything below it (cost = size of that subtree)."""
+        key = _key(path)
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("discard", key))
+            if key not in self._dirs:
+                return # a file, or already gone
+            parent = self._children.get(os.path.dirname(key))
+            if parent is not None:
+                parent.discard(key)
+            stack = [key]
+            while stack:
+                current = stack.pop()
+                self._dirs.pop(current, None)
+                stack.extend(self._children.pop(current, ()))
+
+    def _insert(self, key: str, mtime: int):
+        # Caller holds _lock. Roots get linked too, so a root nested in another goes with it.
+        self._dirs[key] = mtime
+        self._children.setdefault(os.path.dirname(key), set()).add(key)
+
+    def _insert_many(self, found: dict, unreadable=()):
+        """Merge the result of a _walk() done outside the lock."""
+        with self._lock:
+            for key, mtime in found.items():
+                if self._pending is not None:
+                    self._pending.append(("add", key))
+                if key not in self._dirs:
+                    self._insert(key, mtime)
+            self._unreadable.update(unreadable)
+
+    # --- scanning ---
+
+    def _walk(self, root_key: str, into: dict, unreadable: set) -> bool:
+        """Add every directory under root_key to into. False if MAX_INDEXED_DIRS was hit."""
+        stack = [root_key]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        try:
+                            if not entry.is_dir(follow_symlinks=False):
+                                continue
+                            into[_key(entry.path)] = entry.stat(follow_symlinks=False).st_mtime_ns
+                        except OSError:
+                            continue
+                        stack.append(entry.path)
+                        if len(into) >= MAX_INDEXED_DIRS:
+                            return False
+            except OSError:
+                unreadable.add(_key(current))
+        return True
+
+    def full_scan(self):
+        started = time.monotonic()
+        with self._lock:
+            self._pending = []
+        dirs, unreadable, overflowed = {}, set(), set()
+        for root in self.roots:
+            try:
+                dirs[root] = os.stat(root).st_mtime_ns
+            except OSError:
+                continue # share path gone; lookups under it fall back to disk
+            if not self._walk(root, dirs, unreadable):
+                overflowed.add(root)
+                logger.warning(f"Index limit ({MAX_INDEXED_DIRS} dirs) reached under {root}; using disk checks there")
+        children = {}
+        for key in dirs:
+            children.setdefault(os.path.dirname(key), set()).add(key)
+        with self._lock:
+            # Replay notifications that raced with the scan onto the new snapshot
+            pending, self._pending = self._pending, None
+            self._dirs, self._children = dirs, children
+            self._unreadable, self._overflowed = unreadable, overflowed
+        for op, key in pending:
+            (self.add if op == "add" else self.discard)(key)
+        self.synced_at = started
+        self.ready = True
+        logger.info(f"Indexed {len(dirs)} directories under {len(self.roots)} roots in {time.monotonic() - started:.1f}s")
+
+    def poll_once(self):
+        """One polling sweep: rescan the children of any directory whose mtime changed."""
+        started = time.monotonic()
+        changed = 0
+        with self._lock:
+            keys = list(self._dirs)
+        # Disk I/O happens outside the lock; each change is applied under it
+        for key in keys:
+            old = self._dirs.get(key)
+            if old is None:
+                continue # removed earlier in this sweep
+            try:
+                mtime = os.stat(key).st_mtime_ns
+            except FileNotFoundError:
+                self.discard(key)
+                changed += 1
+                continue
+            except OSError:
+                continue
+            if mtime == old:
+                continue
+            changed += 1
+            with self._lock:
+                if key not in self._dirs:
+                    continue # discarded meanwhile; don't bring it back
+                self._dirs[key] = mtime
+            try:
+                with os.scandir(key) as it:
+                    children = {_key(e.path) for e in it if e.is_dir(follow_symlinks=False)}
+            except OSError:
+                with self._lock:
+                    self._unreadable.add(key)
+                continue
+            with self._lock:
+                self._unreadable.discard(key)
+            # Removed children show up through their own failing stat in this
+            # sweep; here we only need the new ones (created or renamed in)
+            for new in children:
+                if new in self._dirs:
+                    continue
+                found, unreadable = {new: 0}, set()
+                self._walk(new, found, unreadable)
+                self._insert_many(found, unreadable)
+        # A sweep only vouches for the state at its start
+        self.synced_at = started
+        if changed:
+            logger.debug(f"Index poll: {changed} directories changed")
+
+    # --- change notifications ---
+
+    def _start_watcher(self) -> bool:
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return False
+
+        index = self
+
+        class Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                if event.is_directory:
+                    index.add(event.src_path)
+
+            def on_deleted(self, event):
+                # Windows can't tell whether a deleted entry was a directory
+                index.discard(event.src_path)
+
+            def on_moved(self, event):
+                index.discard(event.src_path)
+                if event.is_directory:
+                    found, unreadable = {_key(event.dest_path): 0}, set()
+                    index._walk(event.dest_path, found, unreadable)
+                    index._insert_many(found, unreadable)
+
+        observer = Observer()
+        handler = Handler()
+        for root in self.roots:
+            if os.path.isdir(root):
+                observer.schedule(handler, root, recursive=True)
+        observer.daemon = True
+        observer.start()
+        self._observer = observer
+        return True
+
+    # --- lifecycle ---
+
+    def _run(self, roots_fn):
+        try:
+            self.roots = sorted({_key(r) for r in roots_fn() if r}, key=len, reverse=True)
+        except Exception as e:
+            logger.error(f"Could not determine index roots: {e}")
+            return
+        if not self.roots:
+            logger.info("No share roots to index; path checks go to disk")
+            return
+
+        watching = False
+        if self.mode in ("auto", "watch"):
+            # Start watching before the scan so nothing created during it is missed
+            watching = self._start_watcher()
+            if not watching and self.mode == "watch":
+                logger.warning("watchdog is not installed; falling back to polling")
+        self.full_scan()
+        logger.info(f"Path index ready ({'change notifications' if watching else 'polling'})")
+
+        last_full = time.monotonic()
+        interval = self.rescan_interval if watching else self.poll_interval
+        while not self._stop.wait(interval):
+            try:
+                if watching and self._observer.is_alive():
+                    self.full_scan()
+                elif time.monotonic() - last_full >= self.rescan_interval:
+                    self.full_scan()
+                    last_full = time.monotonic()
+                else:
+                    self.poll_once()
+            except Exception as e:
+                logger.error(f"Index refresh failed: {e}")
+            if watching and not self._observer.is_alive():
+                logger.warning("Change watcher stopped; switching to polling")
+                watching = False
+                interval = self.poll_interval
+
+    def start(self, roots_fn):
+        """Scan the roots returned by roots_fn() and keep them fresh, in a background thread."""
+        if self.mode == "off":
+            return
+        threading.Thread(target=self._run, args=(roots_fn,), name="path-index", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "mode": "watch" if self._observer is not None and self._observer.is_alive() else ("off" if self.mode == "off" else "poll"),
+            "roots": len(self.roots),
+            "directories": len(self._dirs),
+            "age_seconds": round(time.monotonic() - self.synced_at, 1) if self.ready else None,
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+        }
@@ -1,8 +1,10 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from . import metrics
 import os
+import time
 
 # Determine App Data Directory
 app_name = "PermitFlow"
@@ -15,15 +17,118 @@ data_dir = os.path.join(app_data, app_name)
 if not os.path.exists(data_dir):
     os.makedirs(data_dir, exist_ok=True)
 
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(data_dir, 'master_v3.db')}"
+DB_PATH = os.path.join(data_dir, 'master_v3.db')
+ARCHIVE_DB_PATH = os.path.join(data_dir, 'master_archive.db')
+
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers (dashboard) run while provisioning writes.
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    # Only takes effect on a fresh file; existing DBs are converted by maintenance.
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+@event.listens_for(SessionLocal, "before_commit")
+def _commit_started(session):
+    session.info["commit_started"] = time.perf_counter()
+
+@event.listens_for(SessionLocal, "after_commit")
+def _commit_finished(session):
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        metrics.db_commit_seconds.observe(time.perf_counter() - started)
+
 Base = declarative_base()
 
+# Archived history lives in its own file so the hot DB stays small
+archive_engine = create_engine(
+    f"sqlite:///{ARCHIVE_DB_PATH}", connect_args={"check_same_thread": False}
+)
+ArchiveSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=archive_engine)
+
+ArchiveBase = declarative_base()
+
+# Bump whenever models change so init_db() runs create_all (and any
+# migrations) again. Stored in SQLite's PRAGMA user_version.
+SCHEMA_VERSION = 4
+
+# Rows per UPDATE batch when backfilling new columns
+MIGRATION_BATCH = 50000
+
+def _migrate_folder_hierarchy(conn):
+    """v2: folders.parent_path / name / depth, filled from path."""
+    from .models import split_path
+    columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(folders)")}
+    if not columns:
+        return # fresh file, create_all makes the table
+    for column, sql_type in (("parent_path", "VARCHAR"), ("name", "VARCHAR"), ("depth", "INTEGER")):
+        if column not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE folders ADD COLUMN {column} {sql_type}")
+    last_id = 0
+    while True:
+        rows = conn.exec_driver_sql(
+            "SELECT id, path FROM folders WHERE id > ? ORDER BY id LIMIT ?", (last_id, MIGRATION_BATCH)).fetchall()
+        if not rows:
+            break
+        conn.exec_driver_sql("UPDATE folders SET parent_path = ?, name = ?, depth = ? WHERE id = ?",
+                             [(*split_path(path), row_id) for row_id, path in rows])
+        last_id = rows[-1][0]
+
+def _migrate_created_flags(conn):
+    """v4: folders.created / ad_groups.created.
+
+    Left NULL on existing rows: nothing recorded whether PermitFlow made them or
+    found them already there, so rollback leaves them alone.
+    """
+    for table in ("folders", "ad_groups"):
+        columns = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+        if columns and "created" not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN created BOOLEAN")
+
+# Master DB migrations by the version they bring a file up to
+MIGRATIONS = {
+    2: _migrate_folder_hierarchy,
+    4: _migrate_created_flags,
+}
+
+def _ensure_schema(bind, metadata, migrations=None):
+    with bind.connect() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        if version == SCHEMA_VERSION:
+            return False
+    with bind.begin() as conn:
+        for target in sorted(migrations or {}):
+            if version < target <= SCHEMA_VERSION:
+                migrations[target](conn)
+    metadata.create_all(bind=bind)
+    # create_all skips tables that already exist, indexes included
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+    with bind.connect() as conn:
+        conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    return True
+
+def init_db():
+    """Create tables unless the files are already at SCHEMA_VERSION."""
+    # Import here so models register on the metadata without a module cycle
+    from . import models
+    return {
+        "master": _ensure_schema(engine, Base.metadata, MIGRATIONS),
+        "archive": _ensure_schema(archive_engine, ArchiveBase.metadata),
+    }
+
 def get_db():
     db = SessionLocal()
     try:
@@ -0,0 +1,94 @@
+"""Queue-based logging for the master.
+
+Callers (often on the event loop) only format the message and put the record on
+an in-memory queue; a QueueListener thread does the console/file I/O. Records go
+to stderr as text and to <data_dir>/logs/master.log as JSON lines with
+size-based rotation.
+
+Subsystems log under "permitflow.<name>" (ws, ad, archive, export, health,
+profiling, provision, scan, static, startup). Levels per subsystem come from the log_levels setting or
+PERMITFLOW_LOG_LEVELS, e.g. "ws=WARNING,ad=DEBUG,*=INFO".
+
+High-volume messages pass extra={"sample_key": ...}: at most SAMPLE_BURST of
+them per key are logged per SAMPLE_WINDOW seconds, and the next one that gets
+through reports how many were suppressed. The formatter, sampling filter and
+queue handler live in shared/log_handlers.py, which the agent uses too.
+"""
+from logging.handlers import QueueListener, RotatingFileHandler
+import logging
+import os
+import queue
+
+from shared.log_handlers import JsonFormatter, SamplingFilter, DroppingQueueHandler
+from . import metrics
+
+ROOT_LOGGER = "permitflow"
+
+QUEUE_SIZE = 10000
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+
+def get_logger(subsystem: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER}.{subsystem}")
+
+_listener = None
+
+def setup_logging(log_dir: str = None):
+    """Install the queue handler on the permitflow logger. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+    if log_dir is None:
+        from .database import data_dir
+        log_dir = os.path.join(data_dir, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s"))
+    file_handler = RotatingFileHandler(os.path.join(log_dir, "master.log"), maxBytes=MAX_BYTES,
+                                       backupCount=BACKUP_COUNT, encoding="utf-8")
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.Queue(QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.handlers = [handler]
+    root.propagate = False # uvicorn's own loggers are left alone
+    apply_levels("")
+
+    _listener = QueueListener(log_queue, console, file_handler, respect_handler_level=True)
+    _listener.start()
+
+def apply_levels(spec: str):
+    """Set levels from "ws=WARNING,ad=DEBUG,*=INFO" on top of PERMITFLOW_LOG_LEVELS.
+
+    Subsystems not mentioned go back to inheriting from the root (INFO unless
+    overridden with *=...). Unknown level names are ignored.
+    """
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith(ROOT_LOGGER + "."):
+            logging.getLogger(name).setLevel(logging.NOTSET)
+    logging.getLogger(ROOT_LOGGER).setLevel(logging.INFO)
+    for source in (os.getenv("PERMITFLOW_LOG_LEVELS", ""), spec or ""):
+        for part in source.split(","):
+            name, _, level = part.partition("=")
+            name, level = name.strip(), level.strip().upper()
+            if not name or not isinstance(logging.getLevelName(level), int):
+                continue
+            target = ROOT_LOGGER if name == "*" else f"{ROOT_LOGGER}.{name}"
+            logging.getLogger(target).setLevel(level)
+
+def shutdown_logging():
+    """Flush whatever is still queued (called on server shutdown)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def dropped_records() -> int:
+    return DroppingQueueHandler.dropped
+
+metrics.Gauge("permitflow_log_records_dropped", "Log records dropped because the log queue was full",
+              callback=dropped_records)
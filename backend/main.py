@@ -1,16 +1,55 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
-from .database import engine, Base
-from .routers import settings, agents, execution, history, health, inventory
+from contextlib import asynccontextmanager
+from .database import init_db
+from .routers import settings, agents, execution, history, health, inventory, browse, profiling, export, metrics as metrics_router
+from .metrics import RequestMetricsMiddleware
+from .logging_config import setup_logging, apply_levels, shutdown_logging, get_logger
+from .services import archive_service, static_assets, app_settings
+from .services.health_monitor import monitor
+from .services.agent_registry import registry as agent_registry
+from .services.scan_scheduler import scheduler as scan_scheduler
+from .services.profiler import ProfilingMiddleware
+import asyncio
 import os
 import sys
 
-# Create Tables
-Base.metadata.create_all(bind=engine)
+log = get_logger("startup")
 
-app = FastAPI(title="IT Management Master")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup work lives here rather than at import time so importing the
+    # app (launcher, tests, benchmarks) stays cheap.
+    setup_logging()
+    created = init_db()
+    apply_levels(app_settings.get_setting("log_levels", ""))
+    if any(created.values()):
+        log.info("Schema created/updated: %s", created)
+    os.makedirs(agent_dir, exist_ok=True)
+    os.makedirs(static_dir, exist_ok=True)
+    log.info("Frontend dist: %s (exists: %s)", frontend_dist, frontend is not None)
+    if frontend is not None:
+        # Compressing the bundle happens off the startup path; until it is
+        # done, files are served straight from disk.
+        asyncio.get_running_loop().run_in_executor(None, frontend.build)
+
+    # Background jobs run for the lifetime of the server
+    tasks = [
+        asyncio.create_task(archive_service.maintenance_loop()),
+        asyncio.create_task(monitor.run()),
+        asyncio.create_task(agent_registry.run()),
+        asyncio.create_task(scan_scheduler.run()),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+    # Agents disconnected during shutdown are still pending
+    agent_registry.flush()
+    shutdown_logging()
+
+app = FastAPI(title="IT Management Master", lifespan=lifespan)
 
 # Add CORS Middleware
 app.add_middleware(
@@ -20,6 +59,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(RequestMetricsMiddleware)
 
 # Determine paths
 backend_dir = os.path.dirname(os.path.abspath(__file__))
@@ -36,17 +77,9 @@ else:
     agent_dir = os.path.join(project_root, "agent")
     static_dir = os.path.join(backend_dir, "static")
 
-# Ensure directories exist
-os.makedirs(agent_dir, exist_ok=True)
-os.makedirs(static_dir, exist_ok=True)
-
-# Debug: Print paths
-print(f"[DEBUG] Frontend dist: {frontend_dist} (exists: {os.path.exists(frontend_dist)})")
-print(f"[DEBUG] Agent dir: {agent_dir}")
-
-# Mount downloads
-app.mount("/downloads/agent", StaticFiles(directory=agent_dir), name="agent_downloads")
-app.mount("/static", StaticFiles(directory=static_dir), name="static")
+# Mount downloads (directories are created at startup)
+app.mount("/downloads/agent", StaticFiles(directory=agent_dir, check_dir=False), name="agent_downloads")
+app.mount("/static", StaticFiles(directory=static_dir, check_dir=False), name="static")
 
 # Include API Routers with /api prefix
 app.include_router(settings.router, prefix="/api")
@@ -55,6 +88,10 @@ app.include_router(execution.router, prefix="/api")
 app.include_router(history.router, prefix="/api")
 app.include_router(health.router, prefix="/api")
 app.include_router(inventory.router, prefix="/api")
+app.include_router(browse.router, prefix="/api")
+app.include_router(export.router, prefix="/api")
+app.include_router(metrics_router.router, prefix="/api")
+app.include_router(profiling.router, prefix="/api")
 
 # API health check endpoint
 @app.get("/api/status")
@@ -62,28 +99,38 @@ def api_status():
     return {"status": "Master Server Running", "docs": "/docs"}
 
 # Serve Frontend - MUST be last
+frontend = None
 if os.path.exists(frontend_dist):
-    print(f"[DEBUG] Mounting frontend from: {frontend_dist}")
-    # Mount static assets (js, css, etc)
-    app.mount("/assets", StaticFiles(directory=os.path.join(frontend_dist, "assets")), name="assets")
+    # Whole build is indexed in memory with gzip/brotli variants and ETags,
+    # so navigations and asset loads never touch the disk (built at startup)
+    frontend = static_assets.FrontendManifest(frontend_dist)
     
     # Catch-all route to serve index.html for all other routes (React Router support)
     @app.get("/{full_path:path}")
-    async def serve_frontend(full_path: str):
+    async def serve_frontend(full_path: str, request: Request):
         # Exclude API routes from catch-all to ensure 404s for missing API endpoints
         if full_path.startswith("api"):
              raise HTTPException(status_code=404, detail="API route not found")
+
+        if not frontend.ready:
+            return frontend.serve_from_disk(full_path)
         
-        # Check if the requested file exists in frontend_dist (e.g., logo.png, favicon.ico)
-        file_path = os.path.join(frontend_dist, full_path)
-        if full_path and os.path.isfile(file_path):
-            return FileResponse(file_path)
+        # Requested file exists in frontend_dist (e.g., logo.png, favicon.ico, assets/*)
+        asset = frontend.get(full_path) if full_path else None
+        if asset:
+            return static_assets.serve(asset, request.headers)
+
+        # Large files that were left out of the manifest
+        if full_path in frontend.large_files:
+            return FileResponse(frontend.large_files[full_path])
+
+        # Missing bundles must 404, not silently turn into index.html
+        if full_path.startswith("assets/"):
+            raise HTTPException(status_code=404, detail="Asset not found")
              
         # Otherwise, serve index.html for React Router
-        index_path = os.path.join(frontend_dist, "index.html")
-        return FileResponse(index_path)
+        return static_assets.serve(frontend.index, request.headers)
 else:
-    print(f"[WARNING] Frontend dist not found at {frontend_dist}")
     @app.get("/")
     def read_root():
         return {"status": "Master Server Running", "docs": "/docs", "warning": "Frontend not found"}
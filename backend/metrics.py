@@ -0,0 +1,226 @@
+"""Minimal in-process metrics with Prometheus text exposition.
+
+Recording is a dict lookup, a bisect and a couple of additions under a lock,
+so it is cheap enough to leave on for every request.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+import threading
+import time
+
+# Seconds. Covers sub-ms DB commits up to slow agent/LDAP round trips.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels: dict):
+        return tuple(labels.get(n, "") for n in self.label_names)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+class Gauge(_Metric):
+    """Either set explicitly or backed by a callback evaluated at scrape time.
+
+    A callback returns a number, or a dict of label-tuple -> number.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), callback=None):
+        super().__init__(name, help, labels)
+        self._values = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def collect(self):
+        if self.callback is not None:
+            result = self.callback()
+            items = result.items() if isinstance(result, dict) else [((), result)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {} # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, f'le="{_format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {series[-1]}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = metric.collect()
+            except Exception:
+                continue # A failing callback must not break the scrape
+            lines.extend(metric.header())
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# --- Metrics shared across the backend ---
+
+http_request_seconds = Histogram(
+    "permitflow_http_request_duration_seconds", "HTTP request latency by route template",
+    labels=("method", "route", "status"))
+
+agent_command_seconds = Histogram(
+    "permitflow_agent_command_rtt_seconds", "Round trip of agent commands by command type",
+    labels=("command", "outcome"))
+
+ldap_operation_seconds = Histogram(
+    "permitflow_ldap_operation_duration_seconds", "LDAP operation latency",
+    labels=("operation",))
+
+ldap_errors = Counter(
+    "permitflow_ldap_errors_total", "LDAP operations that failed", labels=("operation",))
+
+db_commit_seconds = Histogram(
+    "permitflow_db_commit_duration_seconds", "SQLAlchemy session commit latency",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+
+scan_rows = Counter(
+    "permitflow_scan_ingest_rows_total", "Share rows ingested from agent scans", labels=("agent",))
+
+scan_ingest_seconds = Histogram(
+    "permitflow_scan_ingest_duration_seconds", "Time spent writing one scan result to the DB")
+
+scan_rows_per_second = Gauge(
+    "permitflow_scan_ingest_rows_per_second", "Ingest rate of the most recent scan", labels=("agent",))
+
+def route_template(scope) -> str:
+    """Full path template of the matched route, as clients call it: /api/browse/{server}.
+
+    A route inside a router included with prefix="/api" only knows its own
+    path (/browse/{server}), so the prefix is taken from the request path: the
+    leading segments the template doesn't account for.
+    """
+    template = getattr(scope.get("route"), "path", None)
+    if not template:
+        return "unmatched"
+    if ":path}" in template:
+        return template # matches any number of segments; only used at the top level
+    path = scope.get("path", "")
+    extra = path.count("/") - template.count("/")
+    if extra > 0:
+        template = "/".join(path.split("/")[:extra + 1]) + template
+    return template
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording request latency per route template (not raw path)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_seconds.observe(time.perf_counter() - start,
+                                         method=scope.get("method", ""), route=route_template(scope),
+                                         status=status["code"])
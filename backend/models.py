@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, Text, Boolean, LargeBinary, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
-from .database import Base
+from .database import Base, ArchiveBase
 
 class Agent(Base):
     __tablename__ = "agents"
@@ -25,13 +25,38 @@ class ActionLog(Base):
     created_folders = relationship("Folder", back_populates="action")
     created_groups = relationship("ADGroup", back_populates="action")
 
+def split_path(path: str):
+    """'D:\\Data\\Finance' -> ('D:\\Data', 'Finance', 2): parent path, name, depth."""
+    trimmed = (path or "").rstrip("\\")
+    parent, _, name = trimmed.rpartition("\\")
+    return parent, name, trimmed.count("\\")
+
+def _path_part(index):
+    # Column default filled from the row's path, so Core bulk inserts get it too
+    def default(context):
+        return split_path(context.get_current_parameters().get("path"))[index]
+    return default
+
 class Folder(Base):
     __tablename__ = "folders"
+    __table_args__ = (
+        # One level of a server's tree, in name order (browse)
+        Index("ix_folders_server_parent_name", "server", "parent_path", "name"),
+        # Subtree = path range under a prefix; depth rides along for aggregates
+        Index("ix_folders_server_path_depth", "server", "path", "depth"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     path = Column(String, index=True)
     server = Column(String) # Refers to Agent Hostname
     action_id = Column(Integer, ForeignKey("actions.id"))
+    # Materialized from path (see split_path); "" parent = top level
+    parent_path = Column(String, default=_path_part(0))
+    name = Column(String, default=_path_part(1))
+    depth = Column(Integer, default=_path_part(2))
+    # The agent reported creating it for action_id; only these are rolled back
+    # (False: already there, or no answer; NULL: recorded before v4)
+    created = Column(Boolean, default=False)
     
     action = relationship("ActionLog", back_populates="created_folders")
 
@@ -42,6 +67,8 @@ class ADGroup(Base):
     name = Column(String, unique=True, index=True)
     type = Column(String) # Read, Modify
     action_id = Column(Integer, ForeignKey("actions.id"))
+    # AD accepted the create for action_id; only these are rolled back (see Folder.created)
+    created = Column(Boolean, default=False)
 
     action = relationship("ActionLog", back_populates="created_groups")
 
@@ -51,3 +78,45 @@ class Setting(Base):
     key = Column(String, primary_key=True, index=True)
     value = Column(String)
     description = Column(String, nullable=True)
+
+class RollbackStep(Base):
+    __tablename__ = "rollback_steps"
+
+    id = Column(Integer, primary_key=True, index=True)
+    action_id = Column(Integer, ForeignKey("actions.id"), index=True)
+    seq = Column(Integer) # Execution order (children before parents)
+    kind = Column(String) # folder, group
+    target = Column(String) # Folder path or group name
+    server = Column(String, nullable=True) # Agent for folder steps
+    status = Column(String, default="pending") # pending, done, failed
+    error = Column(Text, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class ScanSchedule(Base):
+    __tablename__ = "scan_schedules"
+
+    agent_id = Column(String, primary_key=True)
+    enabled = Column(Boolean, default=True)
+    interval_hours = Column(Float, nullable=True) # None = scan_interval_hours setting
+    window = Column(String, nullable=True) # "22:00-06:00,12:00-13:00" local time, "any", None = scan_window setting
+    first_seen = Column(DateTime, default=datetime.utcnow)
+    last_scan_at = Column(DateTime, nullable=True) # Last successful scan, manual or scheduled
+    last_attempt_at = Column(DateTime, nullable=True)
+    last_status = Column(String, nullable=True) # success, failed
+    last_error = Column(Text, nullable=True)
+    failures = Column(Integer, default=0) # Consecutive failed attempts
+    share_count = Column(Integer, nullable=True)
+
+class ArchivedAction(ArchiveBase):
+    __tablename__ = "archived_actions"
+
+    id = Column(Integer, primary_key=True) # Same id the action had in the hot DB
+    timestamp = Column(DateTime, index=True)
+    action_type = Column(String)
+    description = Column(String)
+    status = Column(String)
+    servers = Column(String) # Comma separated, for filtering without decompressing
+    folder_count = Column(Integer, default=0)
+    group_count = Column(Integer, default=0)
+    payload = Column(LargeBinary) # zlib-compressed JSON of folders, groups and rollback steps
+    archived_at = Column(DateTime, default=datetime.utcnow)
@@ -1,12 +1,18 @@
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
 from sqlalchemy.orm import Session
 from ..database import get_db
-from ..models import Agent
+from ..models import Agent, ScanSchedule
 from ..schemas import AgentBase
-from ..websocket_manager import manager
-from datetime import datetime
-from typing import List
+from ..websocket_manager import manager, handshake_limiter, ws_bytes
+from .. import wire
+from ..services.agent_registry import registry as agent_registry
+from ..services.scan_scheduler import scheduler as scan_scheduler, scan_agent, parse_window
+from ..services.result_cache import cache as result_cache
+from ..logging_config import get_logger
+from pydantic import BaseModel, TypeAdapter
+from typing import List, Optional
 import json
+import logging
 
 router = APIRouter(
     prefix="/agents",
@@ -14,100 +20,124 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+log = get_logger("ws")
+
+_agent_list = TypeAdapter(List[AgentBase])
+
 @router.get("", response_model=List[AgentBase])
 @router.get("/", response_model=List[AgentBase])
 def get_agents(db: Session = Depends(get_db)):
-    return db.query(Agent).all()
+    # AgentRegistry._write bumps "agents" after each heartbeat flush, which invalidates this entry
+    return result_cache.json_response("agents", {}, ("agents",), lambda: _agent_list.dump_json(
+        _agent_list.validate_python(db.query(Agent).all(), from_attributes=True)))
+
+@router.get("/schedule")
+def get_scan_schedule():
+    """Scheduled scan state per agent (see services/scan_scheduler.py)."""
+    return scan_scheduler.status()
+
+class ScheduleUpdate(BaseModel):
+    # Fields left out keep their value; null falls back to the global setting
+    enabled: Optional[bool] = None
+    interval_hours: Optional[float] = None
+    window: Optional[str] = None
+
+@router.put("/{agent_id}/schedule")
+def update_scan_schedule(agent_id: str, update: ScheduleUpdate, db: Session = Depends(get_db)):
+    if db.get(Agent, agent_id) is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    values = update.model_dump(exclude_unset=True)
+    if values.get("interval_hours") is not None and values["interval_hours"] <= 0:
+        raise HTTPException(status_code=400, detail="interval_hours must be positive (null = use scan_interval_hours)")
+    if values.get("window"):
+        try:
+            parse_window(values["window"])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if values.get("enabled") is None:
+        values.pop("enabled", None)
+    schedule = db.get(ScanSchedule, agent_id)
+    if schedule is None:
+        schedule = ScanSchedule(agent_id=agent_id)
+        db.add(schedule)
+    for key, value in values.items():
+        setattr(schedule, key, value)
+    db.commit()
+    return {"status": "success", "agent_id": agent_id, **values}
 
 @router.post("/{agent_id}/scan")
-async def scan_agent_shares(agent_id: str, db: Session = Depends(get_db)):
-    import uuid
-    import asyncio
-    
+async def scan_agent_shares(agent_id: str):
     if agent_id not in manager.active_connections:
         return {"status": "failed", "error": "Agent not connected"}
-        
-    req_id = str(uuid.uuid4())
-    future = manager.create_request(req_id)
-    
-    await manager.send_personal_message({
-        "type": "list_shares",
-        "request_id": req_id
-    }, agent_id)
-    
-    try:
-        response = await asyncio.wait_for(future, timeout=10.0)
-        result = response.get("result", {})
-        if result.get("status") == "success":
-            shares = result.get("shares", [])
-            
-            # Save to Database
-            from ..models import Folder
-            for share in shares:
-                name = share.get("Name")
-                path = share.get("Path")
-                
-                # Check if already exists
-                exists = db.query(Folder).filter(Folder.server == agent_id, Folder.path == path).first()
-                if not exists:
-                    folder = Folder(
-                        path=path,
-                        server=agent_id,
-                        # We don't have an action_id for discovered folders
-                    )
-                    db.add(folder)
-            
-            db.commit()
-            return {"status": "success", "count": len(shares), "shares": shares}
-        return {"status": "failed", "error": result.get("error", "Unknown error")}
-    except asyncio.TimeoutError:
-        return {"status": "failed", "error": "Timeout waiting for agent"}
-    except Exception as e:
-        return {"status": "failed", "error": str(e)}
+    # Recorded in scan_schedules too, so the scheduler skips agents scanned by hand
+    return await scan_agent(agent_id, timeout=10.0)
 
 @router.websocket("/ws/{agent_id}")
-async def websocket_endpoint(websocket: WebSocket, agent_id: str, db: Session = Depends(get_db)):
-    print(f"[WS] Connection attempt from agent: {agent_id}")
+async def websocket_endpoint(websocket: WebSocket, agent_id: str):
+    retry_after = handshake_limiter.admit()
+    if retry_after is not None:
+        # Accept only to deliver the close reason (1013 = try again later); throttled
+        # agents cost no DB work. The agent waits retry_after plus jitter.
+        await websocket.accept()
+        await websocket.close(code=1013, reason=f"retry-after={retry_after:.1f}")
+        log.info("Throttled agent %s, retry after %.1fs", agent_id, retry_after,
+                 extra={"agent": agent_id, "sample_key": "ws.throttled"})
+        return
+
+    log.info("Connection attempt from agent: %s", agent_id, extra={"agent": agent_id, "sample_key": "ws.connect"})
     await manager.connect(agent_id, websocket)
     
-    # Update Agent Status in DB
-    agent_record = db.query(Agent).filter(Agent.id == agent_id).first()
-    if not agent_record:
-        agent_record = Agent(id=agent_id, hostname=agent_id, status="online", last_heartbeat=datetime.utcnow())
-        db.add(agent_record)
-    else:
-        agent_record.status = "online"
-        agent_record.last_heartbeat = datetime.utcnow()
-    db.commit()
+    # Update Agent Status in DB (batched, see services/agent_registry.py)
+    agent_registry.mark_online(agent_id)
 
     try:
         while True:
-            # Receive Heartbeat or Responses from Agent
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            # Receive Heartbeat or Responses from Agent (text = JSON, binary = see wire.py)
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            if frame.get("text") is not None:
+                data, encoding = frame["text"], "json"
+            else:
+                data, encoding = frame["bytes"], getattr(manager.codecs.get(agent_id), "encoding", "json")
+            ws_bytes.inc(len(data), direction="in", encoding=encoding)
+            message = wire.decode(data)
             
-            if message.get("type") == "heartbeat":
+            if message.get("type") == "hello":
+                # Protocol 2 agent: agree on an encoding. The welcome goes out as JSON
+                # text; everything after it uses the negotiated codec.
+                codec, welcome = wire.negotiate(message)
+                text = json.dumps(welcome)
+                await websocket.send_text(text)
+                ws_bytes.inc(len(text), direction="out", encoding="json")
+                manager.set_codec(agent_id, codec)
+                log.info("Agent %s speaks protocol %s, using %s", agent_id, message.get("protocol"), codec.encoding,
+                         extra={"agent": agent_id, "encoding": codec.encoding, "sample_key": "ws.hello"})
+
+            elif message.get("type") == "heartbeat":
                 # Update heartbeat
-                agent_record = db.query(Agent).filter(Agent.id == agent_id).first()
-                if agent_record:
-                    agent_record.last_heartbeat = datetime.utcnow()
-                    agent_record.status = "online"
-                    db.commit()
+                agent_registry.heartbeat(agent_id)
             
             elif message.get("type") == "response":
-                # Handle Command Response (Resolve Futures)
-                original = message.get("original_command", {})
-                req_id = original.get("request_id")
+                # Handle Command Response (Resolve Futures). Protocol 2 responses carry
+                # only the request_id; protocol 1 echoes the whole original_command.
+                req_id = message.get("request_id") or message.get("original_command", {}).get("request_id")
                 if req_id:
                     manager.resolve_request(req_id, message)
             
-            print(f"Received from {agent_id}: {message}")
+            # Type + request id at INFO (sampled: heartbeats/responses arrive in bursts),
+            # the full payload only at DEBUG
+            msg_type = message.get("type")
+            log.info("Received %s from %s", msg_type, agent_id,
+                     extra={"agent": agent_id, "message_type": msg_type,
+                            "request_id": message.get("request_id") or message.get("original_command", {}).get("request_id"),
+                            "sample_key": f"ws.{msg_type}"})
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Payload from %s: %s", agent_id, message, extra={"agent": agent_id})
 
     except WebSocketDisconnect:
-        manager.disconnect(agent_id)
-        # Mark offline
-        agent_record = db.query(Agent).filter(Agent.id == agent_id).first()
-        if agent_record:
-            # Only mark offline if it was this specific connection (simple check)
-            agent_record.status = "offline"
-            db.commit()
+        pass
+    finally:
+        # Mark offline, unless the agent already reconnected on a newer socket
+        if manager.disconnect(agent_id, websocket):
+            agent_registry.mark_offline(agent_id)
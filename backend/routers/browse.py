@@ -0,0 +1,96 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy import select, func, or_, exists, tuple_
+from sqlalchemy.orm import Session, aliased
+from typing import Optional
+from ..database import get_db
+from ..models import Folder, split_path
+
+router = APIRouter(
+    prefix="/browse",
+    tags=["inventory"],
+)
+
+# Lazy, one level at a time. Everything here is an index range on
+# (server, parent_path, name) or (server, path, depth); nothing scans paths
+# with LIKE or splits them in Python.
+#
+# A subtree is the path range (P + "\", P + "]"): "]" is the character right
+# after "\", so the range holds exactly the paths starting with P + "\".
+
+MAX_PAGE = 1000
+
+def _level(server: str, parent_filter, order_by, after_filter, limit: int, aggregates: bool, db: Session):
+    child = aliased(Folder)
+    columns = [Folder.id, Folder.name, Folder.path, Folder.depth, Folder.action_id,
+               select(func.count()).where(child.server == Folder.server, child.parent_path == Folder.path)
+               .scalar_subquery().label("child_count")]
+    if aggregates:
+        in_subtree = (child.server == Folder.server, child.path > Folder.path + "\\", child.path < Folder.path + "]")
+        columns.append(select(func.count()).where(*in_subtree).scalar_subquery().label("descendants"))
+        columns.append(select(func.max(child.depth)).where(*in_subtree).scalar_subquery().label("max_depth"))
+    order_by = order_by if isinstance(order_by, tuple) else (order_by,)
+    stmt = select(*columns).where(Folder.server == server, parent_filter).order_by(*order_by).limit(limit + 1)
+    if after_filter is not None:
+        stmt = stmt.where(after_filter)
+    rows = db.execute(stmt).all()
+
+    items = []
+    for row in rows[:limit]:
+        item = {
+            "id": row.id,
+            "name": row.name,
+            "path": row.path,
+            "depth": row.depth,
+            "action_id": row.action_id,
+            "child_count": row.child_count,
+        }
+        if aggregates:
+            item["descendants"] = row.descendants
+            # Levels below this folder (0 = leaf)
+            item["subtree_depth"] = row.max_depth - row.depth if row.max_depth is not None else 0
+        items.append(item)
+    return items, len(rows) > limit
+
+@router.get("")
+@router.get("/")
+def list_servers(db: Session = Depends(get_db)):
+    rows = db.execute(select(Folder.server, func.count()).group_by(Folder.server).order_by(Folder.server)).all()
+    return [{"server": server, "folders": count} for server, count in rows]
+
+@router.get("/{server}")
+def browse(server: str, path: Optional[str] = None, after: Optional[str] = None, limit: int = 200,
+           aggregates: bool = True, db: Session = Depends(get_db)):
+    """Children of path on server, or the server's top-level folders when path is omitted.
+
+    Top level = folders whose parent isn't in inventory (provisioned roots,
+    scanned shares like D:\\Shares\\Finance). Pages are limit long; pass the
+    returned next_after as after for the next one.
+    """
+    limit = max(1, min(limit, MAX_PAGE))
+    if path:
+        parent = path.rstrip("\\")
+        items, more = _level(server, Folder.parent_path == parent, Folder.name,
+                             Folder.name > after if after else None, limit, aggregates, db)
+        cursor = items[-1]["name"] if more else None
+    else:
+        # Distinct parent paths, one index seek each (a loose index scan: every step
+        # asks for the smallest parent_path above the previous one), keeping the
+        # ones with no folder row of their own
+        step = aliased(Folder)
+        parents = select(func.min(Folder.parent_path).label("p")).where(Folder.server == server).cte(
+            "parents", recursive=True)
+        next_parent = select(func.min(step.parent_path)).where(step.server == server, step.parent_path > parents.c.p)
+        parents = parents.union_all(select(next_parent.scalar_subquery()).where(parents.c.p.isnot(None)))
+        known = aliased(Folder)
+        orphans = select(parents.c.p).where(parents.c.p.isnot(None), or_(
+            parents.c.p == "",
+            ~exists().where(known.server == server, known.path == parents.c.p)))
+        # (parent_path, name) order comes straight off the index; after is the last path seen
+        after_filter = None
+        if after:
+            after_parent, after_name, _ = split_path(after)
+            after_filter = tuple_(Folder.parent_path, Folder.name) > tuple_(after_parent, after_name)
+        items, more = _level(server, Folder.parent_path.in_(orphans), (Folder.parent_path, Folder.name),
+                             after_filter, limit, aggregates, db)
+        cursor = items[-1]["path"] if more else None
+    return {"server": server, "path": path, "items": items, "next_after": cursor}
@@ -1,14 +1,24 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from ..database import get_db
-from ..models import Folder, ADGroup
 from ..services.ad_service import ADService
+from ..services import provision_service
+from ..services.provision_service import compile_tree
+from ..services.tree_parser import parse_stream, TreeParseError
+from ..services.singleflight import SingleFlight
 from ..websocket_manager import manager
 from pydantic import BaseModel
-from typing import List
+from typing import List, Literal, Optional
+import asyncio
+import hashlib
 
 router = APIRouter(tags=["execution"])
 
+# Concurrent identical calls share one LDAP search / agent round trip
+_user_checks = SingleFlight("ad_check_user")
+_path_checks = SingleFlight("agent_check_path")
+_validations = SingleFlight("validate_structure")
+
 class Node(BaseModel):
     name: str
     type: str # 'server' or 'folder'
@@ -17,108 +27,77 @@ class Node(BaseModel):
 
 class ExecutionRequest(BaseModel):
     tree: List[Node]
+    # full: send every folder and group; diff: skip what the folders / ad_groups
+    # inventory already has (earlier provisioning or share scans)
+    mode: Literal["full", "diff"] = "full"
+
+async def check_path(agent_id: str, path: str, timeout: float = 2.0):
+    # Agents are Windows boxes, so paths differing only in case are the same check
+    return await _path_checks.do(
+        (agent_id, path.lower()),
+        lambda: manager.send_command(agent_id, {"type": "check_path", "path": path}, timeout=timeout))
 
 @router.post("/execute/validate")
-async def validate_structure(req: ExecutionRequest):
+async def validate_structure(req: ExecutionRequest, db: Session = Depends(get_db)):
+    # Re-submitting the same tree while it is still being checked joins the running validation
+    key = hashlib.sha256(req.model_dump_json().encode()).hexdigest()
+    return await _validate_plan(db, compile_tree(req.tree), req.mode, key)
+
+async def _validate_plan(db: Session, plan, mode: str, key: str):
+    skipped = []
+    if mode == "diff":
+        # Folders already in inventory are expected to exist; only check the rest
+        plan, skipped = provision_service.diff_plan(db, plan)
+    result = await _validations.do(key, lambda: _validate(plan))
+    if mode == "diff":
+        result = {**result, "skipped": _skipped_report(skipped)}
+    return result
+
+async def _validate(plan):
     conflicts = []
-    
-    # Track server context
-    current_server_name = "SERVER01" # Default
-    # Attempt to find a connected agent to use as default if SERVER01 is not found?
-    # For now, just keep simple.
-
-    import asyncio
-    import uuid
-
-    async def check_node(node, parent_path="", server_context="SERVER01"):
-        nonlocal conflicts
-        current_server = server_context
-        
-        # Update server context if this node is a server
-        if node.type == 'server':
-            current_server = node.name
-        
-        full_path = f"{parent_path}\\{node.name}" if parent_path and node.type != 'server' else node.name
-        # If server node, path reset? No, server node name is not part of path usually.
-        # [FS01 | D:\Data] -> Name "FS01", but path? 
-        # SmartInput parser: Name = "FS01". 
-        # Actually user types "[FS01 | D:\Data]". 
-        # Parser splits to Name="FS01". 
-        # Children are under it.
-        # If server node, we don't check path existence of the server object itself.
-        
-        if node.type == 'folder':
-            # Send Check command
-            req_id = str(uuid.uuid4())
-            msg = {
-                "type": "check_path",
-                "path": full_path,
-                "request_id": req_id
-            }
-            
-            # Send to specific agent
-            # We need to find the agent ID that matches 'current_server'
-            # Or broadcast? No, personal message.
-            
-            # For this test, if server is "SERVER01" and we have only 1 agent, maybe use it?
-            # Let's try to find exact match first.
-            target_agent = current_server
-            
-            # Fallback: if 'SERVER_TEST' (from test) is used but agent is 'DESKTOP...', we have a mismatch.
-            # For testing reliability, let's broadcast check to ALL agents? 
-            # No, that's messy.
-            # Let's just try to send to 'target_agent'. 
-            # If not connected, we can't check -> Warning: "Agent Offline"
-            
-            if target_agent in manager.active_connections:
-                future = manager.create_request(req_id)
-                await manager.send_personal_message(msg, target_agent)
-                try:
-                    # Wait 2 seconds max
-                    response = await asyncio.wait_for(future, timeout=2.0)
-                    result = response.get("result", {})
-                    if result.get("status") == "success" and result.get("exists"):
-                        conflicts.append(f"Folder already exists on {target_agent}: {full_path}")
-                except asyncio.TimeoutError:
-                    conflicts.append(f"Timeout checking {full_path} on {target_agent}")
-            else:
-                 # Try to find ANY agent if it's the "SERVER" default
-                 # Or just skip/warn
-                 pass
-                 
-        # Recurse
-        for child in node.children:
-             # If node was server, Child's parent path is... empty? Or root?
-             # If node is server, usually it represents the machine, not a folder.
-             # So child path starts fresh or based on user input?
-             # SmartInput parser logic:
-             # structure:
-             # [FS01]
-             #   Share1
-             #     Subfolder
-             # Path of Share1 is "Share1".
-             # Path of Subfolder is "Share1\Subfolder".
-             next_parent = full_path if node.type == 'folder' else "" 
-             await check_node(child, next_parent, current_server)
-
-    for node in req.tree:
-        await check_node(node)
+    for step in plan:
+        if step.kind != "folder":
+            continue
+        # If the agent isn't connected we can't check; skip it
+        if step.server in manager.active_connections:
+            try:
+                # Wait 2 seconds max
+                response = await check_path(step.server, step.target, timeout=2.0)
+                result = (response or {}).get("result", {})
+                if result.get("status") == "success" and result.get("exists"):
+                    conflicts.append(f"Folder already exists on {step.server}: {step.target}")
+            except asyncio.TimeoutError:
+                conflicts.append(f"Timeout checking {step.target} on {step.server}")
         
     return {"status": "success", "conflicts": conflicts}
 
+def _skipped_report(skipped):
+    return {
+        "folders": [{"server": s.server, "path": s.target} for s in skipped if s.kind == "folder"],
+        "groups": [s.target for s in skipped if s.kind == "group"],
+    }
+
 @router.post("/execute")
 async def execute_structure(req: ExecutionRequest, db: Session = Depends(get_db)):
-    # Initialize Services
-    ad_service = ADService(db)
-    
+    return await _execute_plan(db, compile_tree(req.tree), req.mode, len(req.tree))
+
+async def _execute_plan(db: Session, plan, mode: str, roots: int):
     try:
+        skipped = []
+        if mode == "diff":
+            # Only send what inventory doesn't already have
+            plan, skipped = provision_service.diff_plan(db, plan)
+
         # 1. Create Action Log
         from ..models import ActionLog
         from datetime import datetime
         
+        description = f"Provisioned {roots} root items"
+        if skipped:
+            description += f" ({len(skipped)} already present, skipped)"
         action = ActionLog(
             action_type="Provision",
-            description=f"Provisioned {len(req.tree)} root items",
+            description=description,
             status="Running",
             timestamp=datetime.utcnow()
         )
@@ -126,58 +105,19 @@ async def execute_structure(req: ExecutionRequest, db: Session = Depends(get_db)
         db.commit() # Commit to get ID
         db.refresh(action)
 
-        for node in req.tree:
-            # Root level, server context defaults
-            default_server = "SERVER01"
-            
-            async def process_node(current_node, parent_path="", server_context="SERVER01"):
-                current_server = server_context
-                if current_node.type == 'server':
-                    current_server = current_node.name
-                    # Server node itself implies root of structure, so parent_path resets
-                    next_parent = ""
-                else:
-                    next_parent = f"{parent_path}\\{current_node.name}" if parent_path else current_node.name
-
-                if current_node.type == 'folder':
-                    # Use accumulated path
-                    full_path = next_parent
-                    
-                    folder = Folder(path=full_path, server=current_server, action_id=action.id)
-                    db.add(folder)
-                    
-                    # Agent Command - Target Specific Server!
-                    # For generic broadcast (legacy):
-                    # await manager.broadcast(...) 
-                    # For Targeted:
-                    cmd = {
-                        "type": "create_folder",
-                        "path": full_path,
-                        "server": current_server
-                    }
-                    if current_server in manager.active_connections:
-                        await manager.send_personal_message(cmd, current_server)
-                    else:
-                        # Fallback broadcast or log warning
-                        # For now, keep broadcast to ensure it works even if name mismatch
-                        await manager.broadcast(cmd)
-
-                # Groups
-                for group_name in current_node.groups:
-                    ad_service.create_group(group_name, description=f"Group for {current_node.name}")
-                    grp = ADGroup(name=group_name, type="RW", action_id=action.id)
-                    db.add(grp)
-                
-                # Children
-                for child in current_node.children:
-                    await process_node(child, next_parent, current_server)
-
-            await process_node(node, "", default_server)
+        await provision_service.run_plan(db, action, plan)
                 
         action.status = "success"
         db.commit()
         
-        return {"status": "success", "id": action.id, "message": "Structure executed"}
+        response = {"status": "success", "id": action.id, "message": "Structure executed"}
+        if mode == "diff":
+            response["applied"] = {
+                "folders": sum(1 for s in plan if s.kind == "folder"),
+                "groups": sum(1 for s in plan if s.kind == "group"),
+            }
+            response["skipped"] = _skipped_report(skipped)
+        return response
     except Exception as e:
         db.rollback()
         # If action was created, mark failed
@@ -187,6 +127,37 @@ async def execute_structure(req: ExecutionRequest, db: Session = Depends(get_db)
              db.commit()
         return {"status": "failed", "error": str(e)}
 
+# Bulk submissions: the same tree as indented text or NDJSON rows, parsed line by
+# line as the body arrives (see services/tree_parser.py). Meant for large templates.
+
+BULK_ROW_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-lines")
+
+async def _parse_bulk(request: Request, format: Optional[str]):
+    fmt = format
+    if fmt is None:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        fmt = "rows" if content_type in BULK_ROW_TYPES else "text"
+    try:
+        parser, digest = await parse_stream(request.stream(), fmt)
+    except TreeParseError as e:
+        raise HTTPException(status_code=400, detail={"error": e.message, "line": e.line, "column": e.column})
+    if not parser.plan:
+        raise HTTPException(status_code=400, detail={"error": "No folders or groups in request", "line": parser.line_no,
+                                                     "column": 1})
+    return parser, digest
+
+@router.post("/execute/bulk/validate")
+async def validate_bulk(request: Request, format: Optional[Literal["text", "rows"]] = None,
+                        mode: Literal["full", "diff"] = "full", db: Session = Depends(get_db)):
+    parser, digest = await _parse_bulk(request, format)
+    return await _validate_plan(db, parser.plan, mode, f"bulk:{parser.fmt}:{mode}:{digest}")
+
+@router.post("/execute/bulk")
+async def execute_bulk(request: Request, format: Optional[Literal["text", "rows"]] = None,
+                       mode: Literal["full", "diff"] = "full", db: Session = Depends(get_db)):
+    parser, _ = await _parse_bulk(request, format)
+    return await _execute_plan(db, parser.plan, mode, parser.roots)
+
 @router.post("/groups/{group_name}/members")
 def add_member_to_group(group_name: str, member: str, db: Session = Depends(get_db)):
     ad_service = ADService(db)
@@ -198,9 +169,12 @@ def add_member_to_group(group_name: str, member: str, db: Session = Depends(get_
         return {"status": "failed", "message": "Could not add member (check AD logs)"}
 
 @router.get("/ad/check-user")
-def check_user(username: str, db: Session = Depends(get_db)):
+async def check_user(username: str, db: Session = Depends(get_db)):
     ad_service = ADService(db)
-    result = ad_service.check_user_exists(username)
+    # sAMAccountName is case-insensitive; operators typing the same name share one search
+    result = await _user_checks.do(
+        ("check_user", username.lower()),
+        lambda: asyncio.to_thread(ad_service.check_user_exists, username))
     if isinstance(result, bool):
         # Mock Response
         return {"exists": result, "displayName": "Mock User" if result else None}
@@ -0,0 +1,196 @@
+"""Audit exports of inventory and history.
+
+Rows are read with server-side batching (yield_per) on a session of their own
+and written out as they arrive, so memory stays flat and the first bytes go
+out right away. The generators are synchronous: Starlette iterates them in
+its threadpool, so a long export never blocks the event loop.
+
+    GET /api/export/folders?format=csv&server=FS01&path_prefix=D:\\Data
+    GET /api/export/groups?format=ndjson&since=2024-01-01
+    GET /api/export/history?format=csv&gzip=true
+
+server matches exact server names (FS1 never includes FS10), archived actions
+included. since / until filter on when the row's action ran; for folders and groups
+that means rows without an action (discovered by scans, or whose action was
+archived) are left out when a date filter is given.
+"""
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, func
+from datetime import datetime
+from typing import Literal, Optional
+import csv
+import io
+import json
+import time
+import zlib
+
+from ..database import SessionLocal
+from ..models import ActionLog, Folder, ADGroup
+from ..services import archive_service
+from .. import metrics
+from ..logging_config import get_logger
+
+log = get_logger("export")
+
+router = APIRouter(
+    prefix="/export",
+    tags=["export"],
+)
+
+# Rows fetched per round trip to SQLite
+BATCH_SIZE = 1000
+
+# Bytes buffered before a chunk is handed to the response
+CHUNK_BYTES = 64 * 1024
+
+exported_rows = metrics.Counter("permitflow_export_rows_total", "Rows written by audit exports", labels=("dataset",))
+
+FOLDER_COLUMNS = ("id", "server", "path", "action_id", "provisioned_at")
+GROUP_COLUMNS = ("id", "name", "type", "action_id", "provisioned_at")
+HISTORY_COLUMNS = ("id", "timestamp", "action_type", "description", "status", "servers",
+                   "folder_count", "group_count", "archived")
+
+def _in_range(column, since, until):
+    clauses = []
+    if since:
+        clauses.append(column >= since)
+    if until:
+        clauses.append(column < until)
+    return clauses
+
+def _folder_rows(server, path_prefix, since, until):
+    stmt = (select(Folder.id, Folder.server, Folder.path, Folder.action_id, ActionLog.timestamp)
+            .outerjoin(ActionLog, Folder.action_id == ActionLog.id)
+            .order_by(Folder.id))
+    if server:
+        stmt = stmt.where(Folder.server == server)
+    if path_prefix:
+        stmt = stmt.where(Folder.path.startswith(path_prefix, autoescape=True))
+    stmt = stmt.where(*_in_range(ActionLog.timestamp, since, until))
+    yield from _execute(stmt)
+
+def _group_rows(since, until):
+    stmt = (select(ADGroup.id, ADGroup.name, ADGroup.type, ADGroup.action_id, ActionLog.timestamp)
+            .outerjoin(ActionLog, ADGroup.action_id == ActionLog.id)
+            .where(*_in_range(ActionLog.timestamp, since, until))
+            .order_by(ADGroup.id))
+    yield from _execute(stmt)
+
+def _history_rows(server, path_prefix, since, until):
+    # Archived actions are older than anything still live, so they go first
+    for row in archive_service.iter_archive(server, since, until, path_prefix, batch_size=BATCH_SIZE):
+        # Audit output: re-check the server against the exact list, like the live part's equality filter
+        if server and server not in (row[5] or "").split(","):
+            continue
+        yield (*row, True)
+
+    # Per-action folder/group totals in one aggregate pass each, not a lookup per row
+    folder_stats = (select(Folder.action_id,
+                           func.count(Folder.id).label("folder_count"),
+                           func.group_concat(Folder.server.distinct()).label("servers"))
+                    .where(Folder.action_id.isnot(None))
+                    .group_by(Folder.action_id).subquery())
+    group_stats = (select(ADGroup.action_id, func.count(ADGroup.id).label("group_count"))
+                   .where(ADGroup.action_id.isnot(None))
+                   .group_by(ADGroup.action_id).subquery())
+    stmt = (select(ActionLog.id, ActionLog.timestamp, ActionLog.action_type, ActionLog.description, ActionLog.status,
+                   folder_stats.c.servers,
+                   func.coalesce(folder_stats.c.folder_count, 0),
+                   func.coalesce(group_stats.c.group_count, 0))
+            .outerjoin(folder_stats, folder_stats.c.action_id == ActionLog.id)
+            .outerjoin(group_stats, group_stats.c.action_id == ActionLog.id)
+            .where(*_in_range(ActionLog.timestamp, since, until))
+            .order_by(ActionLog.id))
+    touched = []
+    if server:
+        touched.append(Folder.server == server)
+    if path_prefix:
+        touched.append(Folder.path.startswith(path_prefix, autoescape=True))
+    if touched:
+        stmt = stmt.where(ActionLog.id.in_(select(Folder.action_id).where(*touched)))
+    for row in _execute(stmt):
+        yield (*row, False)
+
+def _execute(stmt):
+    db = SessionLocal()
+    try:
+        for row in db.execute(stmt.execution_options(yield_per=BATCH_SIZE)):
+            yield tuple(row)
+    finally:
+        db.close()
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def _encode(rows, columns, fmt: str, dataset: str):
+    buf = io.StringIO()
+    writer = csv.writer(buf) if fmt == "csv" else None
+    if writer:
+        writer.writerow(columns)
+        # Send the header straight away so clients see the download start
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+
+    count = reported = 0
+    started = time.perf_counter()
+    try:
+        for row in rows:
+            if writer:
+                writer.writerow([_value(v) for v in row])
+            else:
+                buf.write(json.dumps({c: _value(v) for c, v in zip(columns, row)}, default=str))
+                buf.write("\n")
+            count += 1
+            if buf.tell() >= CHUNK_BYTES:
+                yield buf.getvalue().encode("utf-8")
+                buf.seek(0)
+                buf.truncate()
+                exported_rows.inc(count - reported, dataset=dataset)
+                reported = count
+        if buf.tell():
+            yield buf.getvalue().encode("utf-8")
+    finally:
+        exported_rows.inc(count - reported, dataset=dataset)
+        log.info("Exported %d %s rows as %s in %.1fs", count, dataset, fmt, time.perf_counter() - started,
+                 extra={"dataset": dataset, "rows": count})
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # wbits 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def _response(rows, columns, dataset: str, fmt: str, gzip: bool):
+    body = _encode(rows, columns, fmt, dataset)
+    filename = f"permitflow-{dataset}-{datetime.utcnow():%Y%m%d-%H%M%S}.{'csv' if fmt == 'csv' else 'ndjson'}"
+    media_type = "text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson"
+    if gzip:
+        body = _gzip(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@router.get("/folders")
+def export_folders(format: Literal["csv", "ndjson"] = "csv", gzip: bool = False, server: Optional[str] = None,
+                   path_prefix: Optional[str] = None, since: Optional[datetime] = None,
+                   until: Optional[datetime] = None):
+    return _response(_folder_rows(server, path_prefix, since, until), FOLDER_COLUMNS, "folders", format, gzip)
+
+@router.get("/groups")
+def export_groups(format: Literal["csv", "ndjson"] = "csv", gzip: bool = False,
+                  since: Optional[datetime] = None, until: Optional[datetime] = None):
+    return _response(_group_rows(since, until), GROUP_COLUMNS, "groups", format, gzip)
+
+@router.get("/history")
+def export_history(format: Literal["csv", "ndjson"] = "csv", gzip: bool = False, server: Optional[str] = None,
+                   path_prefix: Optional[str] = None, since: Optional[datetime] = None,
+                   until: Optional[datetime] = None):
+    # Includes archived actions; server / path_prefix match actions that created such folders
+    return _response(_history_rows(server, path_prefix, since, until), HISTORY_COLUMNS, "history", format, gzip)
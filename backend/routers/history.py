@@ -1,10 +1,15 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 from ..database import get_db
 from ..models import ActionLog
 from ..schemas import ActionLogBase
-# from ..modules.transaction import TransactionManager (Mocking for now)
+from ..services import rollback_service, archive_service
+from ..services.result_cache import cache as result_cache
+from pydantic import TypeAdapter
+
+_history_page = TypeAdapter(List[ActionLogBase])
 
 router = APIRouter(
     prefix="/history",
@@ -14,17 +19,42 @@ router = APIRouter(
 
 @router.get("", response_model=List[ActionLogBase])
 @router.get("/", response_model=List[ActionLogBase])
-def get_history(db: Session = Depends(get_db)):
-    # Order by timestamp desc
-    return db.query(ActionLog).order_by(ActionLog.timestamp.desc()).all()
+def get_history(limit: int = 500, offset: int = 0, db: Session = Depends(get_db)):
+    # Order by timestamp desc. Older entries move to the archive (see /history/archive)
+    limit = max(1, min(limit, 5000))
+    offset = max(offset, 0)
+
+    def build():
+        rows = db.query(ActionLog).order_by(ActionLog.timestamp.desc()).offset(offset).limit(limit).all()
+        return _history_page.dump_json(_history_page.validate_python(rows, from_attributes=True))
+    return result_cache.json_response("history", {"limit": limit, "offset": offset}, ("actions",), build)
+
+@router.get("/archive")
+def search_archived_history(q: Optional[str] = None, server: Optional[str] = None,
+                            since: Optional[datetime] = None, until: Optional[datetime] = None,
+                            limit: int = 100):
+    return archive_service.search_archive(q, server, since, until, max(1, min(limit, 1000)))
+
+@router.get("/archive/{action_id}")
+def get_archived_action(action_id: int):
+    action = archive_service.get_archived_action(action_id)
+    if not action:
+        raise HTTPException(status_code=404, detail="Archived action not found")
+    return action
+
+@router.post("/maintenance")
+async def run_history_maintenance():
+    # Archive + compaction on demand (normally runs on a timer)
+    import asyncio
+    return await asyncio.to_thread(archive_service.run_maintenance)
 
 @router.post("/{action_id}/rollback")
 @router.post("/{action_id}/rollback/")
-def rollback_action(action_id: int, db: Session = Depends(get_db)):
-    # Mocking Rollback Logic for now as TransactionManager is not fully implemented in the tools available
-    action = db.query(ActionLog).filter(ActionLog.id == action_id).first()
-    if action:
-        action.status = "rolled_back"
-        db.commit()
-        return {"status": "rolled_back", "id": action_id}
-    return {"status": "failed", "error": "Action not found"}
+async def rollback_action(action_id: int):
+    # Undo folders (per agent, in parallel) and groups from the action's journal.
+    # Calling again on a partial/interrupted rollback resumes the remaining steps.
+    return await rollback_service.rollback(action_id)
+
+@router.get("/{action_id}/rollback")
+def get_rollback_status(action_id: int, db: Session = Depends(get_db)):
+    return rollback_service.journal_status(db, action_id)
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from ..database import get_db
 from ..models import Folder, ADGroup
+from ..services.result_cache import cache as result_cache
 from typing import List
 
 router = APIRouter(
@@ -15,7 +16,11 @@ router = APIRouter(
 def search_inventory(q: str, db: Session = Depends(get_db)):
     if not q:
         return []
-        
+    # contains() is LIKE, which ignores ASCII case, so "finance" and "Finance" share an entry
+    key = q.lower() if q.isascii() else q
+    return result_cache.json_response("search", {"q": key}, ("folders", "ad_groups"), lambda: _search(q, db))
+
+def _search(q: str, db: Session):
     # Simple search implementation
     folders = db.query(Folder).filter(Folder.path.contains(q)).all()
     groups = db.query(ADGroup).filter(ADGroup.name.contains(q)).all()
@@ -24,12 +29,12 @@ def search_inventory(q: str, db: Session = Depends(get_db)):
     
     for f in folders:
         # Mock finding associated groups for the folder
-        local_groups = [f"ACL_{f.path.split('\\')[-1]}_R", f"ACL_{f.path.split('\\')[-1]}_RW"]
+        local_groups = [f"ACL_{f.name}_R", f"ACL_{f.name}_RW"]
         
         results.append({
             "id": f.id,
             "type": "folder",
-            "name": f.path.split('\\')[-1] if '\\' in f.path else f.path, 
+            "name": f.name, 
             "path": f.path,
             "server": f.server,
             "groups": local_groups 
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+from ..services import profiler
+
+router = APIRouter(
+    prefix="/profiling",
+    tags=["profiling"],
+    responses={404: {"description": "Not found"}},
+)
+
+@router.get("/captures")
+def list_captures():
+    # Sampled profiles (.folded, flamegraph input) and slow-operation traces (.trace.json)
+    return profiler.list_captures()
+
+@router.get("/captures/{name}")
+def download_capture(name: str):
+    path = profiler.capture_path(name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Capture not found")
+    media_type = "application/json" if name.endswith(".json") else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=name)
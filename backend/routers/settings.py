@@ -6,6 +6,8 @@ from pydantic import BaseModel
 from typing import List, Optional
 
 from ..schemas import SettingBase
+from ..services import app_settings
+from ..logging_config import apply_levels
 
 router = APIRouter(
     prefix="/settings",
@@ -13,28 +15,44 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+# key, default value, description. Missing keys are added on first read,
+# so new settings show up for existing installs too.
+DEFAULT_SETTINGS = [
+    ("ad_server", "", "Active Directory Server IP/Hostname"),
+    ("ad_domain", "", "Active Directory Domain (e.g. corp.local)"),
+    ("ad_user", "", "AD Service Account Username"),
+    ("ad_password", "", "AD Service Account Password"),
+    ("mock_mode", "true", "Enable Mock Mode (Simulate operations)"),
+    ("agent_install_path", "C:\\PermitFlowAgent", "Default install path for agents"),
+    ("history_retention_days", "180", "Archive history older than this many days (0 = keep forever)"),
+    ("history_maintenance_hours", "24", "Hours between history archival / database compaction runs"),
+    ("health_interval_seconds", "30", "Seconds between background health checks (AD, agents, database)"),
+    ("profiling_enabled", "false", "Profile a sample of requests and background jobs"),
+    ("profiling_sample_rate", "0.01", "Fraction of requests/jobs profiled when profiling is enabled"),
+    ("profiling_max_captures", "50", "Profiles and traces kept in the app data dir before the oldest are deleted"),
+    ("slow_operation_ms", "2000", "Record a DB/LDAP/agent trace for operations slower than this (0 = off)"),
+    ("ws_handshake_rate", "50", "New agent connections admitted per second; throttled agents are told when to retry (0 = no limit)"),
+    ("ws_handshake_burst", "100", "Agent connections admitted at once before ws_handshake_rate applies"),
+    ("scan_interval_hours", "24", "Hours between scheduled share scans of each agent, staggered across the fleet (0 = off)"),
+    ("scan_concurrency", "4", "Scheduled scans running at once across all agents"),
+    ("scan_window", "", "Local times scheduled scans may start, e.g. 22:00-06:00 (empty = any time); agents can override it"),
+    ("result_cache_mb", "32", "Memory for cached search / agent list / history responses (dropped as soon as the data changes)"),
+    ("log_levels", "", "Per-subsystem log levels, e.g. ws=WARNING,ad=DEBUG,*=INFO (ws, ad, archive, export, health, profiling, scan, static, startup)"),
+]
+
 @router.get("", response_model=List[SettingBase])
 @router.get("/", response_model=List[SettingBase])
 def get_settings(db: Session = Depends(get_db)):
     settings = db.query(Setting).all()
-    # Ensure default settings exist if empty
-    if not settings:
-        defaults = [
-            ("ad_server", "", "Active Directory Server IP/Hostname"),
-            ("ad_domain", "", "Active Directory Domain (e.g. corp.local)"),
-            ("ad_user", "", "AD Service Account Username"),
-            ("ad_password", "", "AD Service Account Password"),
-            ("mock_mode", "true", "Enable Mock Mode (Simulate operations)"),
-            ("agent_install_path", "C:\\PermitFlowAgent", "Default install path for agents")
-        ]
-        results = []
-        for key, val, desc in defaults:
-            s = Setting(key=key, value=val, description=desc)
-            db.add(s)
-            results.append(s)
+    # Ensure default settings exist
+    existing = {s.key for s in settings}
+    missing = [Setting(key=key, value=val, description=desc)
+               for key, val, desc in DEFAULT_SETTINGS if key not in existing]
+    if missing:
+        db.add_all(missing)
         db.commit()
-        return results
-        
+        settings.extend(missing)
+
     return settings
 
 @router.post("")
@@ -51,4 +69,7 @@ def update_setting(setting: SettingBase, db: Session = Depends(get_db)):
     
     db.commit()
     db.refresh(db_setting)
+    app_settings.invalidate()
+    if setting.key == "log_levels":
+        apply_levels(setting.value)
     return db_setting
@@ -1,7 +1,49 @@
 from sqlalchemy.orm import Session
 from ..models import Setting, ADGroup
+from .. import metrics
+from . import profiler
+from ..logging_config import get_logger
+from contextlib import contextmanager
+import threading
+import time
 import json
 
+log = get_logger("ad")
+
+class LDAPConnectionPool:
+    """Keeps bound ldap3 connections around so bulk operations don't re-bind per call."""
+
+    def __init__(self, max_idle: int = 4):
+        self.max_idle = max_idle
+        self._idle = {} # (server, user) -> [Connection]
+        self._lock = threading.Lock()
+
+    def acquire(self, key, factory):
+        with self._lock:
+            idle = self._idle.get(key)
+            conn = idle.pop() if idle else None
+        if conn is not None and not conn.closed:
+            return conn
+        return factory()
+
+    def release(self, key, conn):
+        if conn.closed:
+            return
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.unbind()
+
+    def discard(self, conn):
+        try:
+            conn.unbind()
+        except Exception:
+            pass
+
+ldap_pool = LDAPConnectionPool()
+
 class ADService:
     def __init__(self, db: Session):
         self.db = db
@@ -14,89 +56,162 @@ class ADService:
     def is_mock(self):
         return self.settings.get("mock_mode", "true").lower() == "true"
 
+    def _base_dn(self):
+        domain_parts = self.settings.get("ad_domain", "corp.local").split('.')
+        return ",".join([f"DC={part}" for part in domain_parts])
+
     def _get_connection(self):
         try:
             from ldap3 import Server, Connection, NTLM, SUBTREE, ALL
-            
+
             server_host = self.settings.get("ad_server")
             domain = self.settings.get("ad_domain", "corp.local")
             user = self.settings.get("ad_user")
             password = self.settings.get("ad_password")
-            
+
             # Construct full username (DOMAIN\User)
             full_user = f"{domain}\\{user}" if "\\" not in user else user
-            
+
             server = Server(server_host, get_info=ALL)
             conn = Connection(server, user=full_user, password=password, authentication=NTLM, auto_bind=True)
             return conn
         except Exception as e:
-            print(f"[AD ERROR] Connection failed: {e}")
+            log.error("Connection failed: %s", e)
             raise e
 
+    @contextmanager
+    def _connection(self):
+        # Borrow a bound connection from the pool; broken connections are dropped
+        key = (self.settings.get("ad_server"), self.settings.get("ad_user"))
+        conn = ldap_pool.acquire(key, self._get_connection)
+        try:
+            yield conn
+        except Exception:
+            ldap_pool.discard(conn)
+            raise
+        else:
+            ldap_pool.release(key, conn)
+
+    def probe(self):
+        """Measure a fresh bind and a trivial search against the configured DC."""
+        start = time.perf_counter()
+        with self._timed("bind"):
+            conn = self._get_connection()
+        bind_ms = round((time.perf_counter() - start) * 1000, 2)
+        try:
+            start = time.perf_counter()
+            with self._timed("probe_search"):
+                conn.search(self._base_dn(), "(objectClass=domain)", search_scope="BASE", attributes=["distinguishedName"])
+            search_ms = round((time.perf_counter() - start) * 1000, 2)
+        finally:
+            conn.unbind()
+        return {"bind_ms": bind_ms, "search_ms": search_ms}
+
+    @contextmanager
+    def _timed(self, operation: str):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            metrics.ldap_errors.inc(operation=operation)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.ldap_operation_seconds.observe(elapsed, operation=operation)
+            profiler.record_span("ldap", operation, start, elapsed)
+
     def create_group(self, name: str, description: str = ""):
         if self.is_mock():
-            print(f"[MOCK AD] Creating Log Group: {name}")
+            log.info("[mock] Creating group: %s", name, extra={"group": name, "sample_key": "ad.mock"})
             return True
         else:
             try:
                 # Real implementation
-                conn = self._get_connection()
-                domain_parts = self.settings.get("ad_domain", "corp.local").split('.')
-                dc_string = ",".join([f"DC={part}" for part in domain_parts])
-                
-                # Where to create groups? (Just default Users or a specific OU if configured)
-                # For now, put in Users container
-                dn = f"CN={name},CN=Users,{dc_string}"
-                
-                attributes = {
-                    'sAMAccountName': name,
-                    'description': description or "Created by PermitFlow"
-                }
-                
-                success = conn.add(dn, 'group', attributes)
-                if success:
-                    print(f"[REAL AD] Created group: {name}")
-                    conn.unbind()
-                    return True
-                else:
-                    print(f"[REAL AD] Failed: {conn.result}")
-                    conn.unbind()
-                    return False
+                with self._timed("create_group"), self._connection() as conn:
+                    # Where to create groups? (Just default Users or a specific OU if configured)
+                    # For now, put in Users container
+                    dn = f"CN={name},CN=Users,{self._base_dn()}"
+
+                    attributes = {
+                        'sAMAccountName': name,
+                        'description': description or "Created by PermitFlow"
+                    }
+
+                    success = conn.add(dn, 'group', attributes)
+                    if success:
+                        log.info("Created group: %s", name, extra={"group": name})
+                        return True
+                    else:
+                        log.warning("Create group %s failed: %s", name, conn.result, extra={"group": name})
+                        metrics.ldap_errors.inc(operation="create_group")
+                        return False
             except Exception as e:
-                print(f"[REAL AD] Exception: {e}")
+                log.error("Create group %s failed: %s", name, e, extra={"group": name})
                 return False
 
+    def delete_groups(self, names):
+        """Delete groups by sAMAccountName over a single pooled connection.
+
+        Returns {name: error or None}. Groups that no longer exist count as deleted.
+        """
+        results = {}
+        if self.is_mock():
+            for name in names:
+                log.info("[mock] Deleting group: %s", name, extra={"group": name, "sample_key": "ad.mock"})
+                results[name] = None
+            return results
+
+        try:
+            from ldap3.utils.conv import escape_filter_chars
+
+            with self._timed("delete_groups"), self._connection() as conn:
+                dc_string = self._base_dn()
+                for name in names:
+                    # Names come from stored rows: a "*" or ")" must not widen what gets deleted
+                    conn.search(dc_string, f"(&(objectClass=group)(sAMAccountName={escape_filter_chars(name)}))")
+                    if not conn.entries:
+                        results[name] = None
+                        continue
+                    if conn.delete(conn.entries[0].entry_dn):
+                        log.info("Deleted group: %s", name, extra={"group": name})
+                        results[name] = None
+                    else:
+                        results[name] = str(conn.result.get("description", conn.result))
+                        metrics.ldap_errors.inc(operation="delete_groups")
+        except Exception as e:
+            log.error("Delete groups failed: %s", e)
+            for name in names:
+                results.setdefault(name, str(e))
+        return results
+
     def add_member(self, group_name: str, username: str):
         if self.is_mock():
-            print(f"[MOCK AD] Adding {username} to {group_name}")
+            log.info("[mock] Adding %s to %s", username, group_name, extra={"group": group_name, "sample_key": "ad.mock"})
             return True
         else:
             try:
-                conn = self._get_connection()
-                domain_parts = self.settings.get("ad_domain", "corp.local").split('.')
-                dc_string = ",".join([f"DC={part}" for part in domain_parts])
-                
-                # Find Group DN
-                conn.search(dc_string, f"(&(objectClass=group)(sAMAccountName={group_name}))")
-                if not conn.entries:
-                    print(f"[REAL AD] Group not found: {group_name}")
-                    return False
-                group_dn = conn.entries[0].entry_dn
-                
-                # Find User DN
-                conn.search(dc_string, f"(&(objectClass=user)(sAMAccountName={username}))")
-                if not conn.entries:
-                     print(f"[REAL AD] User not found: {username}")
-                     return False
-                user_dn = conn.entries[0].entry_dn
-                
-                # Add Member
-                from ldap3 import MODIFY_ADD
-                success = conn.modify(group_dn, {'member': [(MODIFY_ADD, [user_dn])]})
-                conn.unbind()
-                return success
+                with self._timed("add_member"), self._connection() as conn:
+                    dc_string = self._base_dn()
+
+                    # Find Group DN
+                    conn.search(dc_string, f"(&(objectClass=group)(sAMAccountName={group_name}))")
+                    if not conn.entries:
+                        log.warning("Group not found: %s", group_name, extra={"group": group_name})
+                        return False
+                    group_dn = conn.entries[0].entry_dn
+
+                    # Find User DN
+                    conn.search(dc_string, f"(&(objectClass=user)(sAMAccountName={username}))")
+                    if not conn.entries:
+                         log.warning("User not found: %s", username)
+                         return False
+                    user_dn = conn.entries[0].entry_dn
+
+                    # Add Member
+                    from ldap3 import MODIFY_ADD
+                    return conn.modify(group_dn, {'member': [(MODIFY_ADD, [user_dn])]})
             except Exception as e:
-                 print(f"[REAL AD] Exception: {e}")
+                 log.error("Add %s to %s failed: %s", username, group_name, e, extra={"group": group_name})
                  return False
     def check_user_exists(self, username: str):
         if self.is_mock():
@@ -104,25 +219,20 @@ class ADService:
             return username.lower() != "invalid"
         else:
             try:
-                conn = self._get_connection()
-                domain_parts = self.settings.get("ad_domain", "corp.local").split('.')
-                dc_string = ",".join([f"DC={part}" for part in domain_parts])
-                
-                query = f"(&(objectClass=user)(sAMAccountName={username}))"
-                conn.search(dc_string, query, attributes=['cn', 'displayName', 'mail'])
-                
-                if conn.entries:
-                    user_entry = conn.entries[0]
-                    conn.unbind()
-                    return {
-                        "exists": True,
-                        "cn": str(user_entry.cn),
-                        "displayName": str(user_entry.displayName) if user_entry.displayName else "",
-                        "mail": str(user_entry.mail) if user_entry.mail else ""
-                    }
-                else:
-                    conn.unbind()
-                    return {"exists": False}
+                with self._timed("check_user"), self._connection() as conn:
+                    query = f"(&(objectClass=user)(sAMAccountName={username}))"
+                    conn.search(self._base_dn(), query, attributes=['cn', 'displayName', 'mail'])
+
+                    if conn.entries:
+                        user_entry = conn.entries[0]
+                        return {
+                            "exists": True,
+                            "cn": str(user_entry.cn),
+                            "displayName": str(user_entry.displayName) if user_entry.displayName else "",
+                            "mail": str(user_entry.mail) if user_entry.mail else ""
+                        }
+                    else:
+                        return {"exists": False}
             except Exception as e:
-                print(f"[REAL AD] Check User Exception: {e}")
+                log.error("Check user %s failed: %s", username, e)
                 return {"exists": False, "error": str(e)}
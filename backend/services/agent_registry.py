@@ -0,0 +1,85 @@
+"""Batched writes of agent status / heartbeats.
+
+The WebSocket endpoint used to commit on every connect, heartbeat and
+disconnect. After a master restart thousands of agents reconnect within
+seconds and each of those commits queues up on SQLite's single writer.
+Endpoints now only record the latest state per agent in memory; run() flushes
+everything pending in one upsert transaction every FLUSH_INTERVAL seconds.
+"""
+from sqlalchemy.dialects.sqlite import insert
+from ..database import SessionLocal
+from ..models import Agent
+from .result_cache import cache as result_cache
+from .. import metrics
+from ..logging_config import get_logger
+from datetime import datetime
+import asyncio
+
+log = get_logger("ws")
+
+FLUSH_INTERVAL = 0.5
+
+flush_seconds = metrics.Histogram(
+    "permitflow_agent_registry_flush_seconds", "Time to write one batch of agent status updates")
+
+class AgentRegistry:
+    def __init__(self):
+        self._pending = {} # agent_id -> (status, last_heartbeat or None); last write wins
+
+    def mark_online(self, agent_id: str):
+        self._pending[agent_id] = ("online", datetime.utcnow())
+
+    def heartbeat(self, agent_id: str):
+        self._pending[agent_id] = ("online", datetime.utcnow())
+
+    def mark_offline(self, agent_id: str):
+        # Keep a heartbeat that hasn't been written yet
+        previous = self._pending.get(agent_id)
+        self._pending[agent_id] = ("offline", previous[1] if previous else None)
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _write(self, batch: dict):
+        db = SessionLocal()
+        try:
+            for agent_id, (status, when) in batch.items():
+                values = {"id": agent_id, "hostname": agent_id, "status": status}
+                update = {"status": status}
+                if when is not None:
+                    values["last_heartbeat"] = when
+                    update["last_heartbeat"] = when
+                db.execute(insert(Agent).values(**values).on_conflict_do_update(index_elements=[Agent.id], set_=update))
+            db.commit()
+        finally:
+            db.close()
+        # The session hooks would catch this upsert too; bump explicitly so
+        # /api/agents stays correct if the write ever moves off SessionLocal
+        result_cache.bump(Agent.__tablename__)
+
+    def flush(self):
+        """Write everything pending now (sync; used at shutdown)."""
+        batch, self._pending = self._pending, {}
+        if batch:
+            self._write(batch)
+        return len(batch)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            if not self._pending:
+                continue
+            batch, self._pending = self._pending, {}
+            try:
+                with flush_seconds.time():
+                    await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                log.error("Agent registry flush failed (%d agents): %s", len(batch), e)
+                # Keep newer updates that arrived while writing
+                for agent_id, state in batch.items():
+                    self._pending.setdefault(agent_id, state)
+
+registry = AgentRegistry()
+
+metrics.Gauge("permitflow_agent_registry_pending", "Agent status updates waiting to be written",
+              callback=registry.pending)
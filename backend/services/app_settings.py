@@ -0,0 +1,51 @@
+from ..database import SessionLocal
+from ..models import Setting
+import threading
+import time
+
+# Settings change rarely but background jobs read them constantly,
+# so keep a short-lived copy instead of querying each time.
+CACHE_TTL = 30.0
+
+_cache = {}
+_loaded_at = None
+_lock = threading.Lock()
+
+def _load():
+    global _cache, _loaded_at
+    db = SessionLocal()
+    try:
+        _cache = {s.key: s.value for s in db.query(Setting).all()}
+    finally:
+        db.close()
+    _loaded_at = time.monotonic()
+
+def get_setting(key: str, default: str = None):
+    with _lock:
+        if _loaded_at is None or time.monotonic() - _loaded_at > CACHE_TTL:
+            _load()
+        value = _cache.get(key)
+    return default if value in (None, "") else value
+
+def get_int(key: str, default: int) -> int:
+    try:
+        return int(get_setting(key, default))
+    except (TypeError, ValueError):
+        return default
+
+def get_float(key: str, default: float) -> float:
+    try:
+        return float(get_setting(key, default))
+    except (TypeError, ValueError):
+        return default
+
+def get_bool(key: str, default: bool = False) -> bool:
+    value = get_setting(key)
+    if value is None:
+        return default
+    return str(value).lower() in ("true", "1", "yes", "on")
+
+def invalidate():
+    global _loaded_at
+    with _lock:
+        _loaded_at = None
@@ -0,0 +1,215 @@
+from sqlalchemy import text
+from ..database import SessionLocal, ArchiveSessionLocal, engine, archive_engine
+from ..models import ActionLog, Folder, ADGroup, RollbackStep, ArchivedAction
+from . import app_settings, profiler
+from ..logging_config import get_logger
+from datetime import datetime, timedelta
+import asyncio
+import json
+import zlib
+
+log = get_logger("archive")
+
+# Actions moved per transaction, keeps write locks short
+ARCHIVE_BATCH_SIZE = 200
+
+# Actions in these states are still being worked on and never archived
+ACTIVE_STATUSES = ("Running", "rolling_back")
+
+# Nothing left on disk/AD for these, so their child rows can go entirely.
+# For any other status the folders and groups still exist and stay in the
+# live inventory, just detached from the archived action.
+REMOVED_STATUSES = ("rolled_back", "failed")
+
+def _pack(data) -> bytes:
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"), 9)
+
+def _unpack(blob: bytes):
+    return json.loads(zlib.decompress(blob).decode("utf-8")) if blob else {}
+
+def _on_server(server: str):
+    # servers is "FS01,FS02": match whole entries, so FS1 doesn't pick up FS10
+    return ("," + ArchivedAction.servers + ",").contains(f",{server},", autoescape=True)
+
+def _archive_row(db, action: ActionLog) -> ArchivedAction:
+    folders = [{"path": f.path, "server": f.server} for f in action.created_folders]
+    groups = [{"name": g.name, "type": g.type} for g in action.created_groups]
+    steps = db.query(RollbackStep).filter(RollbackStep.action_id == action.id).order_by(RollbackStep.seq).all()
+    payload = {
+        "folders": folders,
+        "groups": groups,
+        "rollback_steps": [{"kind": s.kind, "target": s.target, "server": s.server, "status": s.status, "error": s.error}
+                           for s in steps]
+    }
+    return ArchivedAction(
+        id=action.id,
+        timestamp=action.timestamp,
+        action_type=action.action_type,
+        description=action.description,
+        status=action.status,
+        servers=",".join(sorted({f["server"] for f in folders if f["server"]})),
+        folder_count=len(folders),
+        group_count=len(groups),
+        payload=_pack(payload)
+    )
+
+def archive_old_actions(retention_days: int) -> int:
+    """Move actions older than retention_days (and their child rows) into the archive DB."""
+    if retention_days <= 0:
+        return 0
+
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    moved = 0
+
+    db = SessionLocal()
+    archive = ArchiveSessionLocal()
+    try:
+        while True:
+            actions = (db.query(ActionLog)
+                       .filter(ActionLog.timestamp < cutoff, ActionLog.status.notin_(ACTIVE_STATUSES))
+                       .order_by(ActionLog.id)
+                       .limit(ARCHIVE_BATCH_SIZE)
+                       .all())
+            if not actions:
+                break
+
+            # Archive first: if we crash before the hot delete, the next run
+            # re-archives the same ids (merge) and finishes the move.
+            for action in actions:
+                archive.merge(_archive_row(db, action))
+            archive.commit()
+
+            ids = [a.id for a in actions]
+            removed = [a.id for a in actions if a.status in REMOVED_STATUSES]
+            kept = [a.id for a in actions if a.status not in REMOVED_STATUSES]
+
+            db.query(RollbackStep).filter(RollbackStep.action_id.in_(ids)).delete(synchronize_session=False)
+            if removed:
+                db.query(Folder).filter(Folder.action_id.in_(removed)).delete(synchronize_session=False)
+                db.query(ADGroup).filter(ADGroup.action_id.in_(removed)).delete(synchronize_session=False)
+            if kept:
+                db.query(Folder).filter(Folder.action_id.in_(kept)).update({Folder.action_id: None}, synchronize_session=False)
+                db.query(ADGroup).filter(ADGroup.action_id.in_(kept)).update({ADGroup.action_id: None}, synchronize_session=False)
+            db.query(ActionLog).filter(ActionLog.id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+            db.expunge_all()
+            moved += len(ids)
+    finally:
+        db.close()
+        archive.close()
+
+    if moved:
+        log.info("Archived %d actions older than %d days", moved, retention_days, extra={"archived": moved})
+    return moved
+
+def compact_database():
+    """Return freed pages to the OS and refresh planner statistics."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # auto_vacuum can only be switched on by a full VACUUM; do that once
+        if conn.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+            conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+            conn.exec_driver_sql("VACUUM")
+        conn.execute(text("PRAGMA incremental_vacuum"))
+        conn.execute(text("ANALYZE"))
+        conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+    with archive_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE"))
+
+def run_maintenance():
+    retention_days = app_settings.get_int("history_retention_days", 180)
+    moved = archive_old_actions(retention_days)
+    compact_database()
+    return {"status": "success", "archived": moved, "retention_days": retention_days}
+
+async def maintenance_loop():
+    # First run shortly after startup, then on the configured cadence
+    await asyncio.sleep(60)
+    while True:
+        try:
+            async with profiler.background_job("history_maintenance"):
+                await asyncio.to_thread(run_maintenance)
+        except Exception as e:
+            log.exception("History maintenance failed: %s", e)
+        hours = app_settings.get_float("history_maintenance_hours", 24)
+        await asyncio.sleep(max(hours, 0.1) * 3600)
+
+def search_archive(q: str = None, server: str = None, since: datetime = None, until: datetime = None, limit: int = 100):
+    """Search archived actions. Description/date/server filters run in SQL;
+    q also matches folder paths and group names by decompressing candidates."""
+    archive = ArchiveSessionLocal()
+    try:
+        query = archive.query(ArchivedAction)
+        if since:
+            query = query.filter(ArchivedAction.timestamp >= since)
+        if until:
+            query = query.filter(ArchivedAction.timestamp < until)
+        if server:
+            query = query.filter(_on_server(server))
+
+        results = []
+        needle = q.lower() if q else None
+        for row in query.order_by(ArchivedAction.timestamp.desc()).yield_per(500):
+            matches = []
+            if needle and needle not in (row.description or "").lower():
+                payload = _unpack(row.payload)
+                matches = [f["path"] for f in payload.get("folders", []) if needle in f["path"].lower()]
+                matches += [g["name"] for g in payload.get("groups", []) if needle in g["name"].lower()]
+                if not matches:
+                    continue
+            results.append({
+                "id": row.id,
+                "timestamp": row.timestamp,
+                "action_type": row.action_type,
+                "description": row.description,
+                "status": row.status,
+                "servers": row.servers.split(",") if row.servers else [],
+                "folder_count": row.folder_count,
+                "group_count": row.group_count,
+                "matches": matches[:20]
+            })
+            if len(results) >= limit:
+                break
+        return results
+    finally:
+        archive.close()
+
+def iter_archive(server: str = None, since: datetime = None, until: datetime = None, path_prefix: str = None,
+                 batch_size: int = 500):
+    """Yield archived actions oldest first as (id, timestamp, action_type, description,
+    status, servers, folder_count, group_count), without loading them all (exports)."""
+    archive = ArchiveSessionLocal()
+    try:
+        query = archive.query(ArchivedAction)
+        if since:
+            query = query.filter(ArchivedAction.timestamp >= since)
+        if until:
+            query = query.filter(ArchivedAction.timestamp < until)
+        if server:
+            query = query.filter(_on_server(server))
+        prefix = path_prefix.lower() if path_prefix else None
+        for row in query.order_by(ArchivedAction.id).yield_per(batch_size):
+            if prefix and not any(f["path"].lower().startswith(prefix)
+                                  for f in _unpack(row.payload).get("folders", [])):
+                continue
+            yield (row.id, row.timestamp, row.action_type, row.description, row.status,
+                   row.servers, row.folder_count, row.group_count)
+    finally:
+        archive.close()
+
+def get_archived_action(action_id: int):
+    archive = ArchiveSessionLocal()
+    try:
+        row = archive.query(ArchivedAction).filter(ArchivedAction.id == action_id).first()
+        if not row:
+            return None
+        return {
+            "id": row.id,
+            "timestamp": row.timestamp,
+            "action_type": row.action_type,
+            "description": row.description,
+            "status": row.status,
+            "archived_at": row.archived_at,
+            **_unpack(row.payload)
+        }
+    finally:
+        archive.close()
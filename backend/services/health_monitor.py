@@ -0,0 +1,163 @@
+from sqlalchemy import text
+from ..database import SessionLocal, DB_PATH, data_dir
+from ..websocket_manager import manager
+from .ad_service import ADService
+from . import app_settings, profiler
+from ..logging_config import get_logger
+from datetime import datetime
+import asyncio
+import os
+import shutil
+import time
+
+log = get_logger("health")
+
+# How often the event loop lag probe wakes up
+LAG_PROBE_INTERVAL = 0.5
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+class HealthMonitor:
+    """Refreshes a health snapshot in the background so /api/health never does I/O."""
+
+    def __init__(self):
+        self.snapshot = {
+            "database": "unknown",
+            "ad_connection": "unknown",
+            "agents_online": 0,
+            "agents_total": 0,
+            "disk_space": "unknown",
+            "system_status": "initializing",
+            "updated_at": None
+        }
+        self._lag_last = 0.0
+        self._lag_max = 0.0
+
+    # --- Probes (blocking ones run in a worker thread) ---
+
+    def _probe_database(self):
+        result = {}
+        db = SessionLocal()
+        try:
+            start = time.perf_counter()
+            db.execute(text("SELECT 1"))
+            result["latency_ms"] = _ms(time.perf_counter() - start)
+            rows = db.execute(text("SELECT status, COUNT(*) FROM agents GROUP BY status")).all()
+            counts = {status: count for status, count in rows}
+            result["agents_total"] = sum(counts.values())
+            result["agents_online"] = counts.get("online", 0)
+        finally:
+            db.close()
+        result["size_bytes"] = os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 0
+        wal_path = DB_PATH + "-wal"
+        result["wal_bytes"] = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        return result
+
+    def _probe_ad(self):
+        db = SessionLocal()
+        try:
+            ad = ADService(db)
+        finally:
+            db.close()
+        if ad.is_mock():
+            return {"mode": "mock"}
+        return {"mode": "real", **ad.probe()}
+
+    def _probe_disk(self):
+        total, used, free = shutil.disk_usage(data_dir)
+        return {"total_bytes": total, "free_bytes": free}
+
+    async def _probe_agents(self):
+        agent_ids = list(manager.active_connections.keys())
+
+        async def ping(agent_id):
+            start = time.perf_counter()
+            try:
+                response = await manager.send_command(agent_id, {"type": "ping"}, timeout=5.0)
+                if response is None:
+                    return agent_id, None
+                return agent_id, _ms(time.perf_counter() - start)
+            except Exception:
+                return agent_id, None
+
+        results = dict(await asyncio.gather(*[ping(a) for a in agent_ids]))
+        rtts = sorted(r for r in results.values() if r is not None)
+        return {
+            "connected": len(agent_ids),
+            "unreachable": [a for a, r in results.items() if r is None],
+            "rtt_ms": results,
+            "rtt_p50_ms": rtts[len(rtts) // 2] if rtts else None,
+            "rtt_max_ms": rtts[-1] if rtts else None
+        }
+
+    # --- Snapshot ---
+
+    async def refresh(self):
+        snap = dict(self.snapshot)
+        status = "healthy"
+
+        try:
+            db_info = await asyncio.to_thread(self._probe_database)
+            snap["database"] = "connected"
+            snap["agents_total"] = db_info.pop("agents_total")
+            snap["agents_online"] = db_info.pop("agents_online")
+            snap["db"] = db_info
+        except Exception as e:
+            snap["database"] = "error"
+            snap["db"] = {"error": str(e)}
+            status = "degraded"
+
+        try:
+            ad_info = await asyncio.to_thread(self._probe_ad)
+            snap["ad_connection"] = "mock_mode" if ad_info["mode"] == "mock" else "connected"
+            snap["ad"] = ad_info
+        except Exception as e:
+            snap["ad_connection"] = "error"
+            snap["ad"] = {"mode": "real", "error": str(e)}
+            status = "degraded"
+
+        try:
+            snap["agents"] = await self._probe_agents()
+        except Exception as e:
+            snap["agents"] = {"error": str(e)}
+
+        try:
+            disk = await asyncio.to_thread(self._probe_disk)
+            snap["disk_space"] = f"{disk['free_bytes'] // (2**30)} GB Free"
+            snap["disk"] = disk
+        except Exception:
+            pass
+
+        snap["event_loop_lag_ms"] = {"last": _ms(self._lag_last), "max": _ms(self._lag_max)}
+        self._lag_max = 0.0
+
+        snap["system_status"] = status
+        snap["updated_at"] = datetime.utcnow().isoformat()
+        # Swap in one assignment so readers never see a half-built snapshot
+        self.snapshot = snap
+
+    async def _lag_probe(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            lag = max(0.0, loop.time() - start - LAG_PROBE_INTERVAL)
+            self._lag_last = lag
+            self._lag_max = max(self._lag_max, lag)
+
+    async def run(self):
+        lag_task = asyncio.create_task(self._lag_probe())
+        try:
+            while True:
+                try:
+                    async with profiler.background_job("health_refresh"):
+                        await self.refresh()
+                except Exception as e:
+                    log.exception("Refresh failed: %s", e)
+                interval = app_settings.get_float("health_interval_seconds", 30)
+                await asyncio.sleep(max(interval, 1.0))
+        finally:
+            lag_task.cancel()
+
+monitor = HealthMonitor()
@@ -0,0 +1,295 @@
+from sqlalchemy import event
+from ..database import data_dir, engine
+from . import app_settings
+from ..logging_config import get_logger
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from collections import Counter
+import json
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+
+log = get_logger("profiling")
+
+CAPTURE_DIR = os.path.join(data_dir, "profiles")
+
+# Request header that forces a profile for one request
+PROFILE_HEADER = b"x-permitflow-profile"
+
+# Bound memory of a single trace (e.g. a provisioning run issuing 50k queries)
+MAX_SPANS_PER_TRACE = 5000
+
+SAMPLE_INTERVAL = 0.005
+
+# Finished captures waiting for the writer thread; more are dropped
+MAX_PENDING_CAPTURES = 20
+
+_current_trace: ContextVar = ContextVar("permitflow_trace", default=None)
+
+class Trace:
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = datetime.utcnow()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.dropped = 0
+
+    def add(self, kind: str, name: str, start: float, duration: float, **extra):
+        if len(self.spans) >= MAX_SPANS_PER_TRACE:
+            self.dropped += 1
+            return
+        self.spans.append({
+            "kind": kind,
+            "name": name,
+            "offset_ms": round((start - self.start) * 1000, 3),
+            "duration_ms": round(duration * 1000, 3),
+            **extra
+        })
+
+    def to_dict(self, duration: float):
+        totals = {}
+        for span in self.spans:
+            if span["kind"] == "db":
+                # Normalized here rather than per statement, as most traces are never written
+                span["name"] = " ".join(span["name"].split())[:200]
+            entry = totals.setdefault(span["kind"], {"count": 0, "total_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] = round(entry["total_ms"] + span["duration_ms"], 3)
+        return {
+            "name": self.name,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(duration * 1000, 3),
+            "totals": totals,
+            "dropped_spans": self.dropped,
+            "spans": self.spans
+        }
+
+def record_span(kind: str, name: str, start: float, duration: float, **extra):
+    """Attach a finished span to the trace of the current request/job, if any."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(kind, name, start, duration, **extra)
+
+@contextmanager
+def span(kind: str, name: str, **extra):
+    if _current_trace.get() is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(kind, name, start, time.perf_counter() - start, **extra)
+
+@event.listens_for(engine, "before_cursor_execute")
+def _db_span_start(conn, cursor, statement, parameters, context, executemany):
+    if _current_trace.get() is not None:
+        conn.info.setdefault("span_start", []).append(time.perf_counter())
+
+@event.listens_for(engine, "after_cursor_execute")
+def _db_span_end(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("span_start")
+    if _current_trace.get() is not None and starts:
+        start = starts.pop()
+        record_span("db", statement, start, time.perf_counter() - start)
+
+class StackSampler:
+    """Samples the stacks of all threads on a timer and aggregates them in folded
+    (flamegraph) format. Costs one sys._current_frames() walk per interval
+    instead of a hook on every call like cProfile."""
+
+    _busy = threading.Lock() # one sampler at a time process-wide
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> bool:
+        if not StackSampler._busy.acquire(blocking=False):
+            return False
+        self._thread = threading.Thread(target=self._run, name="permitflow-sampler", daemon=True)
+        self._thread.start()
+        return True
+
+    def request_stop(self):
+        """Stop sampling without waiting for the thread (stop() joins it)."""
+        self._stop.set()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        try:
+            self._sample()
+        finally:
+            StackSampler._busy.release()
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {}
+        while True:
+            for tid, frame in sys._current_frames().items():
+                if tid == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if tid not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(tid, str(tid)))
+                self.samples[";".join(reversed(stack))] += 1
+            if self._stop.wait(self.interval):
+                break
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+# --- Capture storage ---
+
+def _safe(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_")[:80] or "op"
+
+def _rotate():
+    keep = app_settings.get_int("profiling_max_captures", 50)
+    files = sorted((os.path.join(CAPTURE_DIR, f) for f in os.listdir(CAPTURE_DIR)), key=os.path.getmtime)
+    for path in files[:max(0, len(files) - keep)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _write_capture(kind: str, name: str, content: str, extension: str):
+    os.makedirs(CAPTURE_DIR, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    path = os.path.join(CAPTURE_DIR, f"{stamp}_{kind}_{_safe(name)}.{extension}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    _rotate()
+    return path
+
+class _CaptureWriter:
+    """Background thread that finishes captures: joins the sampler, writes the
+    file and rotates the directory. Operations usually end on the event loop,
+    which must not wait on a thread join or file I/O."""
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=MAX_PENDING_CAPTURES)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="permitflow-capture-writer", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            log.warning("Capture writer is behind, dropping a capture", extra={"sample_key": "profiling.dropped"})
+            return False
+        return True
+
+    def _run(self):
+        while True:
+            name, job = self._queue.get()
+            try:
+                job()
+            except Exception as e:
+                log.error("Failed to write capture for %s: %s", name, e)
+
+_writer = _CaptureWriter()
+
+def list_captures():
+    if not os.path.isdir(CAPTURE_DIR):
+        return []
+    captures = []
+    for entry in os.scandir(CAPTURE_DIR):
+        stat = entry.stat()
+        captures.append({
+            "name": entry.name,
+            "kind": "profile" if entry.name.endswith(".folded") else "trace",
+            "size": stat.st_size,
+            "created": datetime.utcfromtimestamp(stat.st_mtime).isoformat()
+        })
+    return sorted(captures, key=lambda c: c["created"], reverse=True)
+
+def capture_path(name: str):
+    # Only plain file names from list_captures() are allowed
+    if name != os.path.basename(name) or name.startswith("."):
+        return None
+    path = os.path.join(CAPTURE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+# --- Operation wrapper used by the middleware and background jobs ---
+
+class _Operation:
+    def __init__(self, name: str, force_profile: bool = False):
+        self.name = name
+        self.threshold = app_settings.get_float("slow_operation_ms", 2000) / 1000.0
+        rate = app_settings.get_float("profiling_sample_rate", 0.01)
+        sampled = force_profile or (app_settings.get_bool("profiling_enabled") and random.random() < rate)
+        self.sampler = StackSampler() if sampled else None
+        # No trace (and no DB span hooks doing work) unless slow operations are recorded
+        self.trace = Trace(name) if self.threshold > 0 else None
+        self._token = None
+
+    def __enter__(self):
+        if self.sampler and not self.sampler.start():
+            self.sampler = None # Another capture is running, skip this one
+        if self.trace:
+            self._token = _current_trace.set(self.trace)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        if self._token is not None:
+            _current_trace.reset(self._token)
+        # Only cheap work here; joining the sampler and writing files happen on the writer thread
+        sampler, trace, name = self.sampler, self.trace, self.name
+        write_trace = trace is not None and duration >= self.threshold
+        if sampler:
+            sampler.request_stop()
+        if sampler or write_trace:
+            def finish():
+                if sampler:
+                    sampler.stop()
+                    _write_capture("profile", name, sampler.folded(), "folded")
+                if write_trace:
+                    _write_capture("trace", name, json.dumps(trace.to_dict(duration), default=str), "trace.json")
+            _writer.submit((name, finish))
+        return False
+
+def operation(name: str, force_profile: bool = False):
+    """Sync/async context manager: maybe profile, and trace if slower than slow_operation_ms."""
+    return _Operation(name, force_profile)
+
+@asynccontextmanager
+async def background_job(name: str):
+    with operation(f"job {name}"):
+        yield
+
+class ProfilingMiddleware:
+    """ASGI middleware wrapping each HTTP request in a profiler operation."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path", "").startswith("/api/profiling"):
+            return await self.app(scope, receive, send)
+        forced = any(k == PROFILE_HEADER and v not in (b"", b"0") for k, v in scope.get("headers", []))
+        with operation(f"{scope.get('method', '')} {scope.get('path', '')}", force_profile=forced):
+            await self.app(scope, receive, send)
@@ -0,0 +1,194 @@
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from ..models import ActionLog, Folder, ADGroup
+from ..websocket_manager import manager
+from .ad_service import ADService
+from .archive_service import REMOVED_STATUSES
+from ..logging_config import get_logger
+import asyncio
+import re
+
+log = get_logger("provision")
+
+# Default server context for folders above any [SERVER] node
+DEFAULT_SERVER = "SERVER01"
+
+# "[FS01 | D:\\Data]" -> FS01, the same rule SmartInput uses for group names
+_SERVER_NODE = re.compile(r"^\[\s*([^|\s\]]+)")
+
+# Seconds to wait for an agent to answer one create_folder
+CREATE_FOLDER_TIMEOUT = 10.0
+
+# Bound parameters per IN (...) lookup; SQLite allows 999 in older builds
+LOOKUP_CHUNK = 500
+
+class PlanStep:
+    """One thing /execute does: create a folder on an agent, or an AD group."""
+
+    __slots__ = ("kind", "target", "server", "node", "row_id")
+
+    def __init__(self, kind: str, target: str, server: str = None, node: str = None):
+        self.kind = kind # folder, group
+        self.target = target # Folder path or group name
+        self.server = server # Agent for folder steps
+        self.node = node # Tree node the step came from (group descriptions)
+        self.row_id = None # Stale ad_groups row to take over (diff mode)
+
+    def to_dict(self):
+        return {"kind": self.kind, "target": self.target, "server": self.server}
+
+def server_name(node_name: str) -> str:
+    """Agent a server node targets: SmartInput sends the whole "[FS01 | D:\\Data]" line."""
+    match = _SERVER_NODE.match(node_name.strip())
+    return match.group(1) if match else node_name
+
+def compile_tree(tree):
+    """Flatten an execution tree into its steps, in the order /execute has always run them.
+
+    Each folder comes before its own groups, which come before its children.
+    Server nodes only switch the target agent and reset the path.
+    """
+    plan = []
+    stack = [(node, "", DEFAULT_SERVER) for node in reversed(tree)]
+    while stack:
+        node, parent_path, server = stack.pop()
+        if node.type == 'server':
+            server = server_name(node.name)
+            path = ""
+        else:
+            path = f"{parent_path}\\{node.name}" if parent_path else node.name
+            plan.append(PlanStep("folder", path, server, node.name))
+        for group_name in node.groups:
+            plan.append(PlanStep("group", group_name, None, node.name))
+        for child in reversed(node.children):
+            stack.append((child, path, server))
+    return plan
+
+def _chunks(items):
+    items = list(items)
+    for i in range(0, len(items), LOOKUP_CHUNK):
+        yield items[i:i + LOOKUP_CHUNK]
+
+def _live(query, model):
+    # Rows from discovery scans or archived actions have no action; rows of
+    # failed / rolled back actions don't count as present
+    return (query.outerjoin(ActionLog, model.action_id == ActionLog.id)
+                 .filter(or_(model.action_id.is_(None), ActionLog.status.notin_(REMOVED_STATUSES))))
+
+def diff_plan(db: Session, plan):
+    """Split a plan into (todo, skipped) against the folders and ad_groups inventory.
+
+    Folders match on (server, path), which covers earlier provisioning and
+    scanned shares; groups match on name. Duplicates within the plan are
+    skipped too.
+    """
+    folder_paths = {}
+    for step in plan:
+        if step.kind == "folder":
+            folder_paths.setdefault(step.server, set()).add(step.target)
+    known_folders = set()
+    for server, paths in folder_paths.items():
+        for chunk in _chunks(paths):
+            rows = _live(db.query(Folder.path), Folder).filter(Folder.server == server, Folder.path.in_(chunk))
+            known_folders.update((server, path) for path, in rows)
+
+    group_names = {step.target for step in plan if step.kind == "group"}
+    known_groups, stale_groups = set(), {}
+    for chunk in _chunks(group_names):
+        rows = (db.query(ADGroup.id, ADGroup.name, ActionLog.status)
+                  .outerjoin(ActionLog, ADGroup.action_id == ActionLog.id)
+                  .filter(ADGroup.name.in_(chunk)))
+        for row_id, name, status in rows:
+            if status in REMOVED_STATUSES:
+                stale_groups[name] = row_id # names are unique, so a re-create reuses the row
+            else:
+                known_groups.add(name)
+
+    todo, skipped, seen = [], [], set()
+    for step in plan:
+        key = (step.kind, step.server, step.target)
+        if key in seen or (step.server, step.target) in known_folders or \
+                (step.kind == "group" and step.target in known_groups):
+            skipped.append(step)
+            continue
+        seen.add(key)
+        if step.kind == "group":
+            step.row_id = stale_groups.get(step.target)
+        todo.append(step)
+    return todo, skipped
+
+def _existing_groups(db: Session, names):
+    """{name: ad_groups row id} for names the inventory already has a row for."""
+    found = {}
+    for chunk in _chunks(names):
+        found.update((name, row_id) for row_id, name in db.query(ADGroup.id, ADGroup.name).filter(ADGroup.name.in_(chunk)))
+    return found
+
+async def _create_folders(server: str, items):
+    """Send create_folder for each (step, row id) in order; returns the row ids the agent made."""
+    created = []
+    for step, row_id in items:
+        cmd = {
+            "type": "create_folder",
+            "path": step.target,
+            "server": server
+        }
+        if server not in manager.active_connections:
+            # Fallback broadcast, so it still works if the agent name doesn't match.
+            # Nobody answers it, so the folder isn't known to be ours.
+            await manager.broadcast(cmd)
+            continue
+        try:
+            response = await manager.send_command(server, cmd, timeout=CREATE_FOLDER_TIMEOUT)
+        except asyncio.TimeoutError:
+            log.warning("No answer to create_folder %s from %s", step.target, server,
+                        extra={"agent": server, "path": step.target})
+            continue
+        # "ignored" = it was already there
+        if ((response or {}).get("result") or {}).get("status") == "success":
+            created.append(row_id)
+    return created
+
+async def run_plan(db: Session, action: ActionLog, plan):
+    """Record and carry out each step under action (the caller commits the action itself).
+
+    Rows are marked created only for what AD or the agent reports having
+    made, since that is all a rollback may remove. Groups AD refuses (e.g. the
+    name is taken) get no row. Folder rows are committed before the first
+    create_folder goes out, so nothing reaches disk without a record.
+    """
+    ad_service = ADService(db)
+    group_steps = [s for s in plan if s.kind == "group"]
+    existing = _existing_groups(db, {s.target for s in group_steps if s.row_id is None})
+    recorded = set()
+    for step in group_steps:
+        if step.target in recorded:
+            continue # listed twice in the plan
+        if not ad_service.create_group(step.target, description=f"Group for {step.node}"):
+            continue
+        recorded.add(step.target)
+        # Names are unique: a group that has a row from earlier (or a scan) takes it over
+        row_id = step.row_id if step.row_id is not None else existing.get(step.target)
+        if row_id is not None:
+            db.query(ADGroup).filter(ADGroup.id == row_id).update(
+                {ADGroup.action_id: action.id, ADGroup.type: "RW", ADGroup.created: True},
+                synchronize_session=False)
+        else:
+            db.add(ADGroup(name=step.target, type="RW", action_id=action.id, created=True))
+
+    rows = []
+    for step in plan:
+        if step.kind == "folder":
+            rows.append((step, Folder(path=step.target, server=step.server, action_id=action.id, created=False)))
+    db.add_all(row for _, row in rows)
+    db.flush() # ids, read before the commit expires the rows
+    by_server = {}
+    for step, row in rows:
+        by_server.setdefault(step.server, []).append((step, row.id))
+    db.commit()
+
+    # Each agent gets its folders in plan order (parents first), agents in parallel
+    results = await asyncio.gather(*[_create_folders(server, items) for server, items in by_server.items()])
+    for chunk in _chunks(row_id for created in results for row_id in created):
+        db.query(Folder).filter(Folder.id.in_(chunk)).update({Folder.created: True}, synchronize_session=False)
+    db.commit()
@@ -0,0 +1,153 @@
+"""Read-through cache of encoded responses for hot read endpoints.
+
+    return result_cache.json_response("search", {"q": q}, ("folders", "ad_groups"), build)
+
+Entries are keyed by endpoint + normalized parameters and hold the JSON body,
+so a hit skips both the query and serialization. Each entry remembers the
+generation of every table it was read from; an entry is only served while
+all of them are unchanged. There is no TTL.
+
+Generations bump after a commit that wrote the table. Writes are tracked on
+SessionLocal sessions: ORM flushes (after_flush) and insert / update / delete
+statements run through Session.execute or Query.update/delete (do_orm_execute),
+which covers ingest, provisioning, rollback and archiving. Writes on a raw
+connection must call bump() themselves; the heartbeat flush bumps "agents"
+explicitly as well.
+
+Generations are read *before* the query runs. A write that commits while a
+result is being built bumps afterwards, so that result is stored under the old
+generation (or not stored at all) and is never served: no stale reads, at
+worst one extra miss.
+
+Generations are per process, like the rest of the master's in-memory state.
+Memory is bounded by result_cache_mb (LRU by encoded size).
+"""
+from fastapi import Response
+from sqlalchemy import event
+from ..database import SessionLocal
+from . import app_settings
+from .. import metrics
+from collections import OrderedDict
+import json
+import threading
+
+# Bodies above this share of the budget aren't cached at all
+MAX_ENTRY_FRACTION = 0.25
+
+_TOUCHED = "result_cache_touched"
+
+# Pseudo-table every entry depends on, bumped for writes to unknown tables
+ANY_TABLE = "*"
+
+requests = metrics.Counter(
+    "permitflow_result_cache_requests_total", "Result cache lookups (stale = entry dropped after a write)",
+    labels=("endpoint", "outcome"))
+evictions = metrics.Counter(
+    "permitflow_result_cache_evictions_total", "Entries evicted to stay within result_cache_mb")
+
+def _encode(value) -> bytes:
+    # Same output as FastAPI's JSONResponse
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+class ResultCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generations = {} # table -> int
+        self._entries = OrderedDict() # key -> (generations, body); most recent last
+        self._bytes = 0
+
+    # --- Generations ---
+
+    def bump(self, *tables):
+        """Mark tables as changed (call after the write is committed)."""
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+
+    # --- Entries ---
+
+    def get(self, endpoint: str, params: dict, tables, build):
+        """Encoded body for (endpoint, params); build() returns bytes on a miss."""
+        key = (endpoint, tuple(sorted(params.items())))
+        tables = (ANY_TABLE, *tables)
+        with self._lock:
+            current = tuple(self._generations.get(t, 0) for t in tables)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == current:
+                self._entries.move_to_end(key)
+                requests.inc(endpoint=endpoint, outcome="hit")
+                return entry[1]
+            if entry is not None:
+                self._drop(key)
+        requests.inc(endpoint=endpoint, outcome="stale" if entry is not None else "miss")
+
+        body = build() # outside the lock; `current` was taken before the query
+        limit = app_settings.get_float("result_cache_mb", 32) * 1024 * 1024
+        if len(body) > limit * MAX_ENTRY_FRACTION:
+            return body
+        with self._lock:
+            # Written to meanwhile: the body may predate the write, don't keep it
+            if tuple(self._generations.get(t, 0) for t in tables) != current:
+                return body
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (current, body)
+            self._bytes += len(body)
+            while self._bytes > limit and self._entries:
+                self._drop(next(iter(self._entries)))
+                evictions.inc()
+        return body
+
+    def json_response(self, endpoint: str, params: dict, tables, build):
+        """Response with build()'s result as JSON (bytes from build() are sent as is)."""
+        def encoded():
+            value = build()
+            return value if isinstance(value, bytes) else _encode(value)
+        return Response(self.get(endpoint, params, tables, encoded), media_type="application/json")
+
+    def _drop(self, key):
+        _, body = self._entries.pop(key)
+        self._bytes -= len(body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def size(self):
+        return {"entries": len(self._entries), "bytes": self._bytes}
+
+cache = ResultCache()
+
+# --- Write tracking on SessionLocal sessions ---
+
+@event.listens_for(SessionLocal, "after_flush")
+def _after_flush(session, flush_context):
+    touched = session.info.setdefault(_TOUCHED, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        touched.add(obj.__table__.name)
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _do_orm_execute(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        table = getattr(state.statement.table, "name", None)
+        touched = state.session.info.setdefault(_TOUCHED, set())
+        if table is None:
+            touched.add(ANY_TABLE) # can't tell which; invalidate everything
+        else:
+            touched.add(table)
+
+@event.listens_for(SessionLocal, "after_commit")
+def _after_commit(session):
+    touched = session.info.pop(_TOUCHED, None)
+    if touched:
+        cache.bump(*touched)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _after_rollback(session):
+    session.info.pop(_TOUCHED, None)
+
+metrics.Gauge("permitflow_result_cache_bytes", "Encoded bytes held by the result cache",
+              callback=lambda: cache.size()["bytes"])
+metrics.Gauge("permitflow_result_cache_entries", "Entries held by the result cache",
+              callback=lambda: cache.size()["entries"])
@@ -0,0 +1,218 @@
+from sqlalchemy.orm import Session
+from ..database import SessionLocal
+from ..models import ActionLog, Folder, ADGroup, RollbackStep
+from ..websocket_manager import manager
+from .ad_service import ADService
+from datetime import datetime
+import asyncio
+
+# Max folders per delete_folders command sent to one agent
+FOLDER_BATCH_SIZE = 250
+
+# Actions currently being rolled back in this process
+_running = set()
+
+def _depth(path: str) -> int:
+    return path.count("\\")
+
+def build_journal(db: Session, action: ActionLog):
+    """Create the undo journal for an action (once) and return its steps in order.
+
+    Folders go deepest-first so children are removed before their parents,
+    then groups, which only make sense to drop once their folders are gone.
+    Only items this action created are undone: folders the agent found already
+    there and groups AD already had are left alone.
+    """
+    steps = db.query(RollbackStep).filter(RollbackStep.action_id == action.id).order_by(RollbackStep.seq).all()
+    if steps:
+        return steps
+
+    seq = 0
+    seen = set()
+    folders = [f for f in action.created_folders if f.created]
+    for folder in sorted(folders, key=lambda f: _depth(f.path), reverse=True):
+        if (folder.server, folder.path) in seen:
+            continue
+        seen.add((folder.server, folder.path))
+        steps.append(RollbackStep(action_id=action.id, seq=seq, kind="folder", target=folder.path, server=folder.server))
+        seq += 1
+
+    for group in action.created_groups:
+        if not group.created:
+            continue
+        steps.append(RollbackStep(action_id=action.id, seq=seq, kind="group", target=group.name))
+        seq += 1
+
+    db.add_all(steps)
+    db.commit()
+    return steps
+
+class _Step:
+    """Plain copy of a journal row, safe to hand between the event loop and worker threads."""
+
+    __slots__ = ("id", "kind", "target", "server", "status")
+
+    def __init__(self, row: RollbackStep):
+        self.id = row.id
+        self.kind = row.kind
+        self.target = row.target
+        self.server = row.server
+        self.status = row.status
+
+def _prepare(action_id: int):
+    """Load the action, build its journal and mark it rolling_back. Returns (early result or None, steps)."""
+    db = SessionLocal()
+    try:
+        action = db.query(ActionLog).filter(ActionLog.id == action_id).first()
+        if not action:
+            return {"status": "failed", "error": "Action not found"}, None
+        if action.status == "rolled_back":
+            return {"status": "rolled_back", "id": action_id}, None
+        steps = [_Step(s) for s in build_journal(db, action)]
+        action.status = "rolling_back"
+        db.commit()
+        return None, steps
+    finally:
+        db.close()
+
+def _journal(outcomes: dict):
+    """Record {step id: error or None} in one transaction on a session of its own."""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        for step_id, error in outcomes.items():
+            db.query(RollbackStep).filter(RollbackStep.id == step_id).update(
+                {RollbackStep.status: "failed" if error else "done", RollbackStep.error: error,
+                 RollbackStep.updated_at: now}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def _delete_groups(names):
+    db = SessionLocal()
+    try:
+        ad = ADService(db)
+    finally:
+        db.close()
+    return ad.delete_groups(names)
+
+async def _undo_folders(server: str, steps):
+    if server not in manager.active_connections:
+        await asyncio.to_thread(_journal, {s.id: "Agent not connected" for s in steps})
+        return
+
+    for i in range(0, len(steps), FOLDER_BATCH_SIZE):
+        batch = steps[i:i + FOLDER_BATCH_SIZE]
+        try:
+            response = await manager.send_command(server, {
+                "type": "delete_folders",
+                "paths": [s.target for s in batch]
+            }, timeout=10.0 + 0.05 * len(batch))
+            result = (response or {}).get("result", {})
+            if result.get("status") != "success":
+                raise RuntimeError(result.get("error", "Agent rejected delete_folders"))
+            outcome = result.get("results", {})
+            outcomes = {}
+            for step in batch:
+                item = outcome.get(step.target, {})
+                ok = item.get("status") in ("deleted", "missing")
+                outcomes[step.id] = None if ok else item.get("error", "No result from agent")
+        except asyncio.TimeoutError:
+            outcomes = {s.id: "Timeout waiting for agent" for s in batch}
+        except Exception as e:
+            outcomes = {s.id: str(e) for s in batch}
+        # Journal each batch so an interrupted rollback resumes where it stopped
+        # (a parent whose child failed just fails its own rmdir as "not empty")
+        await asyncio.to_thread(_journal, outcomes)
+
+async def _undo_groups(steps):
+    results = await asyncio.to_thread(_delete_groups, [s.target for s in steps])
+    await asyncio.to_thread(_journal, {s.id: results.get(s.target) for s in steps})
+
+def _finish(action_id: int):
+    """Drop inventory rows for everything that is really gone and settle the action's status."""
+    db = SessionLocal()
+    try:
+        action = db.query(ActionLog).filter(ActionLog.id == action_id).first()
+        steps = db.query(RollbackStep).filter(RollbackStep.action_id == action_id).order_by(RollbackStep.seq).all()
+        done_folders = {(s.server, s.target) for s in steps if s.kind == "folder" and s.status == "done"}
+        for folder in list(action.created_folders):
+            if (folder.server, folder.path) in done_folders:
+                db.delete(folder)
+        done_groups = {s.target for s in steps if s.kind == "group" and s.status == "done"}
+        for group in list(action.created_groups):
+            if group.name in done_groups:
+                db.delete(group)
+
+        failed = [{"kind": s.kind, "target": s.target, "server": s.server, "error": s.error}
+                  for s in steps if s.status != "done"]
+        action.status = "rolled_back" if not failed else "rollback_partial"
+        db.commit()
+        return {
+            "status": action.status,
+            "id": action_id,
+            "folders_removed": len(done_folders),
+            "groups_removed": len(done_groups),
+            "failed": failed
+        }
+    finally:
+        db.close()
+
+def _remaining_folders(action_id: int) -> int:
+    db = SessionLocal()
+    try:
+        return (db.query(RollbackStep)
+                  .filter(RollbackStep.action_id == action_id, RollbackStep.kind == "folder",
+                          RollbackStep.status != "done")
+                  .count())
+    finally:
+        db.close()
+
+async def rollback(action_id: int):
+    """Undo an action from its journal. DB work runs in worker threads, each on its own session."""
+    if action_id in _running:
+        return {"status": "running", "id": action_id}
+
+    _running.add(action_id)
+    try:
+        early, steps = await asyncio.to_thread(_prepare, action_id)
+        if early is not None:
+            return early
+
+        todo = [s for s in steps if s.status != "done"]
+
+        # Folders: one sequential batch stream per agent, all agents in parallel
+        by_server = {}
+        for step in todo:
+            if step.kind == "folder":
+                by_server.setdefault(step.server, []).append(step)
+        await asyncio.gather(*[_undo_folders(server, s) for server, s in by_server.items()])
+
+        group_steps = [s for s in todo if s.kind == "group"]
+        if group_steps:
+            # Groups carry the ACLs of this action's folders; while any of those
+            # folders is still there, keep the groups (a later retry deletes them)
+            remaining = await asyncio.to_thread(_remaining_folders, action_id)
+            if remaining:
+                error = f"Kept: {remaining} folder(s) of this action were not removed"
+                await asyncio.to_thread(_journal, {s.id: error for s in group_steps})
+            else:
+                await _undo_groups(group_steps)
+
+        return await asyncio.to_thread(_finish, action_id)
+    finally:
+        _running.discard(action_id)
+
+def journal_status(db: Session, action_id: int):
+    steps = db.query(RollbackStep).filter(RollbackStep.action_id == action_id).order_by(RollbackStep.seq).all()
+    counts = {"pending": 0, "done": 0, "failed": 0}
+    for step in steps:
+        counts[step.status] = counts.get(step.status, 0) + 1
+    return {
+        "id": action_id,
+        "running": action_id in _running,
+        "steps": len(steps),
+        **counts,
+        "failed_steps": [{"kind": s.kind, "target": s.target, "server": s.server, "error": s.error}
+                         for s in steps if s.status == "failed"]
+    }
@@ -0,0 +1,337 @@
+"""Scheduled share scans, so inventory stays fresh without anyone clicking Scan.
+
+Every agent is scanned once per scan_interval_hours (or its own interval). To
+keep the fleet from scanning at once, each agent gets a fixed phase inside the
+interval, taken from a hash of its id, and its scans land on
+phase + k * interval: the next slot at least half an interval after its last
+successful scan. Manual scans (POST /agents/{id}/scan) count as well, and an
+agent keeps its slot whenever it was last scanned.
+
+On top of that:
+  - scans start only inside the agent's maintenance window (scan_window, or
+    the agent's own); agents that came due outside it are spread over the
+    first half of the window instead of all starting when it opens
+  - at most scan_concurrency scans run at once, fleet-wide, due first
+  - offline agents are skipped and stay due until they reconnect
+  - a failed scan is retried after RETRY_AFTER, doubling per failure, never
+    later than the regular slot
+
+Everything the schedule depends on (last scan, failures, per-agent settings)
+is in scan_schedules, so due times survive master restarts.
+"""
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from ..database import SessionLocal
+from ..models import Agent, Folder, ScanSchedule
+from ..websocket_manager import manager
+from . import app_settings, profiler
+from .. import metrics
+from ..logging_config import get_logger
+from datetime import datetime
+import asyncio
+import hashlib
+import re
+import time
+
+log = get_logger("scan")
+
+# How often due agents are looked for
+TICK_SECONDS = 30
+
+# Agents never scanned are spread over this much of the interval at most
+INITIAL_SPREAD_HOURS = 1
+
+# First retry after a failed scan; doubles per consecutive failure
+RETRY_AFTER = 15 * 60
+
+# list_shares on a busy file server can take a while
+SCAN_TIMEOUT = 120.0
+
+scheduled_scans = metrics.Counter(
+    "permitflow_scheduled_scans_total", "Scans started by the scheduler", labels=("outcome",))
+
+scans_waiting = metrics.Gauge(
+    "permitflow_scan_scheduler_waiting", "Due agents not scanned yet", labels=("reason",))
+
+_WINDOW = re.compile(r"^(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})$")
+
+def parse_window(text):
+    """'22:00-06:00,12:00-13:00' -> [(1320, 360), (720, 780)] in minutes; [] = any time.
+
+    Raises ValueError for anything else.
+    """
+    text = (text or "").strip()
+    if text.lower() in ("", "any"):
+        return []
+    windows = []
+    for part in text.split(","):
+        match = _WINDOW.match(part.strip())
+        if not match:
+            raise ValueError(f"Invalid window {part.strip()!r}, expected HH:MM-HH:MM")
+        h1, m1, h2, m2 = map(int, match.groups())
+        if h1 > 23 or h2 > 23 or m1 > 59 or m2 > 59:
+            raise ValueError(f"Invalid time in window {part.strip()!r}")
+        windows.append((h1 * 60 + m1, h2 * 60 + m2))
+    return windows
+
+def _fraction(agent_id: str) -> float:
+    # Stable across restarts and processes (unlike hash())
+    return int(hashlib.sha1(agent_id.encode("utf-8")).hexdigest()[:8], 16) / 2 ** 32
+
+def _ts(when: datetime) -> float:
+    return (when - datetime(1970, 1, 1)).total_seconds() # naive UTC, as stored
+
+def _utc(ts: float) -> datetime:
+    return datetime.utcfromtimestamp(ts)
+
+def _next_slot(last_scan: float, interval: float, phase: float) -> float:
+    # First phase + k * interval at least half an interval after last_scan
+    k = (last_scan + interval / 2 - phase) // interval + 1
+    return k * interval + phase
+
+def due_at(schedule, agent_id: str, interval: float) -> float:
+    """When agent_id is next due (epoch seconds), given its scan_schedules row."""
+    fraction = _fraction(agent_id)
+    regular = None
+    if schedule.last_scan_at is not None:
+        regular = _next_slot(_ts(schedule.last_scan_at), interval, fraction * interval)
+    if schedule.last_status == "failed" and schedule.last_attempt_at is not None:
+        retry = _ts(schedule.last_attempt_at) + min(RETRY_AFTER * 2 ** max((schedule.failures or 1) - 1, 0), interval)
+        return retry if regular is None else min(retry, regular)
+    if regular is not None:
+        return regular
+    first_seen = _ts(schedule.first_seen) if schedule.first_seen else time.time()
+    return first_seen + fraction * min(interval, INITIAL_SPREAD_HOURS * 3600)
+
+def window_release(windows, due: float, now: float, fraction: float):
+    """Earliest time a scan due at `due` may start in the window we're in now, or None outside all windows."""
+    if not windows:
+        return due
+    local = datetime.fromtimestamp(now)
+    minute = local.hour * 60 + local.minute
+    for start, end in windows:
+        length = (end - start) % 1440 or 1440
+        into = (minute - start) % 1440
+        if into < length:
+            opened = now - into * 60 - local.second - local.microsecond / 1e6
+            if due >= opened:
+                return due # came due inside the window
+            return opened + fraction * length * 30 # spread over the first half
+    return None
+
+def _as_dict(agent_id, status, schedule, interval, windows, state, due):
+    return {
+        "agent_id": agent_id,
+        "agent_status": status,
+        "enabled": schedule.enabled is not False,
+        "interval_hours": schedule.interval_hours,
+        "window": schedule.window,
+        "effective_interval_hours": round(interval / 3600, 3) if interval else 0,
+        "effective_window": ",".join(f"{s // 60:02d}:{s % 60:02d}-{e // 60:02d}:{e % 60:02d}" for s, e in windows) or "any",
+        "state": state,
+        "next_due_at": _utc(due).isoformat() if due is not None else None,
+        "last_scan_at": schedule.last_scan_at,
+        "last_attempt_at": schedule.last_attempt_at,
+        "last_status": schedule.last_status,
+        "last_error": schedule.last_error,
+        "failures": schedule.failures or 0,
+        "share_count": schedule.share_count,
+    }
+
+def ingest_shares(db, agent_id: str, shares: list):
+    """Record shares reported by an agent's list_shares as Folder rows (existing ones are skipped)."""
+    start = time.perf_counter()
+    for share in shares:
+        name = share.get("Name")
+        path = share.get("Path")
+
+        # Check if already exists
+        exists = db.query(Folder).filter(Folder.server == agent_id, Folder.path == path).first()
+        if not exists:
+            folder = Folder(
+                path=path,
+                server=agent_id,
+                # We don't have an action_id for discovered folders
+            )
+            db.add(folder)
+
+    db.commit()
+    elapsed = time.perf_counter() - start
+    metrics.scan_ingest_seconds.observe(elapsed)
+    metrics.scan_rows.inc(len(shares), agent=agent_id)
+    metrics.scan_rows_per_second.set(len(shares) / elapsed if elapsed > 0 else 0, agent=agent_id)
+    return len(shares)
+
+def _ingest(agent_id: str, shares: list):
+    db = SessionLocal()
+    try:
+        return ingest_shares(db, agent_id, shares)
+    finally:
+        db.close()
+
+def record_scan(agent_id: str, error: str = None, share_count: int = None):
+    """Store the outcome of a scan attempt (error None = success)."""
+    now = datetime.utcnow()
+    if error is None:
+        values = {"last_scan_at": now, "last_attempt_at": now, "last_status": "success", "last_error": None,
+                  "failures": 0, "share_count": share_count}
+        update = dict(values)
+    else:
+        values = {"last_attempt_at": now, "last_status": "failed", "last_error": error, "failures": 1}
+        update = dict(values, failures=ScanSchedule.failures + 1)
+    db = SessionLocal()
+    try:
+        db.execute(insert(ScanSchedule).values(agent_id=agent_id, first_seen=now, **values)
+                   .on_conflict_do_update(index_elements=[ScanSchedule.agent_id], set_=update))
+        db.commit()
+    finally:
+        db.close()
+
+async def scan_agent(agent_id: str, timeout: float = SCAN_TIMEOUT):
+    """Run list_shares on a connected agent, ingest and record the result.
+
+    Returns {"status": "success", "count", "shares"} or {"status": "failed", "error"}.
+    Nothing is recorded when the agent isn't connected.
+    """
+    try:
+        response = await manager.send_command(agent_id, {"type": "list_shares"}, timeout=timeout)
+        if response is None:
+            return {"status": "failed", "error": "Agent not connected"}
+        result = response.get("result", {})
+        if result.get("status") == "success":
+            shares = result.get("shares", [])
+            await asyncio.to_thread(_ingest, agent_id, shares)
+            outcome = {"status": "success", "count": len(shares), "shares": shares}
+        else:
+            outcome = {"status": "failed", "error": result.get("error", "Unknown error")}
+    except asyncio.TimeoutError:
+        outcome = {"status": "failed", "error": "Timeout waiting for agent"}
+    except Exception as e:
+        outcome = {"status": "failed", "error": str(e)}
+    await asyncio.to_thread(record_scan, agent_id, outcome.get("error"), outcome.get("count"))
+    return outcome
+
+class ScanScheduler:
+    def __init__(self):
+        self._running = {} # agent_id -> task
+        self._queue = [] # due agents left over from the last tick, most overdue first
+
+    def running(self) -> int:
+        return len(self._running)
+
+    def _load(self):
+        """All known agents with their schedule rows; creates rows for new agents."""
+        db = SessionLocal()
+        try:
+            missing = db.execute(select(Agent.id).outerjoin(ScanSchedule, ScanSchedule.agent_id == Agent.id)
+                                 .where(ScanSchedule.agent_id.is_(None))).scalars().all()
+            if missing:
+                now = datetime.utcnow()
+                db.execute(insert(ScanSchedule).on_conflict_do_nothing(),
+                           [{"agent_id": agent_id, "first_seen": now} for agent_id in missing])
+                db.commit()
+            rows = db.execute(select(Agent.id, Agent.status, ScanSchedule)
+                              .join(ScanSchedule, ScanSchedule.agent_id == Agent.id)
+                              .order_by(Agent.id)).all()
+            db.expunge_all()
+            return rows
+        finally:
+            db.close()
+
+    def _plan(self, rows, now: float):
+        """(agent_id, status, schedule, interval, windows, state, due) per agent."""
+        default_hours = app_settings.get_float("scan_interval_hours", 24)
+        try:
+            default_windows = parse_window(app_settings.get_setting("scan_window", ""))
+        except ValueError as e:
+            log.warning("Ignoring scan_window setting: %s", e, extra={"sample_key": "scan.window"})
+            default_windows = []
+        for agent_id, status, schedule in rows:
+            hours = schedule.interval_hours if schedule.interval_hours is not None else default_hours
+            interval = max(hours, 0) * 3600
+            windows = default_windows
+            if schedule.window:
+                try:
+                    windows = parse_window(schedule.window)
+                except ValueError:
+                    pass # rejected by the API; keep the global window
+            if schedule.enabled is False or interval <= 0:
+                yield agent_id, status, schedule, interval, windows, "disabled", None
+                continue
+            due = due_at(schedule, agent_id, interval)
+            if agent_id in self._running:
+                state = "scanning"
+            elif due > now:
+                state = "scheduled"
+            elif agent_id not in manager.active_connections:
+                state = "offline"
+            else:
+                release = window_release(windows, due, now, _fraction(agent_id))
+                state = "due" if release is not None and release <= now else "waiting_window"
+            yield agent_id, status, schedule, interval, windows, state, due
+
+    def status(self):
+        """Schedule of every known agent (GET /agents/schedule)."""
+        now = time.time()
+        return [_as_dict(*entry) for entry in self._plan(self._load(), now)]
+
+    async def _scan(self, agent_id: str):
+        try:
+            async with profiler.background_job("scheduled_scan"):
+                result = await scan_agent(agent_id)
+            scheduled_scans.inc(outcome=result["status"])
+            if result["status"] == "success":
+                log.info("Scheduled scan of %s found %d shares", agent_id, result["count"],
+                         extra={"agent": agent_id, "sample_key": "scan.success"})
+            else:
+                log.warning("Scheduled scan of %s failed: %s", agent_id, result["error"],
+                            extra={"agent": agent_id, "sample_key": "scan.failed"})
+        finally:
+            self._running.pop(agent_id, None)
+            # Hand the slot to the next due agent instead of waiting for the tick
+            self._start_queued()
+
+    def _start_queued(self):
+        budget = max(app_settings.get_int("scan_concurrency", 4), 1) - len(self._running)
+        while budget > 0 and self._queue:
+            agent_id = self._queue.pop(0)
+            if agent_id in self._running or agent_id not in manager.active_connections:
+                continue
+            self._running[agent_id] = asyncio.create_task(self._scan(agent_id))
+            budget -= 1
+
+    async def tick(self):
+        """Start due scans up to the concurrency budget."""
+        rows = await asyncio.to_thread(self._load)
+        now = time.time()
+        due, waiting = [], {"offline": 0, "waiting_window": 0, "budget": 0}
+        for agent_id, _, _, _, _, state, due_time in self._plan(rows, now):
+            if state == "due":
+                due.append((due_time, agent_id))
+            elif state in waiting:
+                waiting[state] += 1
+        due.sort()
+        self._queue = [agent_id for _, agent_id in due]
+        self._start_queued()
+        waiting["budget"] = len(self._queue)
+        for reason, count in waiting.items():
+            scans_waiting.set(count, reason=reason)
+
+    async def run(self):
+        # Let agents reconnect after a restart before deciding who is offline
+        await asyncio.sleep(60)
+        try:
+            while True:
+                try:
+                    await self.tick()
+                except Exception as e:
+                    log.exception("Scan scheduling failed: %s", e)
+                await asyncio.sleep(TICK_SECONDS)
+        finally:
+            for task in list(self._running.values()):
+                task.cancel()
+
+scheduler = ScanScheduler()
+
+scans_running = metrics.Gauge(
+    "permitflow_scan_scheduler_running", "Scheduled scans in progress", callback=scheduler.running)
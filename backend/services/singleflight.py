@@ -0,0 +1,50 @@
+"""Coalesce concurrent identical async calls into one.
+
+    user_checks = SingleFlight("ad_check_user")
+    result = await user_checks.do(("check_user", name), lambda: asyncio.to_thread(ad.check_user_exists, name))
+
+The first caller for a key (the leader) starts the work; callers arriving while
+it is still running await the same task instead of starting their own. Nothing
+is cached: once the task finishes the key is free again. Every caller gets the
+same result object (or exception), so treat it as read-only.
+"""
+import asyncio
+
+from .. import metrics
+
+calls = metrics.Counter(
+    "permitflow_singleflight_calls_total", "Calls through single-flight groups (leader = did the work)",
+    labels=("group", "outcome"))
+
+_groups = []
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight = {} # key -> asyncio.Task
+        _groups.append(self)
+
+    async def do(self, key, fn):
+        """Run fn() (returning an awaitable) unless a call with the same key is already in flight."""
+        task = self._inflight.get(key)
+        if task is not None:
+            calls.inc(group=self.name, outcome="coalesced")
+        else:
+            calls.inc(group=self.name, outcome="leader")
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._finished(key, t))
+        # Shield so one caller going away (client disconnect) doesn't cancel
+        # the work the others are waiting on
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception() # mark retrieved in case every caller went away
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+metrics.Gauge("permitflow_singleflight_in_flight", "Distinct keys currently in flight per group",
+              labels=("group",), callback=lambda: {(g.name,): g.in_flight() for g in _groups})
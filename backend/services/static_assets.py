@@ -0,0 +1,145 @@
+from fastapi import Response, HTTPException
+from fastapi.responses import FileResponse
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from ..logging_config import get_logger
+
+log = get_logger("static")
+
+# Files above this are left out of the manifest (served from disk instead)
+MAX_CACHED_BYTES = 8 * 1024 * 1024
+
+# Below this compression doesn't pay for the extra header/CPU on the client
+MIN_COMPRESS_BYTES = 1024
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml", "application/xml")
+
+# Vite puts content-hashed bundles under /assets, so they never change
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+_brotli_module = False
+
+def _brotli():
+    # Optional dependency (pip install brotli), imported on first build only
+    global _brotli_module
+    if _brotli_module is False:
+        try:
+            import brotli
+            _brotli_module = brotli
+        except ImportError:
+            _brotli_module = None
+    return _brotli_module
+
+class Asset:
+    __slots__ = ("content", "variants", "etag", "media_type", "cache_control")
+
+    def __init__(self, content: bytes, media_type: str, cache_control: str):
+        self.content = content
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.etag = '"' + hashlib.sha256(content).hexdigest()[:32] + '"'
+        self.variants = {} # encoding -> compressed bytes
+        if len(content) >= MIN_COMPRESS_BYTES and media_type.startswith(COMPRESSIBLE_TYPES):
+            brotli = _brotli()
+            if brotli is not None:
+                self._add_variant("br", brotli.compress(content, quality=11))
+            self._add_variant("gzip", gzip.compress(content, compresslevel=9, mtime=0))
+
+    def _add_variant(self, encoding: str, data: bytes):
+        if len(data) < len(self.content):
+            self.variants[encoding] = data
+
+class FrontendManifest:
+    """In-memory index of frontend/dist, built once at startup (see build())."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.assets = {} # "assets/index-abc.js" -> Asset
+        self.large_files = {} # key -> absolute path, for files over MAX_CACHED_BYTES
+        self.ready = False
+
+    def build(self):
+        assets = {}
+        large_files = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if os.path.getsize(path) > MAX_CACHED_BYTES:
+                    large_files[key] = path
+                    continue
+                media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                if media_type.startswith("text/"):
+                    media_type += "; charset=utf-8"
+                cache = IMMUTABLE_CACHE if key.startswith("assets/") else REVALIDATE_CACHE
+                with open(path, "rb") as f:
+                    assets[key] = Asset(f.read(), media_type, cache)
+        self.assets = assets
+        self.large_files = large_files
+        self.ready = "index.html" in assets
+        total = sum(len(a.content) for a in assets.values())
+        log.info("Indexed %d frontend files (%d KB, brotli=%s)", len(assets), total // 1024, "on" if _brotli() else "off")
+
+    def serve_from_disk(self, full_path: str):
+        # Used until build() has finished
+        file_path = os.path.realpath(os.path.join(self.root, full_path))
+        if full_path and file_path.startswith(os.path.realpath(self.root)) and os.path.isfile(file_path):
+            return FileResponse(file_path)
+        if full_path.startswith("assets/"):
+            raise HTTPException(status_code=404, detail="Asset not found")
+        return FileResponse(os.path.join(self.root, "index.html"))
+
+    def get(self, path: str):
+        return self.assets.get(path)
+
+    @property
+    def index(self):
+        return self.assets.get("index.html")
+
+def _accepted_encodings(header: str):
+    accepted = set()
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(token.strip().lower())
+    return accepted
+
+def _etag_matches(if_none_match: str, asset: Asset) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    base = asset.etag.strip('"')
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        # Also accept the per-encoding tags we hand out
+        if tag.strip('"').split("-")[0] == base:
+            return True
+    return False
+
+def serve(asset: Asset, request_headers) -> Response:
+    headers = {"Cache-Control": asset.cache_control, "Vary": "Accept-Encoding"}
+
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, asset):
+        headers["ETag"] = asset.etag
+        return Response(status_code=304, headers=headers)
+
+    body = asset.content
+    etag = asset.etag
+    if asset.variants:
+        accepted = _accepted_encodings(request_headers.get("accept-encoding", ""))
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in asset.variants:
+                body = asset.variants[encoding]
+                headers["Content-Encoding"] = encoding
+                # Strong ETags must differ per representation
+                etag = f'{asset.etag[:-1]}-{"br" if encoding == "br" else "gz"}"'
+                break
+    headers["ETag"] = etag
+    return Response(content=body, media_type=asset.media_type, headers=headers)
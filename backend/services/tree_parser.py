@@ -0,0 +1,164 @@
+"""Streaming parser for bulk tree submissions (POST /execute/bulk).
+
+Two line-based formats, both turned straight into the flat plan /execute runs
+(see provision_service.compile_tree), without building a nested tree:
+
+  text   the indented text SmartInput accepts. "[FS01 | D:\\Data]" lines switch
+         the target agent to FS01 (provision_service.server_name, the same rule
+         /execute applies to SmartInput's server nodes), every other line is a
+         folder nested under the closest less-indented line above it, and
+         folders get the usual S_<server>_<name>_R / _W groups.
+
+  rows   NDJSON, one [depth, name, groups, type] array per line; groups
+         (default []) and type ("folder" or "server", default "folder") are
+         optional. depth starts at 0 and can go at most one level deeper per row.
+
+Lines are fed as they arrive, with a stack of open parents instead of
+recursion, so template size and depth only cost memory for the plan itself.
+Mistakes raise TreeParseError with the line and column.
+"""
+import codecs
+import hashlib
+import json
+import re
+
+from .provision_service import PlanStep, DEFAULT_SERVER, server_name
+
+# Whole-body and per-line limits
+MAX_BODY_BYTES = 64 * 1024 * 1024
+MAX_LINE_CHARS = 4096
+
+# Server shown in generated group names before any [SERVER] line (as in SmartInput)
+GROUP_DEFAULT_SERVER = "SERVER"
+
+_SERVER_LINE = re.compile(r"^\[\s*([^|\s\]]+)")
+_INVALID_NAME_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x08\x0a-\x1f]') # tabs become "_" in text lines
+
+class TreeParseError(ValueError):
+    def __init__(self, message: str, line: int, column: int = 1):
+        super().__init__(f"Line {line}, column {column}: {message}")
+        self.message = message
+        self.line = line
+        self.column = column
+
+class TreeParser:
+    def __init__(self, fmt: str = "text"):
+        if fmt not in ("text", "rows"):
+            raise ValueError(f"Unknown bulk format {fmt!r}")
+        self.fmt = fmt
+        self.plan = []
+        self.roots = 0 # top-level lines, for the action description
+        self.line_no = 0
+        self._stack = [] # open parents: (level, path, server)
+        self._last_depth = -1 # rows format only
+        self._group_server = GROUP_DEFAULT_SERVER
+
+    def feed(self, line: str):
+        self.line_no += 1
+        line = line.rstrip("\r\n")
+        if len(line) > MAX_LINE_CHARS:
+            raise TreeParseError(f"Line longer than {MAX_LINE_CHARS} characters", self.line_no, MAX_LINE_CHARS + 1)
+        if not line.strip():
+            return
+        if self.fmt == "text":
+            self._text_line(line)
+        else:
+            self._row_line(line)
+
+    def _check_name(self, name: str, column: int):
+        bad = _INVALID_NAME_CHARS.search(name)
+        if bad:
+            raise TreeParseError(f"Invalid character {bad.group()!r} in folder name", self.line_no, column + bad.start())
+        if name in (".", ".."):
+            raise TreeParseError(f"Invalid folder name {name!r}", self.line_no, column)
+
+    def _text_line(self, line: str):
+        level = len(line) - len(line.lstrip())
+        name = line.strip()
+        column = level + 1
+        if name.startswith("["):
+            match = _SERVER_LINE.match(name)
+            if not match:
+                raise TreeParseError("Expected [SERVER] or [SERVER | path]", self.line_no, column)
+            self._group_server = match.group(1)
+            self._add(level, name, "server", [])
+            return
+        self._check_name(name, column)
+        safe_name = re.sub(r"\s+", "_", name)
+        groups = [f"S_{self._group_server}_{safe_name}_R", f"S_{self._group_server}_{safe_name}_W"]
+        self._add(level, safe_name, "folder", groups)
+
+    def _row_line(self, line: str):
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise TreeParseError(e.msg, self.line_no, e.colno) from None
+        if not isinstance(row, list) or not 2 <= len(row) <= 4:
+            raise TreeParseError("Expected [depth, name, groups, type] (groups and type optional)", self.line_no)
+        depth, name = row[0], row[1]
+        groups = row[2] if len(row) > 2 and row[2] is not None else []
+        kind = row[3] if len(row) > 3 else "folder"
+        if not isinstance(depth, int) or isinstance(depth, bool) or depth < 0:
+            raise TreeParseError("depth must be a non-negative integer", self.line_no)
+        if depth > self._last_depth + 1:
+            raise TreeParseError(f"depth {depth} skips a level (previous row was at depth {self._last_depth})",
+                                 self.line_no)
+        if not isinstance(name, str) or not name.strip():
+            raise TreeParseError("name must be a non-empty string", self.line_no)
+        if not isinstance(groups, list) or not all(isinstance(g, str) and g for g in groups):
+            raise TreeParseError("groups must be a list of group names", self.line_no)
+        if kind not in ("folder", "server"):
+            raise TreeParseError(f"type must be 'folder' or 'server', not {kind!r}", self.line_no)
+        if kind == "folder":
+            self._check_name(name, 1)
+        self._last_depth = depth
+        self._add(depth, name, kind, groups)
+
+    def _add(self, level: int, name: str, kind: str, groups):
+        # Same path / server rules as compile_tree
+        while self._stack and self._stack[-1][0] >= level:
+            self._stack.pop()
+        if self._stack:
+            _, parent_path, server = self._stack[-1]
+        else:
+            parent_path, server = "", DEFAULT_SERVER
+            self.roots += 1
+        if kind == "server":
+            server = server_name(name)
+            path = ""
+        else:
+            path = f"{parent_path}\\{name}" if parent_path else name
+            self.plan.append(PlanStep("folder", path, server, name))
+        for group_name in groups:
+            self.plan.append(PlanStep("group", group_name, None, name))
+        self._stack.append((level, path, server))
+
+async def parse_stream(chunks, fmt: str = "text"):
+    """Parse an async iterator of body chunks. Returns (parser, sha256 of the body)."""
+    parser = TreeParser(fmt)
+    digest = hashlib.sha256()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    size = 0
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise TreeParseError(f"Body larger than {MAX_BODY_BYTES} bytes", parser.line_no + 1)
+            digest.update(chunk)
+            pending += decoder.decode(chunk)
+            if "\n" not in pending:
+                if len(pending) > MAX_LINE_CHARS:
+                    parser.feed(pending) # raises
+                continue
+            *lines, pending = pending.split("\n")
+            for line in lines:
+                parser.feed(line)
+        pending += decoder.decode(b"", final=True)
+    except UnicodeDecodeError as e:
+        # Lines decoded but not fed yet, plus those in this chunk before the bad bytes
+        line = parser.line_no + pending.count("\n") + e.object[:e.start].count(b"\n") + 1
+        raise TreeParseError("Body is not valid UTF-8", line) from None
+    if pending:
+        parser.feed(pending)
+    return parser, digest.hexdigest()
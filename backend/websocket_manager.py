@@ -1,7 +1,15 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
 from fastapi import WebSocket
 
+from . import metrics, wire
+from .logging_config import get_logger
+from .services import profiler, app_settings
+
 import asyncio
+import time
+import uuid
+
+log = get_logger("ws")
 
 class ConnectionManager:
     def __init__(self):
@@ -9,26 +17,54 @@ class ConnectionManager:
         self.active_connections: Dict[str, WebSocket] = {}
         # Store pending request futures: request_id -> Future
         self.pending_requests: Dict[str, asyncio.Future] = {}
+        # Per-agent queue depths: commands awaiting a response / frames being sent
+        self.awaiting: Dict[str, int] = {}
+        self.sending: Dict[str, int] = {}
+        # Negotiated wire format per agent (protocol 1 JSON until the agent says hello)
+        self.codecs: Dict[str, wire.Codec] = {}
 
     async def connect(self, agent_id: str, websocket: WebSocket):
         await websocket.accept()
         self.active_connections[agent_id] = websocket
-        print(f"Agent connected: {agent_id}")
+        self.codecs[agent_id] = wire.Codec()
+        log.info("Agent connected: %s", agent_id, extra={"agent": agent_id, "sample_key": "ws.connect"})
 
-    def disconnect(self, agent_id: str):
-        if agent_id in self.active_connections:
-            del self.active_connections[agent_id]
-            print(f"Agent disconnected: {agent_id}")
+    def disconnect(self, agent_id: str, websocket: WebSocket = None) -> bool:
+        # With a websocket given, only remove it if the agent hasn't reconnected
+        # on a newer connection in the meantime
+        current = self.active_connections.get(agent_id)
+        if current is None or (websocket is not None and current is not websocket):
+            return False
+        del self.active_connections[agent_id]
+        self.codecs.pop(agent_id, None)
+        log.info("Agent disconnected: %s", agent_id, extra={"agent": agent_id, "sample_key": "ws.disconnect"})
+        return True
+
+    def set_codec(self, agent_id: str, codec: wire.Codec):
+        self.codecs[agent_id] = codec
+
+    async def _send(self, agent_id: str, websocket: WebSocket, message: dict):
+        codec = self.codecs.get(agent_id) or wire.Codec()
+        frame = codec.encode(message)
+        ws_bytes.inc(len(frame), direction="out", encoding=codec.encoding)
+        if isinstance(frame, bytes):
+            await websocket.send_bytes(frame)
+        else:
+            await websocket.send_text(frame)
 
     async def send_personal_message(self, message: dict, agent_id: str):
         if agent_id in self.active_connections:
-            await self.active_connections[agent_id].send_json(message)
+            self.sending[agent_id] = self.sending.get(agent_id, 0) + 1
+            try:
+                await self._send(agent_id, self.active_connections[agent_id], message)
+            finally:
+                self.sending[agent_id] -= 1
             return True
         return False
 
     async def broadcast(self, message: dict):
-        for connection in self.active_connections.values():
-            await connection.send_json(message)
+        for agent_id, connection in list(self.active_connections.items()):
+            await self._send(agent_id, connection, message)
 
     def create_request(self, request_id: str):
         loop = asyncio.get_running_loop()
@@ -43,4 +79,82 @@ class ConnectionManager:
                 future.set_result(data)
             del self.pending_requests[request_id]
 
+    async def send_command(self, agent_id: str, message: dict, timeout: float = 10.0) -> Optional[dict]:
+        """Send a command to one agent and wait for its response.
+
+        Returns None if the agent is not connected. Raises asyncio.TimeoutError
+        if the agent does not answer in time.
+        """
+        if agent_id not in self.active_connections:
+            return None
+        request_id = message.setdefault("request_id", str(uuid.uuid4()))
+        future = self.create_request(request_id)
+        self.awaiting[agent_id] = self.awaiting.get(agent_id, 0) + 1
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            await self.send_personal_message(message, agent_id)
+            response = await asyncio.wait_for(future, timeout=timeout)
+            outcome = "ok"
+            return response
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.agent_command_seconds.observe(elapsed, command=message.get("type", ""), outcome=outcome)
+            profiler.record_span("agent", message.get("type", ""), start, elapsed, agent=agent_id, outcome=outcome)
+            self.awaiting[agent_id] -= 1
+            # Drop the future if nobody resolved it (timeout / send error)
+            self.pending_requests.pop(request_id, None)
+
+class HandshakeLimiter:
+    """Rate limit for new agent connections (GCRA: ws_handshake_rate/s, bursts of ws_handshake_burst).
+
+    A throttled agent is told when to come back. Each one gets its own slot
+    after the current backlog, so a reconnect wave after a master restart is
+    spread out at the admitted rate instead of retrying in lockstep.
+    """
+    MAX_RETRY_AFTER = 300.0
+
+    def __init__(self):
+        self._tat = 0.0 # theoretical arrival time of the next admitted handshake
+        self._next_slot = 0.0 # last retry slot handed out
+
+    def admit(self) -> Optional[float]:
+        """None if the handshake may proceed, else seconds the agent should wait."""
+        rate = app_settings.get_float("ws_handshake_rate", 50)
+        if rate <= 0:
+            return None
+        burst = max(1, app_settings.get_int("ws_handshake_burst", 100))
+        interval = 1.0 / rate
+        now = time.monotonic()
+        tat = max(self._tat, now)
+        # Tolerance for the float sum of intervals, else the burst's last slot can be lost
+        if tat - now <= (burst - 1) * interval + 1e-9:
+            self._tat = tat + interval
+            handshakes.inc(outcome="accepted")
+            return None
+        self._next_slot = max(self._next_slot, tat) + interval
+        handshakes.inc(outcome="throttled")
+        return min(self._next_slot - now, self.MAX_RETRY_AFTER)
+
+ws_bytes = metrics.Counter("permitflow_ws_bytes_total", "Agent WebSocket payload bytes by direction and encoding",
+                           labels=("direction", "encoding"))
+
+handshakes = metrics.Counter("permitflow_ws_handshakes_total", "Agent WebSocket handshakes by outcome",
+                             labels=("outcome",))
+
 manager = ConnectionManager()
+handshake_limiter = HandshakeLimiter()
+
+metrics.Gauge("permitflow_agents_connected", "Agents with an open WebSocket",
+              callback=lambda: len(manager.active_connections))
+metrics.Gauge("permitflow_agent_pending_requests", "Agent requests waiting for a response",
+              callback=lambda: len(manager.pending_requests))
+metrics.Gauge("permitflow_ws_queue_depth", "Per-agent WebSocket queue depth",
+              labels=("agent", "queue"),
+              callback=lambda: {
+                  **{(a, "awaiting_response"): n for a, n in manager.awaiting.items() if n},
+                  **{(a, "sending"): n for a, n in manager.sending.items() if n},
+              })
@@ -0,0 +1,112 @@
+"""Master <-> agent wire format (protocol 2). Keep in sync with agent/wire.py.
+
+Protocol 1 is JSON text frames, and every response echoes the full
+original_command. Protocol 2 is negotiated per connection:
+
+  agent -> {"type": "hello", "protocol": 2, "encodings": [...], "deflate": bool}
+  master -> {"type": "welcome", "protocol": 2, "encoding": ..., "compress_min_bytes": N,
+             "compact_responses": true}
+
+Both are JSON text, and so is everything before the welcome, so an old agent
+(no hello) or an old master (no welcome) keeps talking protocol 1.
+
+After the welcome:
+  - frames use the chosen encoding: "msgpack" (needs `pip install msgpack` on both
+    sides), "zlib-json", or "json"
+  - payloads of compress_min_bytes or more are zlib-compressed, unless the socket
+    already negotiated permessage-deflate (then compress_min_bytes is 0)
+  - responses are {"type": "response", "request_id": ..., "command": ..., "result": ...}
+
+Binary frames start with a one-byte tag, so decode() accepts any of them
+whatever was negotiated; text frames are always JSON.
+"""
+import json
+import zlib
+
+PROTOCOL_VERSION = 2
+
+TAG_MSGPACK = b"\x01"
+TAG_ZLIB_JSON = b"\x02"
+TAG_ZLIB_MSGPACK = b"\x03"
+
+# Share/path lists compress well; below this zlib isn't worth the CPU
+COMPRESS_MIN_BYTES = 4096
+
+# Refuse frames that inflate past this (64 MB)
+MAX_DECODED_BYTES = 64 * 1024 * 1024
+
+_msgpack_module = False
+
+def _msgpack():
+    # Optional dependency, imported on first use
+    global _msgpack_module
+    if _msgpack_module is False:
+        try:
+            import msgpack
+            _msgpack_module = msgpack
+        except ImportError:
+            _msgpack_module = None
+    return _msgpack_module
+
+def supported_encodings():
+    """Encodings this side can speak, most preferred first."""
+    return (["msgpack"] if _msgpack() else []) + ["zlib-json", "json"]
+
+def _inflate(body: bytes) -> bytes:
+    inflater = zlib.decompressobj()
+    data = inflater.decompress(body, MAX_DECODED_BYTES)
+    if inflater.unconsumed_tail:
+        raise ValueError("Frame exceeds maximum decoded size")
+    return data
+
+def decode(frame):
+    """Text or tagged binary frame -> message dict."""
+    if isinstance(frame, str):
+        return json.loads(frame)
+    tag, body = frame[:1], frame[1:]
+    if tag == TAG_ZLIB_JSON:
+        return json.loads(_inflate(body))
+    if tag in (TAG_MSGPACK, TAG_ZLIB_MSGPACK):
+        msgpack = _msgpack()
+        if msgpack is None:
+            raise ValueError("Received a msgpack frame but msgpack is not installed")
+        return msgpack.unpackb(_inflate(body) if tag == TAG_ZLIB_MSGPACK else body, raw=False)
+    raise ValueError(f"Unknown frame tag {tag!r}")
+
+class Codec:
+    """Encoder for one connection. The default is protocol 1 (plain JSON text)."""
+
+    __slots__ = ("encoding", "compress_min_bytes", "compact_responses")
+
+    def __init__(self, encoding: str = "json", compress_min_bytes: int = 0, compact_responses: bool = False):
+        self.encoding = encoding
+        self.compress_min_bytes = compress_min_bytes
+        self.compact_responses = compact_responses
+
+    def encode(self, message: dict):
+        """Returns str (send as text) or bytes (send as binary)."""
+        if self.encoding == "msgpack":
+            data = _msgpack().packb(message, use_bin_type=True, default=str)
+            if self.compress_min_bytes and len(data) >= self.compress_min_bytes:
+                return TAG_ZLIB_MSGPACK + zlib.compress(data, 6)
+            return TAG_MSGPACK + data
+        text = json.dumps(message, separators=(",", ":"), default=str)
+        if self.encoding == "zlib-json" and self.compress_min_bytes and len(text) >= self.compress_min_bytes:
+            return TAG_ZLIB_JSON + zlib.compress(text.encode("utf-8"), 6)
+        return text
+
+def negotiate(hello: dict):
+    """Pick the master's codec for an agent's hello; returns (codec, welcome message)."""
+    offered = hello.get("encodings") or []
+    encoding = next((e for e in supported_encodings() if e in offered), "json")
+    # Compressing on top of permessage-deflate only burns CPU
+    compress_min_bytes = 0 if hello.get("deflate") else COMPRESS_MIN_BYTES
+    codec = Codec(encoding, compress_min_bytes, compact_responses=True)
+    welcome = {
+        "type": "welcome",
+        "protocol": PROTOCOL_VERSION,
+        "encoding": encoding,
+        "compress_min_bytes": compress_min_bytes,
+        "compact_responses": True,
+    }
+    return codec, welcome
@@ -0,0 +1,116 @@
+"""Helpers shared by the benchmark scripts."""
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def bench_env(home: str):
+    """Environment for a master/agent process whose app data dir lives under home."""
+    env = dict(os.environ)
+    # database.py keys the data dir off these
+    env["HOME"] = home
+    env["APPDATA"] = home
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for(url: str, deadline: float):
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as r:
+                if r.status == 200:
+                    return True
+        except Exception:
+            time.sleep(0.01)
+    return False
+
+def percentile(values, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+def latency_summary(seconds):
+    """p50/p99/max in ms for a list of durations in seconds."""
+    if not seconds:
+        return {"count": 0, "p50_ms": None, "p99_ms": None, "max_ms": None}
+    return {
+        "count": len(seconds),
+        "p50_ms": round(percentile(seconds, 50) * 1000, 2),
+        "p99_ms": round(percentile(seconds, 99) * 1000, 2),
+        "max_ms": round(max(seconds) * 1000, 2),
+        "mean_ms": round(statistics.fmean(seconds) * 1000, 2),
+    }
+
+def rss_bytes(pid: int):
+    """Resident memory of a process (Linux /proc, psutil elsewhere if installed)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+class MasterProcess:
+    """Runs `uvicorn backend.main:app` on a free port with a throwaway data dir."""
+
+    def __init__(self, extra_args=(), home: str = None):
+        self.home = home or tempfile.mkdtemp(prefix="pf-bench-")
+        self.port = free_port()
+        self.extra_args = list(extra_args)
+        self.proc = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def ws_url(self):
+        return f"ws://127.0.0.1:{self.port}"
+
+    def start(self, timeout: float = 60.0):
+        self.started_at = time.monotonic()
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(self.port),
+             "--log-level", "warning", *self.extra_args],
+            env=bench_env(self.home), cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if not wait_for(f"{self.base_url}/api/status", self.started_at + timeout):
+            self.stop()
+            raise RuntimeError("master did not answer /api/status in time")
+        return time.monotonic() - self.started_at
+
+    def rss(self):
+        return rss_bytes(self.proc.pid) if self.proc else None
+
+    def stop(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.proc = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
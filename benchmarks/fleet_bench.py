@@ -0,0 +1,265 @@
+"""
+PermitFlow end-to-end fleet benchmark.
+
+Starts a local master (uvicorn, throwaway data dir, AD in mock mode) and N
+simulated agents (see sim_agent.py), then runs load scenarios against it:
+
+  heartbeat_storm   all agents connect at once, then send heartbeat bursts
+                    while /api/status latency is probed
+  validate          POST /api/execute/validate on a large tree spread over agents
+  provision         POST /api/execute on a large tree; measures request latency
+                    and how fast create_folder commands reach the agents
+  scan              POST /api/agents/{id}/scan for every agent concurrently
+
+Reports throughput, p50/p99 latency and master RSS, and with --json writes
+machine-readable results for regression tracking.
+
+Usage:
+    python benchmarks/fleet_bench.py --agents 200 --folders 5000
+    python benchmarks/fleet_bench.py --agents 2000 --agent-procs 4 --scenarios heartbeat_storm,scan
+"""
+import argparse
+import asyncio
+import json
+import re
+import sys
+import threading
+import time
+
+import httpx
+
+from common import MasterProcess, latency_summary
+from sim_agent import AgentFleet, AgentProfile
+
+SCENARIOS = ("heartbeat_storm", "validate", "provision", "scan")
+
+class RssSampler:
+    """Tracks peak RSS of the master while a scenario runs."""
+
+    def __init__(self, master: MasterProcess, interval: float = 0.1):
+        self.master = master
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.master.rss() or 0)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def build_tree(agent_ids, folders: int, fanout: int = 10):
+    """One server node per agent, folders spread evenly in a fanout-wide hierarchy."""
+    per_agent = max(1, folders // len(agent_ids))
+    tree = []
+    for agent_id in agent_ids:
+        nodes = [{"name": f"Dept{i:05d}", "type": "folder", "children": [], "groups": []} for i in range(per_agent)]
+        # Hang node i under node (i - 1) // fanout to get a realistic depth
+        roots = []
+        for i, node in enumerate(nodes):
+            if i < fanout:
+                roots.append(node)
+            else:
+                nodes[(i - fanout) // fanout]["children"].append(node)
+        tree.append({"name": agent_id, "type": "server", "children": roots, "groups": []})
+    return tree, per_agent * len(agent_ids)
+
+async def _timed_requests(client, calls, concurrency: int):
+    """Run (method, url, kwargs) calls with bounded concurrency; return durations and failures."""
+    sem = asyncio.Semaphore(concurrency)
+    durations, failures = [], 0
+
+    async def one(method, url, kwargs):
+        nonlocal failures
+        async with sem:
+            start = time.perf_counter()
+            try:
+                r = await client.request(method, url, **kwargs)
+                ok = r.status_code == 200 and r.json().get("status", "success") in ("success", "Master Server Running")
+            except Exception:
+                ok = False
+            durations.append(time.perf_counter() - start)
+            failures += 0 if ok else 1
+
+    await asyncio.gather(*[one(*c) for c in calls])
+    return durations, failures
+
+async def scenario_heartbeat_storm(master, fleet, args):
+    result = {}
+    async with httpx.AsyncClient(base_url=master.base_url, timeout=120) as client:
+        # Connections happened in main(); wait for the registrations to land in the DB
+        start = time.perf_counter()
+        online = 0
+        while time.perf_counter() - start < 120:
+            agents = (await client.get("/api/agents")).json()
+            online = sum(1 for a in agents if a["status"] == "online")
+            if online >= len(fleet.ids):
+                break
+            await asyncio.sleep(0.2)
+        result["registered_online"] = online
+        result["registration_settle_s"] = round(time.perf_counter() - start, 3)
+
+        # Heartbeat burst with /api/status probed in parallel
+        probe_durations = []
+        burst = asyncio.get_running_loop().run_in_executor(None, fleet.heartbeat_burst, args.heartbeats)
+        while not burst.done():
+            t = time.perf_counter()
+            await client.get("/api/status")
+            probe_durations.append(time.perf_counter() - t)
+            await asyncio.sleep(0.01)
+        burst_seconds = await burst
+        sent = args.heartbeats * len(fleet.ids)
+        result["heartbeats_sent"] = sent
+        result["heartbeats_per_s"] = round(sent / burst_seconds, 1) if burst_seconds else None
+        result["api_latency_during_storm"] = latency_summary(probe_durations)
+    return result
+
+async def scenario_validate(master, fleet, args):
+    tree, count = build_tree(fleet.ids, args.folders)
+    async with httpx.AsyncClient(base_url=master.base_url, timeout=600) as client:
+        durations, failures = await _timed_requests(
+            client, [("POST", "/api/execute/validate", {"json": {"tree": tree}})] * args.repeat, 1)
+    total = sum(durations)
+    return {
+        "folders": count,
+        "requests": len(durations),
+        "failures": failures,
+        "latency": latency_summary(durations),
+        "folders_per_s": round(count * len(durations) / total, 1) if total else None
+    }
+
+async def scenario_provision(master, fleet, args):
+    tree, count = build_tree(fleet.ids, args.folders)
+    before = fleet.stats()["by_type"].get("create_folder", 0)
+    async with httpx.AsyncClient(base_url=master.base_url, timeout=600) as client:
+        start = time.perf_counter()
+        durations, failures = await _timed_requests(client, [("POST", "/api/execute", {"json": {"tree": tree}})], 1)
+        request_done = time.perf_counter() - start
+        # Commands are fire-and-forget; wait until agents have seen all of them
+        delivered = 0
+        while time.perf_counter() - start < 300:
+            delivered = fleet.stats()["by_type"].get("create_folder", 0) - before
+            if delivered >= count:
+                break
+            await asyncio.sleep(0.05)
+        all_delivered = time.perf_counter() - start
+    return {
+        "folders": count,
+        "failures": failures,
+        "request_s": round(request_done, 3),
+        "delivered": delivered,
+        "delivered_s": round(all_delivered, 3),
+        "folders_per_s": round(delivered / all_delivered, 1) if all_delivered else None
+    }
+
+async def scenario_scan(master, fleet, args):
+    async with httpx.AsyncClient(base_url=master.base_url, timeout=120) as client:
+        calls = [("POST", f"/api/agents/{a}/scan", {}) for a in fleet.ids]
+        start = time.perf_counter()
+        durations, failures = await _timed_requests(client, calls, args.concurrency)
+        elapsed = time.perf_counter() - start
+    rows = (len(fleet.ids) - failures) * args.shares
+    return {
+        "scans": len(calls),
+        "failures": failures,
+        "latency": latency_summary(durations),
+        "scans_per_s": round(len(calls) / elapsed, 1),
+        "rows_per_s": round(rows / elapsed, 1)
+    }
+
+RUNNERS = {
+    "heartbeat_storm": scenario_heartbeat_storm,
+    "validate": scenario_validate,
+    "provision": scenario_provision,
+    "scan": scenario_scan,
+}
+
+WS_BYTES = re.compile(r'^permitflow_ws_bytes_total\{direction="(\w+)",encoding="([\w-]+)"\} (\S+)$', re.M)
+
+def ws_bytes(master):
+    """permitflow_ws_bytes_total from the master, as {"in/json": bytes, ...}."""
+    text = httpx.get(f"{master.base_url}/api/metrics").text
+    return {f"{d}/{e}": int(float(v)) for d, e, v in WS_BYTES.findall(text)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, default=50)
+    parser.add_argument("--agent-procs", type=int, default=0, help="Worker processes for agents (0 = in-process)")
+    parser.add_argument("--connect-concurrency", type=int, default=0, help="Agents connecting at once (0 = all)")
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--jitter-ms", type=float, default=1.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--shares", type=int, default=20, help="Shares per agent returned by list_shares")
+    parser.add_argument("--folders", type=int, default=2000, help="Folders in validate/provision trees")
+    parser.add_argument("--heartbeats", type=int, default=5, help="Heartbeats per agent in the storm")
+    parser.add_argument("--repeat", type=int, default=3, help="Validate requests")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent HTTP requests for scan")
+    parser.add_argument("--protocol", type=int, choices=(1, 2), default=2,
+                        help="Agent wire protocol: 1 = JSON only, 2 = negotiate (see agent/wire.py)")
+    parser.add_argument("--no-deflate", action="store_true", help="Agents don't offer permessage-deflate")
+    parser.add_argument("--handshake-rate", type=float, help="Set the master's ws_handshake_rate (0 = unlimited)")
+    parser.add_argument("--handshake-burst", type=int, help="Set the master's ws_handshake_burst")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    profile = AgentProfile(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, failure_rate=args.failure_rate,
+                           drop_rate=args.drop_rate, shares=args.shares, wire=args.protocol == 2,
+                           deflate=not args.no_deflate)
+    results = {"config": vars(args), "scenarios": {}}
+
+    with MasterProcess() as master:
+        results["master_startup_rss"] = master.rss()
+        for key, value in (("ws_handshake_rate", args.handshake_rate), ("ws_handshake_burst", args.handshake_burst)):
+            if value is not None:
+                httpx.post(f"{master.base_url}/api/settings", json={"key": key, "value": str(value)}).raise_for_status()
+        fleet = AgentFleet(master.ws_url, args.agents, profile, processes=args.agent_procs)
+        try:
+            with RssSampler(master) as rss:
+                connect_s = fleet.start(args.connect_concurrency)
+            stats = fleet.stats()
+            results["connect"] = {
+                "agents": args.agents,
+                "errors": stats["errors"],
+                "throttled": stats["throttled"],
+                "last_error": stats["last_error"],
+                "all_connected_s": round(connect_s, 3),
+                "handshake": latency_summary(stats["connect_seconds"]),
+                "peak_rss": rss.peak
+            }
+
+            for name in scenarios:
+                with RssSampler(master) as rss:
+                    started = time.perf_counter()
+                    outcome = asyncio.run(RUNNERS[name](master, fleet, args))
+                outcome["wall_s"] = round(time.perf_counter() - started, 3)
+                outcome["peak_rss"] = rss.peak
+                results["scenarios"][name] = outcome
+                print(f"[{name}] {json.dumps(outcome)}", file=sys.stderr)
+        finally:
+            results["agent_stats"] = {k: v for k, v in fleet.stats().items() if k != "connect_seconds"}
+            results["ws_bytes"] = ws_bytes(master)
+            fleet.stop()
+        results["master_final_rss"] = master.rss()
+
+    print(json.dumps(results, indent=2, default=str))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+
+if __name__ == "__main__":
+    main()
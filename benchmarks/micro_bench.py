@@ -0,0 +1,340 @@
+"""
+PermitFlow data-path microbenchmarks.
+
+Times the database and CPU hot paths directly (no HTTP, no agents):
+
+  search.*      search_inventory() on selective, broad and no-match queries
+  history.*     get_history() first page and a deep page
+  cached.*      the same search / history calls answered from services/result_cache.py
+                (the others clear the cache before each run, so they time the query)
+  browse.*      browse() top level of a server and one folder's children
+  ingest.*      ingest_shares() (the scan_agent_shares write path), new and already-known shares
+  execute.*     execute_structure() tree walk + inserts with no agents connected
+  ad_mock.*     ADService construction, create_group and check_user_exists in mock mode
+
+Each inventory size runs in its own interpreter against a seeded fixture DB
+(cached under --fixtures, reused while FIXTURE_VERSION matches). Sizes: 10k, 100k, 1m.
+
+Baselines live in benchmarks/baselines/<name>.json. --save writes one, --compare
+checks the current run against one and exits 1 if any benchmark's best time is more
+than --threshold slower (and at least --min-delta-ms slower, to ignore noise). The
+best of N runs is compared rather than the median since it is far less sensitive to
+other load on the machine.
+
+Usage:
+    python benchmarks/micro_bench.py --sizes 10k
+    python benchmarks/micro_bench.py --save default
+    python benchmarks/micro_bench.py --compare default --threshold 0.25
+
+The default sizes are all three, so the stored baseline and the comparison
+cover the 1m inventory (its fixture takes a while to build the first time).
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT, bench_env
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+# Bump when the generator below changes so cached fixtures get rebuilt
+FIXTURE_VERSION = 2
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+SERVERS = 20
+INGEST_SHARES = 1000
+EXECUTE_FOLDERS = 1000
+AD_CALLS = 5000
+
+# --- fixture generation (runs inside the worker) ---
+
+def _folder_rows(count: int):
+    # D:\Shares\Share07\Dept0042\Team003 spread over FS01..FS20
+    for i in range(count):
+        yield {
+            "path": f"D:\\Shares\\Share{i % 50:02d}\\Dept{(i // 50) % 2000:04d}\\Team{i // 100_000:03d}{i % 1000:03d}",
+            "server": f"FS{i % SERVERS + 1:02d}",
+            "action_id": None,
+        }
+
+def seed(count: int):
+    """Fill a fresh DB with count folders, count/10 groups and count/10 history rows."""
+    from datetime import datetime, timedelta
+    from backend.database import engine
+    from backend.models import ActionLog, ADGroup, Folder
+
+    chunk = 50_000
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        actions = count // 10
+        for start in range(0, actions, chunk):
+            conn.execute(ActionLog.__table__.insert(), [
+                {"timestamp": now - timedelta(minutes=i), "action_type": "Provision",
+                 "description": f"Provisioned {i % 7 + 1} root items", "status": "success"}
+                for i in range(start, min(actions, start + chunk))])
+        for start in range(0, count // 10, chunk):
+            conn.execute(ADGroup.__table__.insert(), [
+                {"name": f"ACL_Dept{i:06d}_{'RW' if i % 2 else 'R'}", "type": "RW", "action_id": None}
+                for i in range(start, min(count // 10, start + chunk))])
+        rows = _folder_rows(count)
+        while True:
+            batch = [row for _, row in zip(range(chunk), rows)]
+            if not batch:
+                break
+            conn.execute(Folder.__table__.insert(), batch)
+    with engine.connect() as conn:
+        conn.exec_driver_sql("ANALYZE")
+
+def ensure_fixture(count: int):
+    from backend.database import data_dir, init_db, DB_PATH, ARCHIVE_DB_PATH
+    marker = os.path.join(data_dir, "bench_fixture.json")
+    expected = {"version": FIXTURE_VERSION, "folders": count}
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if json.load(f) == expected:
+                init_db()
+                return False
+    # Stale or partial fixture: start from empty files (nothing has connected yet)
+    for path in (DB_PATH, ARCHIVE_DB_PATH):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    init_db()
+    started = time.perf_counter()
+    seed(count)
+    with open(marker, "w") as f:
+        json.dump(expected, f)
+    print(f"[micro] seeded {count} folders in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return True
+
+# --- benchmarks (run inside the worker) ---
+
+def _time(fn, repeat: int, setup=None, teardown=None):
+    durations = []
+    # One unmeasured run to warm SQLite's page cache and SQLAlchemy's statement cache
+    for i in range(repeat + 1):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        if i:
+            durations.append(time.perf_counter() - start)
+        if teardown:
+            teardown()
+    return {
+        "median_ms": round(statistics.median(durations) * 1000, 3),
+        "min_ms": round(min(durations) * 1000, 3),
+        "max_ms": round(max(durations) * 1000, 3),
+        "runs": repeat,
+    }
+
+def _execute_tree(folders: int):
+    from backend.routers.execution import ExecutionRequest
+    # One server, 10-wide hierarchy, a group pair on every 10th folder
+    nodes = [{"name": f"BenchDept{i:05d}", "type": "folder", "children": [],
+              "groups": [f"ACL_BENCH_{i:05d}_R", f"ACL_BENCH_{i:05d}_RW"] if i % 10 == 0 else []}
+             for i in range(folders)]
+    roots = []
+    for i, node in enumerate(nodes):
+        if i < 10:
+            roots.append(node)
+        else:
+            nodes[(i - 10) // 10]["children"].append(node)
+    return ExecutionRequest(tree=[{"name": "BENCH-EXEC", "type": "server", "children": roots, "groups": []}])
+
+def run_benchmarks(size_label: str, repeat: int):
+    from backend.database import SessionLocal
+    from backend.models import ActionLog, ADGroup, Folder
+    from backend.services.scan_scheduler import ingest_shares
+    from backend.routers.execution import execute_structure
+    from backend.routers.history import get_history
+    from backend.routers.browse import browse
+    from backend.routers.inventory import search_inventory
+    from backend.services.ad_service import ADService
+    from backend.services.result_cache import cache as result_cache
+
+    results = {}
+    db = SessionLocal()
+    try:
+        # search: ~1/1000 of rows, ~1/50 of rows, nothing
+        for name, q in (("selective", "Team000042"), ("broad", "Share07\\Dept00"), ("miss", "no-such-folder")):
+            results[f"search.{name}"] = _time(lambda: (search_inventory(q, db), db.expunge_all()), repeat,
+                                              setup=result_cache.clear)
+
+        history_rows = db.query(ActionLog).count()
+        results["history.first_page"] = _time(lambda: (get_history(500, 0, db), db.expunge_all()), repeat,
+                                              setup=result_cache.clear)
+        results["history.deep_page"] = _time(
+            lambda: (get_history(500, max(0, history_rows - 1000), db), db.expunge_all()), repeat,
+            setup=result_cache.clear)
+
+        # Hits: the unmeasured first run fills the cache
+        results["cached.search_broad"] = _time(lambda: search_inventory("Share07\\Dept00", db), repeat)
+        results["cached.history_first_page"] = _time(lambda: get_history(500, 0, db), repeat)
+
+        # No share/dept rows in the fixture, so the top level is every folder on the server
+        results["browse.top"] = _time(lambda: browse("FS01", db=db), repeat)
+        results["browse.children"] = _time(lambda: browse("FS01", path="D:\\Shares\\Share00\\Dept0000", db=db), repeat)
+
+        shares = [{"Name": f"Share{i:04d}", "Path": f"E:\\Bench\\Share{i:04d}"} for i in range(INGEST_SHARES)]
+
+        def clear_ingest():
+            db.query(Folder).filter(Folder.server == "BENCH-INGEST").delete()
+            db.commit()
+
+        results["ingest.new"] = _time(lambda: ingest_shares(db, "BENCH-INGEST", shares), repeat,
+                                      setup=clear_ingest, teardown=clear_ingest)
+        ingest_shares(db, "BENCH-INGEST", shares)
+        results["ingest.existing"] = _time(lambda: ingest_shares(db, "BENCH-INGEST", shares), repeat)
+        clear_ingest()
+
+        req = _execute_tree(EXECUTE_FOLDERS)
+
+        action_ids = []
+
+        def clear_execute():
+            db.query(Folder).filter(Folder.server == "BENCH-EXEC").delete()
+            db.query(ADGroup).filter(ADGroup.name.like("ACL_BENCH_%")).delete(synchronize_session=False)
+            db.query(ActionLog).filter(ActionLog.id.in_(action_ids)).delete(synchronize_session=False)
+            db.commit()
+            db.expunge_all()
+            action_ids.clear()
+
+        def execute():
+            result = asyncio.run(execute_structure(req, db))
+            if result.get("status") != "success":
+                raise RuntimeError(f"execute_structure failed: {result}")
+            action_ids.append(result["id"])
+
+        results["execute.tree_1k"] = _time(execute, repeat, teardown=clear_execute)
+    finally:
+        db.close()
+
+    # AD mock doesn't depend on inventory size; only measured once
+    if size_label == "10k":
+        db = SessionLocal()
+        try:
+            results["ad_mock.construct"] = _time(lambda: [ADService(db) for _ in range(100)], repeat)
+            ad = ADService(db)
+            results["ad_mock.create_group"] = _time(
+                lambda: [ad.create_group(f"ACL_MOCK_{i}") for i in range(AD_CALLS)], repeat)
+            results["ad_mock.check_user"] = _time(
+                lambda: [ad.check_user_exists(f"user{i}") for i in range(AD_CALLS)], repeat)
+        finally:
+            db.close()
+    return results
+
+def worker(size_label: str, repeat: int):
+    real_stdout = sys.stdout
+    # The JSON results must be the only thing on stdout (backend logging goes to stderr);
+    # anything a library prints is discarded
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        ensure_fixture(SIZES[size_label])
+        results = run_benchmarks(size_label, repeat)
+    real_stdout.write(json.dumps(results))
+
+# --- orchestration ---
+
+def run_size(size_label: str, fixtures: str, repeat: int):
+    home = os.path.join(fixtures, size_label)
+    os.makedirs(home, exist_ok=True)
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", size_label, "--repeat", str(repeat)],
+                         env=bench_env(home), cwd=ROOT, capture_output=True, text=True)
+    if out.returncode != 0:
+        sys.stderr.write(out.stderr)
+        raise RuntimeError(f"benchmark worker for {size_label} failed")
+    sys.stderr.write(out.stderr)
+    return {f"{size_label}/{name}": value for name, value in json.loads(out.stdout).items()}
+
+def compare(current: dict, baseline: dict, threshold: float, min_delta_ms: float):
+    """Return (rows, regressions). A regression is a best time slower by > threshold and by > min_delta_ms."""
+    rows, regressions = [], []
+    for name, result in sorted(current.items()):
+        base = baseline.get(name)
+        if base is None:
+            rows.append((name, None, result["min_ms"], None, "new"))
+            continue
+        delta = result["min_ms"] - base["min_ms"]
+        ratio = delta / base["min_ms"] if base["min_ms"] else 0.0
+        status = "ok"
+        if ratio > threshold and delta > min_delta_ms:
+            status = "REGRESSION"
+            regressions.append(name)
+        elif ratio < -threshold and -delta > min_delta_ms:
+            status = "faster"
+        rows.append((name, base["min_ms"], result["min_ms"], ratio, status))
+    return rows, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(SIZES), help=f"Comma-separated, from {', '.join(SIZES)}")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--fixtures", default=os.path.join(tempfile.gettempdir(), "permitflow-bench-fixtures"))
+    parser.add_argument("--save", metavar="NAME", help="Write results as baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="Compare against baselines/NAME.json")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown ratio (0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="Ignore slowdowns smaller than this")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        sys.path.insert(0, ROOT)
+        worker(args.worker, args.repeat)
+        return
+
+    sizes = [s.strip().lower() for s in args.sizes.split(",") if s.strip()]
+    unknown = set(sizes) - set(SIZES)
+    if unknown:
+        parser.error(f"unknown sizes: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for size_label in sizes:
+        results.update(run_size(size_label, args.fixtures, args.repeat))
+
+    for name, r in sorted(results.items()):
+        print(f"  {name:<32} median {r['median_ms']:>10.3f} ms  (min {r['min_ms']:.3f}, max {r['max_ms']:.3f})")
+
+    document = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "fixture_version": FIXTURE_VERSION,
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(document, f, indent=2)
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save}.json")
+        with open(path, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"Saved baseline {path}")
+
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json")) as f:
+            baseline = json.load(f)
+        if baseline.get("fixture_version") != FIXTURE_VERSION:
+            print("warning: baseline was recorded with a different fixture version", file=sys.stderr)
+        rows, regressions = compare(results, baseline["results"], args.threshold, args.min_delta_ms)
+        print(f"\nCompared with {args.compare} (threshold {args.threshold:.0%}, min delta {args.min_delta_ms} ms):")
+        for name, base, now, ratio, status in rows:
+            base_s = f"{base:.3f}" if base is not None else "-"
+            ratio_s = f"{ratio:+.0%}" if ratio is not None else ""
+            print(f"  {name:<32} {base_s:>10} -> {now:>10.3f} ms {ratio_s:>6}  {status}")
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Simulated PermitFlow agents.
+
+A SimAgent speaks the same WebSocket protocol as agent/agent.py (hello and
+heartbeat on connect, one "response" message per command, encoded with the
+agent's own wire.py) but answers from memory with a configurable latency and
+failure rate instead of touching the disk. AgentProfile(wire=False) makes it a
+protocol 1 agent (JSON only, no hello).
+
+A fleet can run in the benchmark process or be split over worker processes
+(AgentFleet(processes=N)) so the client side doesn't become the bottleneck.
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+import websockets
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "agent"))
+import wire # agent/wire.py
+
+class AgentProfile:
+    """Behaviour knobs shared by every agent in a fleet."""
+
+    def __init__(self, latency_ms: float = 2.0, jitter_ms: float = 1.0, failure_rate: float = 0.0,
+                 drop_rate: float = 0.0, exists_rate: float = 0.0, shares: int = 20, wire: bool = True,
+                 deflate: bool = True):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate # answer with status=error
+        self.drop_rate = drop_rate # never answer (master sees a timeout)
+        self.exists_rate = exists_rate # check_path answers exists=True
+        self.shares = shares # rows returned by list_shares
+        self.wire = wire # negotiate protocol 2 like agent.py (False = protocol 1 JSON)
+        self.deflate = deflate # offer permessage-deflate in the handshake
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+class SimAgent:
+    def __init__(self, agent_id: str, ws_base: str, profile: AgentProfile, stats: dict):
+        self.agent_id = agent_id
+        self.url = f"{ws_base}/api/agents/ws/{agent_id}"
+        self.profile = profile
+        self.stats = stats
+        self.ws = None
+        self.codec = wire.Codec()
+        self.connected = asyncio.Event()
+
+    def _result(self, command: dict):
+        p = self.profile
+        if random.random() < p.failure_rate:
+            return {"status": "error", "error": "simulated failure"}
+        cmd_type = command.get("type")
+        if cmd_type == "create_folder":
+            return {"status": "success", "message": f"Created {command.get('path')}"}
+        if cmd_type == "check_path":
+            return {"status": "success", "exists": random.random() < p.exists_rate, "path": command.get("path")}
+        if cmd_type == "delete_folders":
+            return {"status": "success", "results": {path: {"status": "deleted"} for path in command.get("paths", [])}}
+        if cmd_type == "list_shares":
+            return {"status": "success", "shares": [
+                {"Name": f"Share{i:03d}", "Path": f"D:\\Shares\\{self.agent_id}\\Share{i:03d}"}
+                for i in range(p.shares)]}
+        if cmd_type == "ping":
+            return {"status": "success", "pong": True}
+        return {"status": "unknown_command"}
+
+    async def _answer(self, command: dict):
+        p = self.profile
+        delay = max(0.0, random.gauss(p.latency_ms, p.jitter_ms)) / 1000.0
+        if delay:
+            await asyncio.sleep(delay)
+        if random.random() < p.drop_rate:
+            self.stats["dropped"] += 1
+            return
+        await self.ws.send(self.codec.encode(wire.response_message(self.codec, command, self._result(command))))
+        self.stats["responses"] += 1
+
+    async def heartbeat(self):
+        await self.ws.send(self.codec.encode({
+            "type": "heartbeat",
+            "hostname": self.agent_id,
+            "timestamp": datetime.utcnow().isoformat()
+        }))
+        self.stats["heartbeats"] += 1
+
+    async def _session(self, start: float) -> bool:
+        """One connection. False if the master throttled us (1013), after sleeping its retry-after."""
+        try:
+            compression = "deflate" if self.profile.deflate else None
+            async with websockets.connect(self.url, open_timeout=60, max_size=None, compression=compression) as ws:
+                self.codec = wire.Codec()
+                # A throttled handshake is accepted and closed straight away. With
+                # the hello, the welcome tells us we're in; without it, probe briefly.
+                if self.profile.wire:
+                    await ws.send(json.dumps(wire.hello_message(_deflate(ws))))
+                try:
+                    first = await asyncio.wait_for(ws.recv(), timeout=30 if self.profile.wire else 0.1)
+                except asyncio.TimeoutError:
+                    first = None
+                if first is not None:
+                    message = wire.decode(first)
+                    if message.get("type") == "welcome":
+                        self.codec = wire.from_welcome(message)
+                        self.stats["encoding"] = self.codec.encoding
+                        first = None
+                self.ws = ws
+                await self.heartbeat() # like agent.py's send_heartbeat on connect
+                self.stats["connect_seconds"].append(time.perf_counter() - start)
+                self.connected.set()
+                if first is not None:
+                    self._dispatch(first)
+                async for message in ws:
+                    self._dispatch(message)
+            return True
+        except websockets.exceptions.ConnectionClosed as e:
+            hint = retry_after_hint(e)
+            if hint is None:
+                raise
+            if self.connected.is_set():
+                # Close arrived after we thought we were in; don't count that session
+                self.connected.clear()
+                self.stats["connect_seconds"].pop()
+            self.ws = None
+            self.stats["throttled"] += 1
+            await asyncio.sleep(hint + random.uniform(0, 1.0))
+            return False
+
+    def _dispatch(self, message):
+        command = wire.decode(message)
+        self.stats["commands"] += 1
+        by_type = self.stats["by_type"]
+        by_type[command.get("type")] = by_type.get(command.get("type"), 0) + 1
+        asyncio.create_task(self._answer(command))
+
+    async def run(self):
+        start = time.perf_counter()
+        try:
+            while not await self._session(start):
+                pass
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.stats["last_error"] = str(e)
+        finally:
+            self.connected.set()
+
+def _deflate(ws):
+    try:
+        return any(ext.name == "permessage-deflate" for ext in ws.protocol.extensions)
+    except AttributeError:
+        return False
+
+def retry_after_hint(exc):
+    # Same parsing as agent.py: close code 1013 with reason "retry-after=N"
+    close = getattr(exc, "rcvd", None)
+    if close is None or close.code != 1013:
+        return None
+    key, _, value = (close.reason or "").partition("=")
+    try:
+        return max(0.0, float(value)) if key.strip() == "retry-after" else None
+    except ValueError:
+        return None
+
+def new_stats():
+    return {"commands": 0, "responses": 0, "dropped": 0, "heartbeats": 0, "errors": 0, "throttled": 0,
+            "by_type": {}, "connect_seconds": [], "last_error": None, "encoding": None}
+
+class LocalFleet:
+    """N simulated agents on an asyncio loop running in a background thread."""
+
+    def __init__(self, ws_base: str, ids, profile: AgentProfile):
+        self.stats = new_stats()
+        self.ids = list(ids)
+        self.ws_base = ws_base
+        self.profile = profile
+        self.loop = asyncio.new_event_loop()
+        self.agents = []
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def start(self, connect_concurrency: int = 0):
+        self._thread.start()
+        return asyncio.run_coroutine_threadsafe(self._start(connect_concurrency), self.loop).result()
+
+    async def _start(self, connect_concurrency: int):
+        self.agents = [SimAgent(a, self.ws_base, self.profile, self.stats) for a in self.ids]
+        started = time.perf_counter()
+        for i, agent in enumerate(self.agents):
+            asyncio.create_task(agent.run())
+            # 0 = everyone at once (reconnect storm)
+            if connect_concurrency and (i + 1) % connect_concurrency == 0:
+                await asyncio.gather(*[a.connected.wait() for a in self.agents[i + 1 - connect_concurrency:i + 1]])
+        await asyncio.gather(*[a.connected.wait() for a in self.agents])
+        return time.perf_counter() - started
+
+    def heartbeat_burst(self, per_agent: int):
+        async def burst():
+            started = time.perf_counter()
+            for _ in range(per_agent):
+                await asyncio.gather(*[a.heartbeat() for a in self.agents if a.ws is not None])
+            return time.perf_counter() - started
+        return asyncio.run_coroutine_threadsafe(burst(), self.loop).result()
+
+    def snapshot(self):
+        # Copy on the loop thread so counters aren't read mid-update
+        async def copy():
+            return json.loads(json.dumps(self.stats))
+        return asyncio.run_coroutine_threadsafe(copy(), self.loop).result()
+
+    def stop(self):
+        async def close():
+            await asyncio.gather(*[a.ws.close() for a in self.agents if a.ws is not None], return_exceptions=True)
+        try:
+            asyncio.run_coroutine_threadsafe(close(), self.loop).result(timeout=10)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+def _worker(conn, ws_base, ids, profile_dict, connect_concurrency):
+    fleet = LocalFleet(ws_base, ids, AgentProfile(**profile_dict))
+    conn.send(("started", fleet.start(connect_concurrency)))
+    while True:
+        op, arg = conn.recv()
+        if op == "stats":
+            conn.send(("stats", fleet.snapshot()))
+        elif op == "heartbeat":
+            conn.send(("heartbeat", fleet.heartbeat_burst(arg)))
+        elif op == "stop":
+            fleet.stop()
+            conn.send(("stopped", None))
+            return
+
+def _merge(total, part):
+    for key in ("commands", "responses", "dropped", "heartbeats", "errors", "throttled"):
+        total[key] += part[key]
+    for key, count in part["by_type"].items():
+        total["by_type"][key] = total["by_type"].get(key, 0) + count
+    total["connect_seconds"].extend(part["connect_seconds"])
+    total["last_error"] = part["last_error"] or total["last_error"]
+    total["encoding"] = part["encoding"] or total["encoding"]
+    return total
+
+class AgentFleet:
+    """Front for a fleet of simulated agents, in-process (processes=0) or split over workers."""
+
+    def __init__(self, ws_base: str, count: int, profile: AgentProfile, processes: int = 0, prefix: str = "SIM"):
+        self.ids = [f"{prefix}-{i:05d}" for i in range(count)]
+        self.ws_base = ws_base
+        self.profile = profile
+        self.processes = processes
+        self.local = None
+        self.workers = []
+
+    def start(self, connect_concurrency: int = 0) -> float:
+        if not self.processes:
+            self.local = LocalFleet(self.ws_base, self.ids, self.profile)
+            return self.local.start(connect_concurrency)
+
+        ctx = multiprocessing.get_context("spawn")
+        chunks = [self.ids[i::self.processes] for i in range(self.processes)]
+        for chunk in chunks:
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_worker, args=(child, self.ws_base, chunk, self.profile.to_dict(), connect_concurrency),
+                               daemon=True)
+            proc.start()
+            self.workers.append((proc, parent))
+        return max(parent.recv()[1] for _, parent in self.workers)
+
+    def _ask(self, op, arg=None):
+        for _, parent in self.workers:
+            parent.send((op, arg))
+        return [parent.recv()[1] for _, parent in self.workers]
+
+    def stats(self):
+        if self.local:
+            return self.local.snapshot()
+        total = new_stats()
+        for part in self._ask("stats"):
+            _merge(total, part)
+        return total
+
+    def heartbeat_burst(self, per_agent: int) -> float:
+        if self.local:
+            return self.local.heartbeat_burst(per_agent)
+        return max(self._ask("heartbeat", per_agent))
+
+    def stop(self):
+        if self.local:
+            self.local.stop()
+            return
+        self._ask("stop")
+        for proc, _ in self.workers:
+            proc.join(timeout=10)
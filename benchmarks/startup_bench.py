@@ -0,0 +1,123 @@
+"""
+PermitFlow startup benchmark.
+
+Measures, each in a fresh interpreter with an isolated app data dir:
+  - import time of backend.main (cold = new data dir, warm = schema already there)
+  - time from process spawn to the first 200 from /api/status and from /
+  - the slowest modules from `python -X importtime`
+
+Usage:
+    python benchmarks/startup_bench.py [--runs 5] [--json results.json]
+"""
+import argparse
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT, bench_env, free_port, wait_for
+
+IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import backend.main; "
+    "print(time.perf_counter() - t)"
+)
+
+def measure_import(home: str) -> float:
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], env=bench_env(home), cwd=ROOT,
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+def measure_first_response(home: str, timeout: float = 60.0):
+    port = free_port()
+    start = time.monotonic()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        env=bench_env(home), cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = start + timeout
+        if not wait_for(f"http://127.0.0.1:{port}/api/status", deadline):
+            raise RuntimeError("server did not answer /api/status in time")
+        api = time.monotonic() - start
+        wait_for(f"http://127.0.0.1:{port}/", deadline)
+        root = time.monotonic() - start
+        return api, root
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+def slowest_imports(home: str, top: int = 15):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import backend.main"],
+                         env=bench_env(home), cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line.split("|")
+            rows.append((int(cumulative.strip()), name.strip()))
+        except ValueError:
+            continue # header line
+    rows.sort(reverse=True)
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for us, name in rows[:top]]
+
+def _summary(values):
+    return {
+        "min_ms": round(min(values) * 1000, 1),
+        "median_ms": round(statistics.median(values) * 1000, 1),
+        "max_ms": round(max(values) * 1000, 1),
+    }
+
+def run(runs: int):
+    results = {"python": sys.version.split()[0], "runs": runs}
+
+    cold, warm, api, root = [], [], [], []
+    for _ in range(runs):
+        home = tempfile.mkdtemp(prefix="pf-startup-")
+        try:
+            cold.append(measure_import(home))
+            # First server start creates the schema; the measured one reuses it
+            measure_first_response(home)
+            warm.append(measure_import(home))
+            a, r = measure_first_response(home)
+            api.append(a)
+            root.append(r)
+        finally:
+            shutil.rmtree(home, ignore_errors=True)
+
+    results["import_cold"] = _summary(cold)
+    results["import_warm"] = _summary(warm)
+    results["first_api_response"] = _summary(api)
+    results["first_root_response"] = _summary(root)
+
+    home = tempfile.mkdtemp(prefix="pf-startup-")
+    try:
+        results["slowest_imports"] = slowest_imports(home)
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    results = run(args.runs)
+
+    print(f"Python {results['python']}, {args.runs} runs")
+    for key in ("import_cold", "import_warm", "first_api_response", "first_root_response"):
+        s = results[key]
+        print(f"  {key:<22} median {s['median_ms']:>8} ms  (min {s['min_ms']}, max {s['max_ms']})")
+    print("  slowest imports (cumulative):")
+    for row in results["slowest_imports"]:
+        print(f"    {row['cumulative_ms']:>8} ms  {row['module']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
 import React, { useEffect, useState } from 'react';
-import { Server, Activity, Clock, Zap, Search } from 'lucide-react';
+import { Server, Activity, Clock, Zap, Search, CalendarClock } from 'lucide-react';
 import { useToast } from '../context/ToastContext';
 
 const AgentStatus = () => {
     const [agents, setAgents] = useState([]);
     const [scanningAgent, setScanningAgent] = useState(null);
+    const [schedules, setSchedules] = useState({});
     const { addToast } = useToast();
 
     const fetchAgents = async () => {
@@ -12,11 +13,23 @@ const AgentStatus = () => {
             const res = await fetch('/api/agents');
             const data = await res.json();
             setAgents(data);
+            const scheduleRes = await fetch('/api/agents/schedule');
+            const scheduleData = await scheduleRes.json();
+            setSchedules(Object.fromEntries(scheduleData.map(s => [s.agent_id, s])));
         } catch (e) {
             console.error("Failed to fetch agents", e);
         }
     };
 
+    const scheduleText = (schedule) => {
+        if (!schedule) return "-";
+        if (schedule.state === 'disabled') return "Off";
+        if (schedule.state === 'scanning') return "Scanning now";
+        if (schedule.state === 'waiting_window') return `Next window (${schedule.effective_window})`;
+        if (schedule.state === 'due' || schedule.state === 'offline') return "Due";
+        return new Date(schedule.next_due_at + 'Z').toLocaleString();
+    };
+
     useEffect(() => {
         fetchAgents();
         const interval = setInterval(fetchAgents, 5000); // Refresh every 5s
@@ -95,6 +108,14 @@ const AgentStatus = () => {
                                 </span>
                             </div>
 
+                            <div className="flex items-center gap-2 text-slate-400 text-sm">
+                                <CalendarClock size={14} />
+                                <span>Next Scan:</span>
+                                <span className="text-slate-200" title={schedules[agent.id]?.last_error || ''}>
+                                    {scheduleText(schedules[agent.id])}
+                                </span>
+                            </div>
+
                             <div className="flex items-center gap-2 text-slate-400 text-sm">
                                 <Zap size={14} />
                                 <span>Version:</span>
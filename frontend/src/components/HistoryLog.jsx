@@ -36,10 +36,17 @@ const HistoryLog = () => {
         try {
             const res = await fetch(`/api/history/${selectedAction.id}/rollback`, { method: 'POST' });
             if (!res.ok) throw new Error("Rollback request failed");
+            const data = await res.json();
 
             setSelectedAction(null);
             setConfirmCheck(false);
-            addToast("Rollback initiated successfully.", "success");
+            if (data.status === 'rolled_back') {
+                addToast("Rollback completed successfully.", "success");
+            } else if (data.status === 'rollback_partial') {
+                addToast(`Rollback incomplete: ${data.failed.length} step(s) failed. Undo again to resume.`, "error");
+            } else {
+                addToast("Rollback failed: " + (data.error || data.status), "error");
+            }
             fetchHistory(); // Refresh
         } catch (e) {
             addToast("Rollback failed: " + e.message, "error");
@@ -85,6 +92,11 @@ const HistoryLog = () => {
                                             <RotateCcw size={12} /> Rolled Back
                                         </span>
                                     )}
+                                    {(action.status === 'rolling_back' || action.status === 'rollback_partial') && (
+                                        <span className="flex items-center gap-1 text-yellow-400 text-xs px-2 py-1 bg-yellow-950/30 rounded-full w-fit">
+                                            <AlertTriangle size={12} /> {action.status === 'rolling_back' ? 'Rolling Back' : 'Partially Rolled Back'}
+                                        </span>
+                                    )}
                                     {action.status === 'pending' && (
                                         <span className="flex items-center gap-1 text-blue-400 text-xs px-2 py-1 bg-blue-950/30 rounded-full w-fit">
                                             <Clock size={12} /> Pending
@@ -92,12 +104,12 @@ const HistoryLog = () => {
                                     )}
                                 </td>
                                 <td className="p-4 text-right">
-                                    {action.status === 'success' && (
+                                    {['success', 'rolling_back', 'rollback_partial'].includes(action.status) && (
                                         <button
                                             onClick={() => setSelectedAction(action)}
                                             className="bg-red-500/10 hover:bg-red-500/20 text-red-500 hover:text-red-400 border border-red-500/20 px-3 py-1.5 rounded-lg text-sm transition-all flex items-center gap-2 ml-auto"
                                         >
-                                            <RotateCcw size={14} /> Undo
+                                            <RotateCcw size={14} /> {action.status === 'success' ? 'Undo' : 'Resume Undo'}
                                         </button>
                                     )}
                                 </td>
@@ -6,6 +6,7 @@ const SmartInput = () => {
     const [text, setText] = useState("");
     const [treeData, setTreeData] = useState([]);
     const [isLoading, setIsLoading] = useState(false);
+    const [onlyMissing, setOnlyMissing] = useState(false);
     const { addToast } = useToast();
 
     // Mock Parser Logic
@@ -140,10 +141,11 @@ const SmartInput = () => {
         try {
             // 1. Validate Structure
             addToast("Validating structure with agents...", "info");
+            const mode = onlyMissing ? 'diff' : 'full';
             const valResponse = await fetch('/api/execute/validate', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ tree: treeData })
+                body: JSON.stringify({ tree: treeData, mode })
             });
             const valData = await valResponse.json();
 
@@ -159,12 +161,16 @@ const SmartInput = () => {
             const response = await fetch('/api/execute', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ tree: treeData })
+                body: JSON.stringify({ tree: treeData, mode })
             });
             const res = await response.json();
 
             if (res.status === 'success') {
                 addToast(`Provisioning ID #${res.id} Initiated Successfully!`, 'success');
+                if (res.skipped) {
+                    const skippedCount = res.skipped.folders.length + res.skipped.groups.length;
+                    addToast(`${skippedCount} existing items skipped`, 'info');
+                }
                 setTreeData([]);
                 setText("");
             } else {
@@ -233,6 +239,15 @@ const SmartInput = () => {
                 </div>
 
                 <div className="p-4 border-t border-slate-800 bg-slate-900/50 flex justify-end gap-3">
+                    <label className="mr-auto flex items-center gap-2 text-sm text-slate-400" title="Skip folders and groups already recorded in inventory">
+                        <input
+                            type="checkbox"
+                            checked={onlyMissing}
+                            onChange={(e) => setOnlyMissing(e.target.checked)}
+                            disabled={isLoading}
+                        />
+                        Only missing items
+                    </label>
                     <button
                         className="px-4 py-2 text-slate-400 hover:text-white hover:bg-slate-800 rounded-lg transition-colors text-sm font-medium"
                         onClick={() => { setTreeData([]); setText(""); }}
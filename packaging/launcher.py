@@ -23,34 +23,44 @@ if getattr(sys, 'frozen', False):
     if backend_path not in sys.path:
         sys.path.insert(0, backend_path)
 
+URL = "http://localhost:8000"
+
+def open_browser_when_ready(server, timeout=120):
+    """Open the dashboard as soon as uvicorn reports it is serving."""
+    import time
+    import webbrowser
+
+    deadline = time.monotonic() + timeout
+    while not server.started and not server.should_exit and time.monotonic() < deadline:
+        time.sleep(0.05)
+    if server.started:
+        webbrowser.open(URL)
+
 def main():
     try:
-        import uvicorn
-        import webbrowser
-        import threading
-        import time
-        
-        # Import the app
-        from backend.main import app
-        
-        def open_browser():
-            time.sleep(2)
-            webbrowser.open("http://localhost:8000")
-        
-        # Start browser thread
-        threading.Thread(target=open_browser, daemon=True).start()
-        
-        # Run server
+        # Banner first so the window isn't blank while the app imports
         print("=" * 50)
         print("  PermitFlow Server v2.0")
         print("  Publisher: Murat Birinci Tech Labs")
         print("=" * 50)
         print(f"\nWorking Dir: {os.getcwd()}")
         print(f"Executable: {sys.executable if getattr(sys, 'frozen', False) else 'Python'}")
-        print("\nStarting server on http://localhost:8000")
+        print(f"\nStarting server on {URL}")
         print("Press Ctrl+C to stop\n")
+
+        import threading
+        import uvicorn
+        
+        # Import the app
+        from backend.main import app
+        
+        config = uvicorn.Config(app, host="0.0.0.0", port=8000)
+        server = uvicorn.Server(config)
+
+        # Browser opens once the server is actually accepting requests
+        threading.Thread(target=open_browser_when_ready, args=(server,), daemon=True).start()
         
-        uvicorn.run(app, host="0.0.0.0", port=8000)
+        server.run()
         
     except Exception as e:
         print(f"\n{'='*50}")
@@ -0,0 +1,81 @@
+"""Log record handling shared by the master (backend/logging_config.py) and the agent.
+
+Stdlib only: the agent is packaged on its own and imports this next to its
+own modules.
+
+JsonFormatter writes one JSON object per line with any extra= fields.
+SamplingFilter lets at most `burst` records per sample_key through per
+`window` seconds; the next one that gets through carries `suppressed`.
+DroppingQueueHandler never blocks the caller: when the listener falls behind,
+records are dropped and counted.
+"""
+from logging.handlers import QueueHandler
+import json
+import logging
+import queue
+import threading
+import time
+
+SAMPLE_WINDOW = 1.0
+SAMPLE_BURST = 10
+
+# Attributes every LogRecord has; anything else came in through extra=
+STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sample_key"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Token-bucket per sample_key; records without one always pass."""
+
+    def __init__(self, window: float = SAMPLE_WINDOW, burst: int = SAMPLE_BURST):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self._buckets = {} # key -> [window_start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, "sample_key", None)
+        if key is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None or now - bucket[0] >= self.window:
+                suppressed = bucket[2] if bucket else 0
+                self._buckets[key] = [now, 1, 0]
+            elif bucket[1] < self.burst:
+                bucket[1] += 1
+                suppressed = 0
+            else:
+                bucket[2] += 1
+                return False
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: when the listener falls behind, records are dropped and counted."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
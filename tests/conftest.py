@@ -0,0 +1,115 @@
+"""Shared fixtures.
+
+The backend picks its SQLite files (under the user's app data dir) at import
+time, so HOME / APPDATA point at a scratch directory before anything imports
+it. Every test starts from empty tables.
+
+Run from the repo root:  python -m pytest tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = tempfile.mkdtemp(prefix="permitflow-tests-")
+os.environ["HOME"] = DATA_DIR
+os.environ["APPDATA"] = DATA_DIR
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from backend.database import Base, SessionLocal, engine, init_db
+from backend.services import app_settings
+from backend.services.ad_service import ADService
+from backend.services.result_cache import cache as result_cache
+from backend.websocket_manager import manager
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    init_db()
+    yield
+    engine.dispose()
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+@pytest.fixture
+def db():
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    app_settings.invalidate()
+    result_cache.clear()
+    session = SessionLocal()
+    yield session
+    session.close()
+
+class FakeAgent:
+    """Answers create_folder / delete_folders like agent.py, against an in-memory set of directories."""
+
+    def __init__(self, existing=()):
+        self.dirs = set(existing)
+        self.commands = [] # (agent_id, message) in the order received
+        self.undeletable = set() # paths whose rmdir fails (e.g. users put files in them)
+
+    def sent(self, cmd_type):
+        return [(agent_id, m) for agent_id, m in self.commands if m["type"] == cmd_type]
+
+    async def send_command(self, agent_id, message, timeout=10.0):
+        self.commands.append((agent_id, message))
+        key = (agent_id, message.get("path"))
+        if message["type"] == "create_folder":
+            if key in self.dirs:
+                return {"result": {"status": "ignored", "message": "Already exists"}}
+            self.dirs.add(key)
+            return {"result": {"status": "success", "message": f"Created {key[1]}"}}
+        if message["type"] == "delete_folders":
+            results = {}
+            for path in message["paths"]:
+                if (agent_id, path) not in self.dirs:
+                    results[path] = {"status": "missing"}
+                elif path in self.undeletable:
+                    results[path] = {"status": "error", "error": "The directory is not empty"}
+                else:
+                    self.dirs.discard((agent_id, path))
+                    results[path] = {"status": "deleted"}
+            return {"result": {"status": "success", "results": results}}
+        return {"result": {"status": "unknown_command"}}
+
+@pytest.fixture
+def agents(monkeypatch):
+    """Connect FakeAgent-backed agents: agents("FS01", "FS02") -> the shared FakeAgent."""
+    fake = FakeAgent()
+
+    def connect(*agent_ids):
+        for agent_id in agent_ids:
+            monkeypatch.setitem(manager.active_connections, agent_id, object())
+        return fake
+
+    monkeypatch.setattr(manager, "send_command", fake.send_command)
+    return connect
+
+class FakeAD:
+    """Mock-mode AD that remembers what exists, so create_group can fail like a real DC."""
+
+    def __init__(self):
+        self.groups = set()
+        self.deleted = []
+
+    def create_group(self, name, description=""):
+        if name in self.groups:
+            return False # sAMAccountName already taken
+        self.groups.add(name)
+        return True
+
+    def delete_groups(self, names):
+        self.deleted.extend(names)
+        self.groups.difference_update(names)
+        return {name: None for name in names}
+
+@pytest.fixture
+def ad(monkeypatch):
+    fake = FakeAD()
+    monkeypatch.setattr(ADService, "create_group", lambda self, name, description="": fake.create_group(name))
+    monkeypatch.setattr(ADService, "delete_groups", lambda self, names: fake.delete_groups(names))
+    return fake
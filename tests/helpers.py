@@ -0,0 +1,19 @@
+"""Execution trees and the /execute and rollback calls the tests drive."""
+import asyncio
+
+from backend.routers.execution import ExecutionRequest, execute_structure
+from backend.services import rollback_service
+
+def server(name, *children):
+    return {"name": name, "type": "server", "children": list(children)}
+
+def folder(name, *children, groups=()):
+    return {"name": name, "type": "folder", "children": list(children), "groups": list(groups)}
+
+def provision(db, *tree, mode="full"):
+    result = asyncio.run(execute_structure(ExecutionRequest(tree=list(tree), mode=mode), db))
+    assert result["status"] == "success", result
+    return result["id"]
+
+def rollback(action_id):
+    return asyncio.run(rollback_service.rollback(action_id))
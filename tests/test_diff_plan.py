@@ -0,0 +1,90 @@
+"""compile_tree order and what diff mode skips."""
+import asyncio
+
+from backend.models import ActionLog, ADGroup, Folder
+from backend.routers.execution import ExecutionRequest, Node, execute_structure
+from backend.services.provision_service import DEFAULT_SERVER, PlanStep, compile_tree, diff_plan, server_name
+
+from helpers import folder, provision, rollback, server
+
+def plan_of(*tree):
+    return [s.to_dict() for s in compile_tree([Node(**node) for node in tree])]
+
+def steps(*items):
+    return [{"kind": kind, "target": target, "server": srv} for kind, target, srv in items]
+
+def test_compile_tree_order_and_servers():
+    plan = plan_of(
+        folder("Top"),
+        server("[FS01 | D:\\Data]", folder("A", folder("B"), groups=["G_A"]), folder("C")))
+    assert plan == steps(
+        ("folder", "Top", DEFAULT_SERVER),
+        ("folder", "A", "FS01"),
+        ("group", "G_A", None),
+        ("folder", "A\\B", "FS01"),
+        ("folder", "C", "FS01"))
+
+def test_server_name():
+    assert server_name("[FS01 | D:\\Data]") == "FS01"
+    assert server_name("[ FS10 ]") == "FS10"
+    assert server_name("FS02") == "FS02"
+
+def _seed(db, status, *rows):
+    action = ActionLog(action_type="Provision", status=status)
+    db.add(action)
+    db.flush()
+    for row in rows:
+        row.action_id = action.id
+        db.add(row)
+    db.commit()
+    return action.id
+
+def test_diff_skips_known_folders_per_server(db):
+    _seed(db, "success", Folder(path="A", server="FS01", created=True))
+    db.add(Folder(path="Scanned", server="FS01")) # from a share scan, no action
+    db.commit()
+
+    todo, skipped = diff_plan(db, [PlanStep("folder", "A", "FS01"), PlanStep("folder", "A", "FS02"),
+                                   PlanStep("folder", "Scanned", "FS01"), PlanStep("folder", "New", "FS01")])
+    assert [(s.server, s.target) for s in todo] == [("FS02", "A"), ("FS01", "New")]
+    assert [(s.server, s.target) for s in skipped] == [("FS01", "A"), ("FS01", "Scanned")]
+
+def test_diff_ignores_rows_of_removed_actions(db):
+    _seed(db, "rolled_back", Folder(path="A", server="FS01", created=True))
+    _seed(db, "failed", ADGroup(name="G_A", type="RW", created=True))
+    _seed(db, "success", ADGroup(name="G_B", type="RW", created=True))
+    row_id = db.query(ADGroup.id).filter(ADGroup.name == "G_A").scalar()
+
+    todo, skipped = diff_plan(db, [PlanStep("folder", "A", "FS01"), PlanStep("group", "G_A"), PlanStep("group", "G_B")])
+    assert [(s.kind, s.target) for s in todo] == [("folder", "A"), ("group", "G_A")]
+    assert [s.target for s in skipped] == ["G_B"]
+    # Re-creating a stale group takes over its row (names are unique)
+    assert todo[1].row_id == row_id
+
+def test_diff_skips_duplicates_within_the_plan(db):
+    todo, skipped = diff_plan(db, [PlanStep("folder", "A", "FS01"), PlanStep("group", "G"),
+                                   PlanStep("folder", "A", "FS01"), PlanStep("group", "G")])
+    assert [(s.kind, s.target) for s in todo] == [("folder", "A"), ("group", "G")]
+    assert len(skipped) == 2
+
+def test_diff_rerun_sends_nothing(db, agents, ad):
+    agent = agents("FS01")
+    tree = server("FS01", folder("A", folder("B"), groups=["G_A"]))
+    provision(db, tree)
+    agent.commands.clear()
+
+    result = asyncio.run(execute_structure(ExecutionRequest(tree=[tree], mode="diff"), db))
+    assert result["applied"] == {"folders": 0, "groups": 0}
+    assert result["skipped"] == {"folders": [{"server": "FS01", "path": "A"}, {"server": "FS01", "path": "A\\B"}],
+                                 "groups": ["G_A"]}
+    assert agent.commands == []
+
+def test_diff_after_rollback_provisions_again(db, agents, ad):
+    agent = agents("FS01")
+    tree = server("FS01", folder("A", groups=["G_A"]))
+    rollback(provision(db, tree))
+    agent.commands.clear()
+
+    provision(db, tree, mode="diff")
+    assert [m["path"] for _, m in agent.sent("create_folder")] == ["A"]
+    assert [(g.name, g.created) for g in db.query(ADGroup)] == [("G_A", True)]
@@ -0,0 +1,64 @@
+"""GCRA admission for agent WebSocket handshakes, on a fake monotonic clock."""
+import pytest
+
+from backend.models import Setting
+from backend.services import app_settings
+from backend.websocket_manager import HandshakeLimiter
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def limiter(db, monkeypatch):
+    """A HandshakeLimiter at 10/s with bursts of 5."""
+    db.add_all([Setting(key="ws_handshake_rate", value="10"), Setting(key="ws_handshake_burst", value="5")])
+    db.commit()
+    app_settings.invalidate()
+    clock = Clock()
+    monkeypatch.setattr("backend.websocket_manager.time.monotonic", clock)
+    limiter = HandshakeLimiter()
+    limiter.clock = clock
+    return limiter
+
+def test_burst_is_admitted_then_throttled(limiter):
+    assert [limiter.admit() for _ in range(5)] == [None] * 5
+    assert limiter.admit() is not None
+
+def test_throttled_agents_get_their_own_slots(limiter):
+    for _ in range(5):
+        limiter.admit()
+    waits = [limiter.admit() for _ in range(4)]
+    # Backlog ends 0.5s out; each throttled agent is spaced one interval (0.1s) after the last
+    assert waits == pytest.approx([0.6, 0.7, 0.8, 0.9])
+
+def test_admits_again_at_the_configured_rate(limiter):
+    for _ in range(5):
+        limiter.admit()
+    limiter.clock.now += 0.1
+    assert limiter.admit() is None
+    assert limiter.admit() is not None
+    limiter.clock.now += 10
+    assert [limiter.admit() for _ in range(5)] == [None] * 5
+
+def test_retry_after_is_capped(limiter):
+    for _ in range(5 + 10 * 400):
+        wait = limiter.admit()
+    assert wait == HandshakeLimiter.MAX_RETRY_AFTER
+
+def test_rate_zero_disables_the_limit(db, monkeypatch):
+    db.add(Setting(key="ws_handshake_rate", value="0"))
+    db.commit()
+    app_settings.invalidate()
+    monkeypatch.setattr("backend.websocket_manager.time.monotonic", Clock())
+    limiter = HandshakeLimiter()
+    assert all(limiter.admit() is None for _ in range(1000))
+
+def test_defaults_without_settings(db, monkeypatch):
+    monkeypatch.setattr("backend.websocket_manager.time.monotonic", Clock())
+    limiter = HandshakeLimiter()
+    assert [limiter.admit() for _ in range(100)] == [None] * 100
+    assert limiter.admit() == pytest.approx(100 / 50 + 1 / 50)
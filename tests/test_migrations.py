@@ -0,0 +1,71 @@
+"""Opening a database written by an older release upgrades it in place."""
+import pytest
+from sqlalchemy import create_engine
+
+from backend import database
+from backend.database import MIGRATIONS, SCHEMA_VERSION, Base, _ensure_schema
+from backend.models import split_path
+
+PATHS = ["D:\\Data", "D:\\Data\\Finance", "D:\\Data\\Finance\\Quality Plan", "Top", "E:\\Share\\"]
+
+def old_database(tmp_path, version):
+    """A file with the v1 folders / ad_groups tables and a few rows, at user_version `version`."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE folders (id INTEGER PRIMARY KEY, path VARCHAR, server VARCHAR, action_id INTEGER)")
+        conn.exec_driver_sql("CREATE TABLE ad_groups (id INTEGER PRIMARY KEY, name VARCHAR UNIQUE, type VARCHAR, action_id INTEGER)")
+        conn.exec_driver_sql("INSERT INTO folders (path, server, action_id) VALUES (?, 'FS01', 1)", [(p,) for p in PATHS])
+        conn.exec_driver_sql("INSERT INTO ad_groups (name, type, action_id) VALUES ('G_A', 'RW', 1)")
+        if version >= 2:
+            conn.exec_driver_sql("ALTER TABLE folders ADD COLUMN parent_path VARCHAR")
+            conn.exec_driver_sql("ALTER TABLE folders ADD COLUMN name VARCHAR")
+            conn.exec_driver_sql("ALTER TABLE folders ADD COLUMN depth INTEGER")
+            conn.exec_driver_sql("UPDATE folders SET parent_path = 'kept', name = 'kept', depth = -1")
+        conn.exec_driver_sql(f"PRAGMA user_version = {version}")
+    return engine
+
+def test_v1_folders_are_backfilled(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "MIGRATION_BATCH", 2) # several batches
+    engine = old_database(tmp_path, 1)
+    assert _ensure_schema(engine, Base.metadata, MIGRATIONS) is True
+
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql("SELECT path, parent_path, name, depth, created FROM folders ORDER BY id").fetchall()
+        groups = conn.exec_driver_sql("SELECT name, created FROM ad_groups").fetchall()
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+    assert [tuple(r[1:4]) for r in rows] == [split_path(p) for p in PATHS]
+    assert rows[2][1:4] == ("D:\\Data\\Finance", "Quality Plan", 3)
+    # Nothing recorded who made these, so rollback must never touch them
+    assert [r[4] for r in rows] == [None] * len(PATHS)
+    assert [tuple(g) for g in groups] == [("G_A", None)]
+    assert version == SCHEMA_VERSION
+    engine.dispose()
+
+def test_v3_only_gets_created_flags(tmp_path):
+    engine = old_database(tmp_path, 3)
+    _ensure_schema(engine, Base.metadata, MIGRATIONS)
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql("SELECT parent_path, depth, created FROM folders").fetchall()
+        indexes = {r[1] for r in conn.exec_driver_sql("PRAGMA index_list(folders)")}
+    assert {tuple(r) for r in rows} == {("kept", -1, None)}
+    assert "ix_folders_server_parent_name" in indexes
+    engine.dispose()
+
+@pytest.mark.parametrize("migrations", [MIGRATIONS, None])
+def test_current_version_is_left_alone(tmp_path, migrations):
+    engine = old_database(tmp_path, SCHEMA_VERSION)
+    assert _ensure_schema(engine, Base.metadata, migrations) is False
+    with engine.connect() as conn:
+        columns = {r[1] for r in conn.exec_driver_sql("PRAGMA table_info(folders)")}
+    assert "created" not in columns
+    engine.dispose()
+
+def test_fresh_file_gets_the_current_schema(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'new.db'}")
+    assert _ensure_schema(engine, Base.metadata, MIGRATIONS) is True
+    with engine.connect() as conn:
+        columns = {r[1] for r in conn.exec_driver_sql("PRAGMA table_info(folders)")}
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+    assert {"parent_path", "name", "depth", "created"} <= columns
+    assert version == SCHEMA_VERSION
+    engine.dispose()
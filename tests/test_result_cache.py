@@ -0,0 +1,116 @@
+"""Result cache entries are served only while the tables they read are unchanged."""
+from backend.database import SessionLocal
+from backend.models import Agent, Folder, Setting
+from backend.services import app_settings
+from backend.services.agent_registry import AgentRegistry
+from backend.services.result_cache import cache
+
+class Build:
+    """build() for cache.get that counts calls and returns the next body."""
+
+    def __init__(self, *bodies, during=None):
+        self.calls = 0
+        self.bodies = bodies
+        self.during = during # run inside the first build, e.g. a concurrent write
+
+    def __call__(self):
+        self.calls += 1
+        if self.during is not None and self.calls == 1:
+            self.during()
+        return self.bodies[min(self.calls, len(self.bodies)) - 1]
+
+def write_folder(path="A"):
+    session = SessionLocal()
+    try:
+        session.add(Folder(path=path, server="FS01"))
+        session.commit()
+    finally:
+        session.close()
+
+def test_hit_until_a_table_it_read_is_written(db):
+    build = Build(b"[1]", b"[2]")
+    assert cache.get("folders", {"q": "a"}, ("folders",), build) == b"[1]"
+    assert cache.get("folders", {"q": "a"}, ("folders",), build) == b"[1]"
+    assert build.calls == 1
+
+    write_folder()
+    assert cache.get("folders", {"q": "a"}, ("folders",), build) == b"[2]"
+    assert build.calls == 2
+
+def test_writes_to_other_tables_keep_the_entry(db):
+    build = Build(b"[]")
+    cache.get("groups", {}, ("ad_groups",), build)
+    write_folder()
+    cache.get("groups", {}, ("ad_groups",), build)
+    assert build.calls == 1
+
+def test_uncommitted_writes_do_not_invalidate(db):
+    build = Build(b"[]")
+    cache.get("folders", {}, ("folders",), build)
+    session = SessionLocal()
+    session.add(Folder(path="A", server="FS01"))
+    session.flush()
+    session.rollback()
+    session.close()
+    cache.get("folders", {}, ("folders",), build)
+    assert build.calls == 1
+
+def test_bulk_statements_are_tracked(db):
+    write_folder()
+    build = Build(b"[1]", b"[]")
+    cache.get("folders", {}, ("folders",), build)
+    db.query(Folder).delete()
+    db.commit()
+    assert cache.get("folders", {}, ("folders",), build) == b"[]"
+
+def test_result_built_during_a_write_is_not_stored(db):
+    build = Build(b"[old]", b"[new]", during=write_folder)
+    assert cache.get("folders", {}, ("folders",), build) == b"[old]"
+    assert cache.size()["entries"] == 0
+    assert cache.get("folders", {}, ("folders",), build) == b"[new]"
+    assert cache.get("folders", {}, ("folders",), build) == b"[new]"
+    assert build.calls == 2
+
+def test_heartbeat_flush_invalidates_agents(db):
+    registry = AgentRegistry()
+    registry.mark_online("FS01")
+    registry.flush()
+
+    def agents():
+        session = SessionLocal()
+        try:
+            return ",".join(f"{a.id}={a.status}" for a in session.query(Agent)).encode()
+        finally:
+            session.close()
+
+    assert cache.get("agents", {}, ("agents",), agents) == b"FS01=online"
+    registry.mark_offline("FS01")
+    registry.flush()
+    assert cache.get("agents", {}, ("agents",), agents) == b"FS01=offline"
+
+def test_lru_eviction_by_encoded_size(db):
+    db.add(Setting(key="result_cache_mb", value=str(900 / 1024 / 1024)))
+    db.commit()
+    app_settings.invalidate()
+    body = b"x" * 200
+    for n in range(4):
+        cache.get("e", {"n": n}, (), Build(body))
+    cache.get("e", {"n": 0}, (), Build(body)) # touch: n=1 is now least recent
+    cache.get("e", {"n": 4}, (), Build(body))
+    assert cache.size() == {"entries": 4, "bytes": 800}
+
+    rebuilt = Build(body)
+    cache.get("e", {"n": 0}, (), rebuilt)
+    assert rebuilt.calls == 0
+    cache.get("e", {"n": 1}, (), rebuilt)
+    assert rebuilt.calls == 1
+
+def test_oversized_bodies_are_not_cached(db):
+    db.add(Setting(key="result_cache_mb", value=str(1000 / 1024 / 1024)))
+    db.commit()
+    app_settings.invalidate()
+    build = Build(b"x" * 300) # above a quarter of the budget
+    cache.get("big", {}, (), build)
+    cache.get("big", {}, (), build)
+    assert build.calls == 2
+    assert cache.size()["entries"] == 0
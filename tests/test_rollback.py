@@ -0,0 +1,145 @@
+"""Provisioning records what it created; rollback undoes exactly that, children first."""
+from backend.database import SessionLocal
+from backend.models import ActionLog, ADGroup, Folder, RollbackStep
+
+from helpers import folder, provision, rollback, server
+
+def deleted_paths(agent):
+    return [(agent_id, path) for agent_id, m in agent.sent("delete_folders") for path in m["paths"]]
+
+def test_rollback_leaves_preexisting_folders_and_groups_alone(db, agents, ad):
+    agent = agents("FS01")
+    agent.dirs.add(("FS01", "D:\\Data"))
+    ad.groups.add("S_FS01_Data_R")
+
+    action_id = provision(db, server("[FS01 | D:\\Data]",
+        folder("D:\\Data", folder("Finance", groups=["S_FS01_Finance_R"]), groups=["S_FS01_Data_R"])))
+
+    rows = {f.path: f.created for f in db.query(Folder)}
+    assert rows == {"D:\\Data": False, "D:\\Data\\Finance": True}
+    # AD refused the existing name: no row, so nothing to roll back
+    assert [g.name for g in db.query(ADGroup)] == ["S_FS01_Finance_R"]
+
+    result = rollback(action_id)
+    assert result["status"] == "rolled_back"
+    assert deleted_paths(agent) == [("FS01", "D:\\Data\\Finance")]
+    assert ("FS01", "D:\\Data") in agent.dirs
+    assert ad.deleted == ["S_FS01_Finance_R"]
+    assert "S_FS01_Data_R" in ad.groups
+
+def test_rows_without_created_flag_are_never_undone(db, agents, ad):
+    # Recorded before the created flag existed (NULL), or found already there (False)
+    agent = agents("FS01")
+    action = ActionLog(action_type="Provision", status="success")
+    db.add(action)
+    db.flush()
+    db.add_all([Folder(path="D:\\Old", server="FS01", action_id=action.id, created=None),
+                Folder(path="D:\\Found", server="FS01", action_id=action.id, created=False),
+                ADGroup(name="G_OLD", type="RW", action_id=action.id, created=None)])
+    db.commit()
+
+    assert rollback(action.id)["status"] == "rolled_back"
+    assert agent.sent("delete_folders") == []
+    assert ad.deleted == []
+    assert db.query(Folder).count() == 2
+
+def test_journal_removes_children_before_parents_then_groups(db, agents, ad):
+    agents("FS01", "FS02")
+    action_id = provision(db,
+        server("FS01", folder("A", folder("B", folder("C")), groups=["G_A"])),
+        server("FS02", folder("X", folder("Y"), groups=["G_X"])))
+
+    steps = db.query(RollbackStep).filter(RollbackStep.action_id == action_id).all()
+    assert steps == [] # built on first rollback
+
+    rollback(action_id)
+    steps = (db.query(RollbackStep).filter(RollbackStep.action_id == action_id)
+               .order_by(RollbackStep.seq).all())
+    kinds = [s.kind for s in steps]
+    assert kinds == ["folder"] * 5 + ["group"] * 2
+    depths = [s.target.count("\\") for s in steps if s.kind == "folder"]
+    assert depths == sorted(depths, reverse=True)
+    assert all(s.status == "done" for s in steps)
+
+def test_folder_deletes_are_ordered_per_agent(db, agents, ad):
+    agent = agents("FS01", "FS02")
+    action_id = provision(db,
+        server("FS01", folder("A", folder("B", folder("C")))),
+        server("FS02", folder("X", folder("Y"))))
+    rollback(action_id)
+
+    by_agent = {}
+    for agent_id, path in deleted_paths(agent):
+        by_agent.setdefault(agent_id, []).append(path)
+    assert by_agent == {"FS01": ["A\\B\\C", "A\\B", "A"], "FS02": ["X\\Y", "X"]}
+
+def test_groups_kept_while_folders_remain_then_resumed(db, agents, ad):
+    agent = agents("FS01")
+    action_id = provision(db, server("FS01", folder("A", folder("B"), groups=["G_A"])))
+    agent.undeletable.add("A")
+
+    first = rollback(action_id)
+    assert first["status"] == "rollback_partial"
+    assert ad.deleted == []
+    assert {f["target"] for f in first["failed"]} == {"A", "G_A"}
+    assert ("FS01", "A\\B") not in agent.dirs
+
+    agent.undeletable.clear()
+    agent.commands.clear()
+    second = rollback(action_id)
+    assert second["status"] == "rolled_back"
+    # Only what was left: B was journalled done the first time
+    assert deleted_paths(agent) == [("FS01", "A")]
+    assert ad.deleted == ["G_A"]
+    assert db.query(Folder).count() == 0
+    assert db.query(ADGroup).count() == 0
+
+def test_offline_agent_keeps_everything(db, agents, ad, monkeypatch):
+    agent = agents("FS01")
+    action_id = provision(db, server("FS01", folder("A", groups=["G_A"])))
+    from backend.websocket_manager import manager
+    monkeypatch.delitem(manager.active_connections, "FS01")
+
+    result = rollback(action_id)
+    assert result["status"] == "rollback_partial"
+    assert agent.sent("delete_folders") == []
+    assert ad.deleted == []
+
+def test_full_mode_rerun_reuses_group_rows(db, agents, ad):
+    agent = agents("FS01")
+    tree = server("FS01", folder("A", groups=["G_A"]))
+    first = provision(db, tree)
+    ad.groups.clear() # deleted in AD behind our back: the second run really creates it
+    second = provision(db, tree)
+
+    groups = db.query(ADGroup).all()
+    assert [(g.name, g.action_id, g.created) for g in groups] == [("G_A", second, True)]
+    folders = {(f.action_id, f.created) for f in db.query(Folder)}
+    assert folders == {(first, True), (second, False)}
+    assert len(agent.sent("create_folder")) == 2
+
+def test_full_mode_rerun_with_groups_still_in_ad(db, agents, ad):
+    agents("FS01")
+    tree = server("FS01", folder("A", groups=["G_A"]))
+    first = provision(db, tree)
+    provision(db, tree)
+    assert [(g.name, g.action_id) for g in db.query(ADGroup)] == [("G_A", first)]
+
+def test_folder_rows_are_committed_before_commands_go_out(db, agents, ad, monkeypatch):
+    agent = agents("FS01")
+    seen = []
+    send = agent.send_command
+
+    async def checking_send(agent_id, message, timeout=10.0):
+        if message["type"] == "create_folder":
+            other = SessionLocal()
+            try:
+                seen.append(other.query(Folder).filter(Folder.path == message["path"]).count())
+            finally:
+                other.close()
+        return await send(agent_id, message, timeout)
+
+    from backend.websocket_manager import manager
+    monkeypatch.setattr(manager, "send_command", checking_send)
+    provision(db, server("FS01", folder("A", folder("B"))))
+    assert seen == [1, 1]
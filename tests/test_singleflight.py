@@ -0,0 +1,96 @@
+"""SingleFlight runs one call per key in flight and shares its outcome."""
+import asyncio
+
+import pytest
+
+from backend.services.singleflight import SingleFlight
+
+class Work:
+    """fn for SingleFlight.do that counts its runs and finishes when released."""
+
+    def __init__(self, result=None, error=None):
+        self.runs = 0
+        self.release = None
+        self.result, self.error = result, error
+
+    def __call__(self):
+        self.runs += 1
+        self.release = asyncio.Event()
+        return self._run(self.release)
+
+    async def _run(self, release):
+        await release.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+def test_concurrent_calls_share_one_run():
+    async def scenario():
+        group, work = SingleFlight("test"), Work(result={"ok": True})
+        callers = [asyncio.create_task(group.do("k", work)) for _ in range(5)]
+        await settle()
+        assert group.in_flight() == 1
+        work.release.set()
+        results = await asyncio.gather(*callers)
+        assert work.runs == 1
+        assert all(r is results[0] for r in results)
+        assert group.in_flight() == 0
+    asyncio.run(scenario())
+
+def test_different_keys_run_separately():
+    async def scenario():
+        group, a, b = SingleFlight("test"), Work(result="a"), Work(result="b")
+        first = asyncio.create_task(group.do("a", a))
+        second = asyncio.create_task(group.do("b", b))
+        await settle()
+        assert group.in_flight() == 2
+        a.release.set()
+        b.release.set()
+        assert await asyncio.gather(first, second) == ["a", "b"]
+        assert (a.runs, b.runs) == (1, 1)
+    asyncio.run(scenario())
+
+def test_errors_reach_every_caller():
+    async def scenario():
+        group, work = SingleFlight("test"), Work(error=ValueError("boom"))
+        callers = [asyncio.create_task(group.do("k", work)) for _ in range(3)]
+        await settle()
+        work.release.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert [type(r) for r in results] == [ValueError] * 3
+        assert work.runs == 1
+    asyncio.run(scenario())
+
+def test_key_is_free_once_finished():
+    async def scenario():
+        group, work = SingleFlight("test"), Work(result=1)
+        call = asyncio.create_task(group.do("k", work))
+        await settle()
+        work.release.set()
+        await call
+        # Nothing is cached: the next call runs again
+        call = asyncio.create_task(group.do("k", work))
+        await settle()
+        work.release.set()
+        await call
+        assert work.runs == 2
+    asyncio.run(scenario())
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    async def scenario():
+        group, work = SingleFlight("test"), Work(result="done")
+        leader = asyncio.create_task(group.do("k", work))
+        follower = asyncio.create_task(group.do("k", work))
+        await settle()
+        leader.cancel()
+        await settle()
+        work.release.set()
+        assert await follower == "done"
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert group.in_flight() == 0
+    asyncio.run(scenario())
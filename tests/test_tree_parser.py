@@ -0,0 +1,74 @@
+"""Bulk text / rows parsing builds the same plan /execute does for the equivalent tree."""
+import asyncio
+import json
+
+import pytest
+
+from backend.routers.execution import Node
+from backend.services.provision_service import compile_tree
+from backend.services.tree_parser import MAX_LINE_CHARS, TreeParseError, parse_stream
+
+from helpers import folder, server
+
+def parse(body, fmt="text", chunk_size=None):
+    data = body.encode("utf-8") if isinstance(body, str) else body
+
+    async def chunks():
+        size = chunk_size or len(data) or 1
+        for i in range(0, len(data), size):
+            yield data[i:i + size]
+
+    parser, _ = asyncio.run(parse_stream(chunks(), fmt))
+    return parser
+
+def plan(parser):
+    return [s.to_dict() for s in parser.plan]
+
+def json_plan(*tree):
+    return [s.to_dict() for s in compile_tree([Node(**node) for node in tree])]
+
+SMART_INPUT = """[FS01 | D:\\Data]
+  Finance
+    Quality Plan
+  HR
+[FS10]
+  IT
+"""
+
+def test_text_matches_execute_for_smartinput_trees():
+    # SmartInput posts the whole "[FS01 | D:\\Data]" line as the server node's name
+    expected = json_plan(
+        server("[FS01 | D:\\Data]",
+               folder("Finance", folder("Quality_Plan", groups=["S_FS01_Quality_Plan_R", "S_FS01_Quality_Plan_W"]),
+                      groups=["S_FS01_Finance_R", "S_FS01_Finance_W"]),
+               folder("HR", groups=["S_FS01_HR_R", "S_FS01_HR_W"])),
+        server("[FS10]", folder("IT", groups=["S_FS10_IT_R", "S_FS10_IT_W"])))
+    assert plan(parse(SMART_INPUT)) == expected
+    assert {s["server"] for s in expected if s["kind"] == "folder"} == {"FS01", "FS10"}
+
+def test_chunk_boundaries_do_not_matter():
+    assert plan(parse(SMART_INPUT, chunk_size=3)) == plan(parse(SMART_INPUT))
+
+def test_rows_format():
+    rows = [[0, "[FS01 | D:\\Data]", [], "server"], [1, "A", ["G_A"]], [2, "B"], [1, "C"]]
+    parser = parse("\n".join(json.dumps(r) for r in rows), "rows")
+    assert plan(parser) == json_plan(server("[FS01 | D:\\Data]", folder("A", folder("B"), groups=["G_A"]), folder("C")))
+    assert parser.roots == 1
+
+@pytest.mark.parametrize("body, fmt, line, column", [
+    ("[FS01\n  Fin<ance\n", "text", 2, 6),
+    ("[ | D:\\Data]\n", "text", 1, 1),
+    ('[0, "A"]\n[2, "B"]\n', "rows", 2, 1),
+    ('[0, "A", [], "share"]\n', "rows", 1, 1),
+    ('[0, "A"\n', "rows", 1, 8),
+    ("A\n" + "x" * (MAX_LINE_CHARS + 1) + "\n", "text", 2, MAX_LINE_CHARS + 1),
+])
+def test_errors_point_at_line_and_column(body, fmt, line, column):
+    with pytest.raises(TreeParseError) as error:
+        parse(body, fmt)
+    assert (error.value.line, error.value.column) == (line, column)
+
+def test_invalid_utf8_reports_its_line():
+    with pytest.raises(TreeParseError) as error:
+        parse(b"A\nB\n\xff\n", chunk_size=2)
+    assert error.value.line == 3